@@ -9,7 +9,11 @@ import os
 from typing import Dict, Any
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from perf import InstrumentedConnection, instrumented
+from responses import compressed, json_body
 
+@instrumented('auth')
+@compressed
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -36,11 +40,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Логин и пароль обязательны'}),
+                    'body': json_body({'error': 'Логин и пароль обязательны'}),
                     'isBase64Encoded': False
                 }
             
-            conn = psycopg2.connect(os.environ['DATABASE_URL'])
+            conn = psycopg2.connect(os.environ['DATABASE_URL'], connection_factory=InstrumentedConnection)
             cur = conn.cursor(cursor_factory=RealDictCursor)
             
             cur.execute(
@@ -56,7 +60,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 401,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Неверный логин или пароль'}),
+                    'body': json_body({'error': 'Неверный логин или пароль'}),
                     'isBase64Encoded': False
                 }
             
@@ -64,14 +68,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 403,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Пользователь уволен'}),
+                    'body': json_body({'error': 'Пользователь уволен'}),
                     'isBase64Encoded': False
                 }
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
+                'body': json_body({
                     'id': user['id'],
                     'login': user['login'],
                     'full_name': user['full_name'],
@@ -84,13 +88,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 500,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'}),
+                'body': json_body({'error': f'Ошибка сервера: {str(e)}'}),
                 'isBase64Encoded': False
             }
     
     return {
         'statusCode': 405,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Метод не поддерживается'}),
+        'body': json_body({'error': 'Метод не поддерживается'}),
         'isBase64Encoded': False
     }
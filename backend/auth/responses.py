@@ -0,0 +1,334 @@
+"""
+Business: Response body encoding shared by all functions (kept identical in every function directory)
+Args: payloads (RealDictCursor rows as they are) passed to json_body; handler wrapped with @compressed;
+      named cursors of unpaginated lists and CSV/XLSX exports; ?fields= and ?include= of list requests
+Returns: Compact UTF-8 JSON bodies with numeric quantities, gzip/brotli-compressed and base64-encoded above COMPRESS_MIN_BYTES;
+         streamed lists and exports as chunks when the server sends chunked responses
+"""
+
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import zlib
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import wraps
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+# brotli и orjson необязательны: без них отдаём gzip и кодируем стандартным json
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY if orjson is not None else 0
+STREAM_CHUNK_ROWS = int(os.environ.get('STREAM_CHUNK_ROWS', '2000'))
+FILE_CHUNK_BYTES = 64 * 1024
+# Ключ события, которым самостоятельный HTTP-сервер сообщает, что умеет отдавать тело по частям (chunked)
+STREAM_KEY = 'streamingResponse'
+
+
+def _default(value: Any) -> Any:
+    """Values the encoder has no native form for: NUMERIC as a number, dates as ISO 8601, the rest as text"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def json_body(payload: Any) -> str:
+    """Compact JSON with Cyrillic kept as UTF-8 instead of \\u escapes"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=ORJSON_OPTIONS).decode('utf-8')
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=_default)
+
+
+def sparse_fields(params: Dict[str, str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """Columns listed in ?fields= (id always first) for the SELECT list, None without the parameter.
+    Names outside allowed raise ValueError - they are pasted into SQL and must come from the whitelist"""
+    raw = params.get('fields')
+    if raw is None:
+        return None
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(unknown)}')
+    return ['id'] + [name for name in dict.fromkeys(names) if name != 'id']
+
+
+def included(params: Dict[str, str], allowed: Iterable[str]) -> Set[str]:
+    """Nested collections listed in ?include=; without it all of them, unless ?fields= asks for a narrow row"""
+    raw = params.get('include')
+    if raw is None:
+        return set() if params.get('fields') is not None else set(allowed)
+    names = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = sorted(names.difference(allowed))
+    if unknown:
+        raise ValueError(f'Неизвестные вложенные списки: {", ".join(unknown)}')
+    return names
+
+
+def accepted_encoding(event: Dict[str, Any]) -> Optional[str]:
+    headers = event.get('headers') or {}
+    accept = headers.get('accept-encoding') or headers.get('Accept-Encoding') or ''
+    accepted = set()
+    for part in accept.split(','):
+        name, _, params = part.partition(';')
+        # q=0 означает "не присылать"
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    """Compress a text body the client accepts compressed; small, binary and already encoded bodies pass through"""
+    body = response.get('body')
+    headers = response.get('headers') or {}
+    if response.get('isBase64Encoded') or not isinstance(body, str):
+        return response
+    if any(name.lower() == 'content-encoding' for name in headers):
+        return response
+
+    raw = body.encode('utf-8')
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = accepted_encoding(event)
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    return {
+        **response,
+        'headers': {**headers, 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'},
+        'body': base64.b64encode(data).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+
+def compressed(handler: Callable) -> Callable:
+    @wraps(handler)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return compress_response(event, handler(event, context))
+
+    return wrapper
+
+
+def _rows_json(rows: List[Any]) -> bytes:
+    """Rows of one fetch as comma-separated JSON values, ready to go between the array brackets"""
+    if orjson is not None:
+        return b','.join(orjson.dumps(row, default=_default, option=ORJSON_OPTIONS) for row in rows)
+    return ','.join(json_body(row) for row in rows).encode('utf-8')
+
+
+class JsonArrayEncoder:
+    """JSON array written a batch of rows at a time; rows() and end() return the next bytes, compressed if encoding is set"""
+
+    def __init__(self, encoding: Optional[str] = None):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._feed, self._finish = compressor.process, compressor.finish
+        elif encoding == 'gzip':
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._feed, self._finish = compressor.compress, compressor.flush
+        else:
+            self._feed, self._finish = (lambda data: data), (lambda: b'')
+        self._prefix = b'['
+
+    def rows(self, rows: List[Any]) -> bytes:
+        data = self._prefix + _rows_json(rows)
+        self._prefix = b','
+        return self._feed(data)
+
+    def end(self) -> bytes:
+        return self._feed(b'[]' if self._prefix == b'[' else b']') + self._finish()
+
+
+class CsvEncoder:
+    """Gzipped ';'-separated CSV with a UTF-8 BOM (Excel opens it as UTF-8), written a batch of rows at a time"""
+
+    def __init__(self, columns: List[str]):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text, delimiter=';')
+        self._text.write('\ufeff')
+        self._writer.writerow(columns)
+
+    def rows(self, rows: List[Any]) -> bytes:
+        self._writer.writerows(rows)
+        data = self._text.getvalue().encode('utf-8')
+        self._text.seek(0)
+        self._text.truncate()
+        return self._compressor.compress(data)
+
+    def end(self) -> bytes:
+        return self.rows([]) + self._compressor.flush()
+
+
+class RowStream:
+    """A named cursor's rows as bytes chunks of the encoder's format, read STREAM_CHUNK_ROWS at a time.
+    close() runs the closers (cursor, connection) once - after the last chunk, or directly if it is never iterated"""
+
+    def __init__(self, cursor: Any, closers: List[Callable[[], Any]], encoder: Any):
+        self.cursor = cursor
+        self.closers = closers
+        self.encoder = encoder
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            while True:
+                rows = self.cursor.fetchmany(STREAM_CHUNK_ROWS)
+                if not rows:
+                    break
+                chunk = self.encoder.rows(rows)
+                if chunk:
+                    yield chunk
+            yield self.encoder.end()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        closers, self.closers = self.closers, []
+        for close in closers:
+            close()
+
+
+class FileStream:
+    """Chunks of a finished temporary file; close() deletes it even if the body is never sent"""
+
+    def __init__(self, file: Any):
+        self.file = file
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            self.file.seek(0)
+            while True:
+                chunk = self.file.read(FILE_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def _base64_text(chunks: Iterable[bytes]) -> str:
+    """Body for the cloud gateway, which takes binary bodies only as one base64 string"""
+    data = bytearray()
+    for chunk in chunks:
+        data += chunk
+    encoded = base64.b64encode(data)
+    del data
+    return encoded.decode('ascii')
+
+
+def stream_response(event: Dict[str, Any], cursor: Any, closers: List[Callable[[], Any]]) -> Dict[str, Any]:
+    """200 response with the rows of an executed named cursor as a JSON array, never holding all rows at once.
+    Chunked servers get the RowStream itself; otherwise the body is assembled from the (compressed) chunks"""
+    encoding = accepted_encoding(event)
+    headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+    if encoding is not None:
+        headers.update({'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'})
+    stream = RowStream(cursor, closers, JsonArrayEncoder(encoding))
+    
+    if event.get(STREAM_KEY):
+        return {'statusCode': 200, 'headers': headers, 'body': stream, 'isBase64Encoded': False}
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': _base64_text(stream) if encoding is not None else b''.join(stream).decode('utf-8'),
+        'isBase64Encoded': encoding is not None
+    }
+
+
+def export_months(params: Dict[str, str]) -> Tuple[str, str]:
+    """First and last month (YYYY-MM) of an export: ?from= and ?to=, by default the whole ?year= or the current one.
+    ValueError unless both are real months - they go into SQL casts and the download filename"""
+    year = params.get('year') or str(datetime.now().year)
+    months = []
+    for value in (params.get('from') or f'{year}-01', params.get('to') or f'{year}-12'):
+        year_part, _, month_part = value.partition('-')
+        month_year, month = int(year_part), int(month_part)
+        if not (1 <= month_year <= 9999 and 1 <= month <= 12):
+            raise ValueError(f'month out of range: {value}')
+        months.append(f'{month_year:04d}-{month:02d}')
+    return months[0], months[1]
+
+
+def export_response(event: Dict[str, Any], conn: Any, query: str, query_params: Dict[str, Any], columns: List[str],
+                    file_format: str, filename: str, closers: List[Callable[[], Any]]) -> Dict[str, Any]:
+    """Download of the query's rows as a gzipped CSV or an XLSX, read from a server-side cursor chunk by chunk.
+    Chunked servers get the CSV straight from the cursor and the XLSX from its temporary file; the cloud
+    gateway needs the whole file as base64 text, so there the file and its base64 copy are held at once"""
+    export_cur = conn.cursor(name=f'export_{filename}')
+    export_cur.execute(query, query_params)
+    closers = [export_cur.close, *closers]
+    streaming = bool(event.get(STREAM_KEY))
+    
+    if file_format == 'xlsx':
+        # openpyxl нужен только для выгрузки, не грузим его при каждом холодном старте
+        from openpyxl import Workbook
+        
+        headers = {
+            'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            'Content-Disposition': f'attachment; filename="{filename}.xlsx"'
+        }
+        # Лист write_only и готовый zip пишутся на диск, а не в память
+        file = tempfile.TemporaryFile()
+        try:
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet(filename[:31])
+            sheet.append(columns)
+            while True:
+                rows = export_cur.fetchmany(STREAM_CHUNK_ROWS)
+                if not rows:
+                    break
+                for row in rows:
+                    sheet.append(row)
+            workbook.save(file)
+        except Exception:
+            file.close()
+            raise
+        finally:
+            for close in closers:
+                close()
+        body = FileStream(file)
+    else:
+        headers = {
+            'Content-Type': 'text/csv; charset=utf-8',
+            'Content-Encoding': 'gzip',
+            'Content-Disposition': f'attachment; filename="{filename}.csv"'
+        }
+        body = RowStream(export_cur, closers, CsvEncoder(columns))
+    
+    return {
+        'statusCode': 200,
+        'headers': {**headers, 'Access-Control-Allow-Origin': '*'},
+        'body': body if streaming else _base64_text(body),
+        'isBase64Encoded': not streaming
+    }
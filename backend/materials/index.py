@@ -6,10 +6,205 @@ Returns: Materials list or operation result
 
 import json
 import os
-from typing import Dict, Any
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from perf import InstrumentedConnection, instrumented
+from responses import compressed, included, json_body, sparse_fields, stream_response
+from stock import checkpoint_if_due, create_checkpoint, find_shortages, lock_stock
 
+# Столбцы materials для ?fields= и вложенные списки для ?include= в GET списка и материала по id
+MATERIAL_FIELDS = (
+    'id', 'name', 'size', 'color', 'quantity', 'material_type', 'image_url', 'created_at', 'updated_at',
+    'section_id', 'auto_deduct', 'manual_deduct', 'defect_tracking'
+)
+MATERIAL_INCLUDES = ('colors', 'color_inventory')
+
+# Кэш прогноза расхода в тёплом контейнере: (days, window, дата) -> (водяной знак движений, расчёт)
+_FORECAST_CACHE: Dict[Tuple[int, int, date], Tuple[tuple, Dict[str, Any]]] = {}
+
+
+def _movements_watermark(cur) -> tuple:
+    """Cheap fingerprint of all stock movement tables, changes whenever a movement is added or removed"""
+    cur.execute("""
+        SELECT 
+            (SELECT COALESCE(MAX(id), 0) FROM material_history) as history_max,
+            (SELECT COALESCE(MAX(id), 0) FROM shipments) as shipments_max,
+            (SELECT COALESCE(MAX(id), 0) FROM shipped_orders) as shipped_max,
+            (SELECT COUNT(*) FROM shipped_orders) as shipped_count,
+            (SELECT COALESCE(MAX(id), 0) FROM free_shipments) as free_max,
+            (SELECT COUNT(*) FROM free_shipments) as free_count
+    """)
+    return tuple(cur.fetchone().values())
+
+
+def _adjust_shipment_rollup(cur, shipment: Dict[str, Any]) -> None:
+    """Add one warehouse shipment to the shipment_daily_rollups ledger kept with the orders function"""
+    cur.execute("""
+        INSERT INTO shipment_daily_rollups (day, source, material_id, color_id, is_defective, shipment_count, quantity)
+        VALUES (%s::date, 'warehouse', %s, %s, false, 1, %s)
+        ON CONFLICT (day, source, material_id, (COALESCE(color_id, 0)), is_defective)
+        DO UPDATE SET 
+            shipment_count = shipment_daily_rollups.shipment_count + 1,
+            quantity = shipment_daily_rollups.quantity + EXCLUDED.quantity,
+            updated_at = NOW()
+    """, (shipment['shipped_at'], shipment['material_id'], shipment['color_id'], shipment['quantity']))
+
+
+def _consumption_stats(cur, days: int, window: int) -> Dict[str, Any]:
+    """Daily consumption per material/color over the last `days` days, reduced with NumPy in one pass"""
+    start_date = date.today() - timedelta(days=days - 1)
+    raw_cur = cur.connection.cursor()
+    # Каждый остаток считается по тем движениям, которые его уменьшили, и каждое движение - один раз:
+    # color_id = 0 - materials.quantity, цвет - material_color_inventory
+    raw_cur.execute("""
+        WITH shipped AS (
+            -- Со склада остатки уменьшаются всегда, по заявкам и свободные - только при автосписании
+            SELECT r.material_id, r.color_id, r.day as moved_at, r.quantity, r.source
+            FROM shipment_daily_rollups r
+            JOIN materials m ON m.id = r.material_id
+            WHERE NOT r.is_defective AND r.day >= %(start)s::date
+              AND (r.source = 'warehouse' OR (r.source = 'free' AND m.auto_deduct))
+            UNION ALL
+            SELECT so.material_id, so.color_id, so.shipped_at, so.quantity, 'order'
+            FROM shipped_orders so
+            JOIN orders o ON o.id = so.order_id
+            JOIN materials m ON m.id = so.material_id
+            WHERE NOT COALESCE(so.is_defective, false) AND so.shipped_at >= %(start)s::date
+              AND o.auto_deduct AND m.auto_deduct
+        )
+        SELECT material_id, COALESCE(color_id, 0) as color_id, 
+               (moved_at::date - %(start)s::date) as day_idx, SUM(quantity) as quantity
+        FROM (
+            SELECT material_id, color_id, moved_at, quantity FROM shipped WHERE color_id IS NOT NULL
+            UNION ALL
+            -- Отправка со склада уже записана в material_history вместе со списанием
+            SELECT material_id, NULL, moved_at, quantity FROM shipped WHERE source <> 'warehouse'
+            UNION ALL
+            SELECT material_id, NULL, created_at, -quantity_change
+            FROM material_history
+            WHERE quantity_change < 0 AND created_at >= %(start)s::date
+        ) movements
+        WHERE material_id IS NOT NULL
+        GROUP BY 1, 2, 3
+    """, {'start': start_date})
+    rows = raw_cur.fetchall()
+    raw_cur.close()
+    
+    if not rows:
+        return {'keys': np.empty((0, 2), dtype=np.int64), 'rate': np.empty(0), 'trend': np.empty(0), 'total': np.empty(0)}
+    
+    data = np.array(rows, dtype=float)
+    keys, key_idx = np.unique(data[:, :2].astype(np.int64), axis=0, return_inverse=True)
+    day_idx = np.clip(data[:, 2].astype(np.int64), 0, days - 1)
+    
+    series = np.zeros((len(keys), days))
+    np.add.at(series, (key_idx.ravel(), day_idx), data[:, 3])
+    
+    # Средний расход за последние `window` дней и наклон линейного тренда по всему периоду
+    rate = series[:, -window:].mean(axis=1)
+    x = np.arange(days, dtype=float)
+    x -= x.mean()
+    trend = series @ x / (x @ x)
+    
+    return {'keys': keys, 'rate': rate, 'trend': trend, 'total': series.sum(axis=1)}
+
+
+def _stockout_forecast(cur, days: int, window: int) -> List[Dict[str, Any]]:
+    cache_key = (days, window, date.today())
+    watermark = _movements_watermark(cur)
+    cached = _FORECAST_CACHE.get(cache_key)
+    
+    if cached and cached[0] == watermark:
+        stats = cached[1]
+    else:
+        stats = _consumption_stats(cur, days, window)
+        _FORECAST_CACHE.clear()
+        _FORECAST_CACHE[cache_key] = (watermark, stats)
+    
+    cur.execute("SELECT id, name, quantity FROM materials")
+    materials = {row['id']: row for row in cur.fetchall()}
+    cur.execute("SELECT id, name FROM colors")
+    colors = {row['id']: row['name'] for row in cur.fetchall()}
+    cur.execute("SELECT material_id, color_id, quantity FROM material_color_inventory")
+    color_stock = {(row['material_id'], row['color_id']): row['quantity'] for row in cur.fetchall()}
+    
+    result = []
+    for (material_id, color_id), rate, trend, total in zip(
+        stats['keys'].tolist(), stats['rate'].tolist(), stats['trend'].tolist(), stats['total'].tolist()
+    ):
+        material = materials.get(material_id)
+        if not material:
+            continue
+        
+        # color_id = 0 - всё, что уменьшало общий остаток материала, с ним и сравнивается
+        if color_id:
+            on_hand = float(color_stock.get((material_id, color_id), 0))
+        else:
+            on_hand = float(material['quantity'] or 0)
+        
+        days_to_stockout: Optional[float] = round(on_hand / rate, 1) if rate > 0 else None
+        result.append({
+            'material_id': material_id,
+            'material_name': material['name'],
+            'color_id': color_id or None,
+            'color_name': colors.get(color_id),
+            'on_hand': on_hand,
+            'consumed': round(total, 2),
+            'daily_rate': round(rate, 3),
+            'trend': round(trend, 4),
+            'days_to_stockout': days_to_stockout
+        })
+    
+    result.sort(key=lambda r: (r['days_to_stockout'] is None, r['days_to_stockout'] or 0))
+    return result
+
+
+def _stock_as_of(cur, at: datetime, material_id: Optional[int]) -> Optional[Dict[str, Any]]:
+    """Stock per material/color at `at` (color_id None - the material's uncolored stock):
+    nearest earlier checkpoint plus the movements after it"""
+    cur.execute(
+        """SELECT id, taken_at, includes_materials FROM inventory_checkpoints
+           WHERE taken_at <= %s::timestamp ORDER BY taken_at DESC LIMIT 1""",
+        (at,)
+    )
+    checkpoint = cur.fetchone()
+    if not checkpoint:
+        return None
+    
+    material_filter = "WHERE s.material_id = %s" if material_id else ""
+    cur.execute(f"""
+        SELECT s.material_id, m.name as material_name, s.color_id, c.name as color_name, SUM(s.quantity) as quantity
+        FROM (
+            SELECT material_id, color_id, quantity
+            FROM inventory_checkpoint_items
+            WHERE checkpoint_id = %s
+            UNION ALL
+            SELECT material_id, color_id, quantity_change
+            FROM inventory_movements
+            WHERE created_at > %s AND created_at <= %s::timestamp
+        ) s
+        JOIN materials m ON m.id = s.material_id
+        LEFT JOIN colors c ON c.id = s.color_id
+        {material_filter}
+        GROUP BY s.material_id, m.name, s.color_id, c.name
+        HAVING SUM(s.quantity) <> 0
+        ORDER BY m.name, c.name NULLS FIRST
+    """, (checkpoint['id'], checkpoint['taken_at'], at, *([material_id] if material_id else [])))
+    
+    return {
+        'at': at,
+        'checkpoint_at': checkpoint['taken_at'],
+        # Контрольные точки до V0031 не содержат общего остатка - строки без цвета тогда неполны
+        'includes_uncolored': checkpoint['includes_materials'],
+        'items': cur.fetchall()
+    }
+
+
+@instrumented('materials')
+@compressed
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -27,12 +222,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = psycopg2.connect(os.environ['DATABASE_URL'], connection_factory=InstrumentedConnection)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         params = event.get('queryStringParameters') or {}
         resource_type = params.get('type', 'material')
         
+        if method != 'GET':
+            checkpoint_if_due(conn, cur)
+        
         if method == 'GET':
             resource_id = params.get('id')
             section_id = params.get('section_id')
@@ -49,66 +247,166 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         return {
                             'statusCode': 403,
                             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                            'body': json.dumps({'error': 'Доступ запрещен'}),
+                            'body': json_body({'error': 'Доступ запрещен'}),
                             'isBase64Encoded': False
                         }
                 
                 if resource_id:
                     cur.execute("SELECT * FROM sections WHERE id = %s", (resource_id,))
-                    result = dict(cur.fetchone()) if cur.rowcount > 0 else None
+                    result = cur.fetchone() if cur.rowcount > 0 else None
                 else:
                     cur.execute("SELECT * FROM sections ORDER BY id")
-                    result = [dict(row) for row in cur.fetchall()]
+                    result = cur.fetchall()
+            
+            elif resource_type == 'stock_as_of':
+                try:
+                    at = datetime.fromisoformat(params['at'])
+                    material_id = int(params['material_id']) if params.get('material_id') else None
+                except (KeyError, ValueError):
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': 'Укажите дату (at) в формате ГГГГ-ММ-ДД[ ЧЧ:ММ] и числовой material_id'}),
+                        'isBase64Encoded': False
+                    }
+                
+                # Чтение ничего не пишет (работает и в снимке READ ONLY пакета): контрольные точки
+                # снимают запросы, меняющие остатки (checkpoint_if_due), и POST ?type=checkpoint
+                result = _stock_as_of(cur, at, material_id)
+                if result is None:
+                    cur.execute("SELECT MIN(taken_at) as taken_at FROM inventory_checkpoints")
+                    first = cur.fetchone()['taken_at']
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': f'История остатков доступна с {first}'}),
+                        'isBase64Encoded': False
+                    }
+            
+            elif resource_type == 'forecast':
+                try:
+                    days = max(int(params.get('days', 365)), 1)
+                    window = min(max(int(params.get('window', 30)), 1), days)
+                except ValueError:
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': 'days и window должны быть целыми числами'}),
+                        'isBase64Encoded': False
+                    }
+                result = _stockout_forecast(cur, days, window)
+            
+            elif resource_type == 'history':
+                # Журнал движений растёт без ограничений - отдаём его серверным курсором порциями
+                try:
+                    material_id = int(params['material_id']) if params.get('material_id') else None
+                except ValueError:
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': 'material_id должен быть целым числом'}),
+                        'isBase64Encoded': False
+                    }
+                
+                stream_cur = conn.cursor(name='material_history', cursor_factory=RealDictCursor)
+                stream_cur.execute("""
+                    SELECT 
+                        h.id, h.material_id, m.name as material_name, h.order_item_id,
+                        h.user_id, u.full_name as user_name,
+                        h.quantity_change, h.action_type, h.comment, h.created_at
+                    FROM material_history h
+                    JOIN materials m ON m.id = h.material_id
+                    LEFT JOIN users u ON u.id = h.user_id
+                    WHERE %(material_id)s::int IS NULL OR h.material_id = %(material_id)s::int
+                    ORDER BY h.created_at DESC, h.id DESC
+                """, {'material_id': material_id})
+                cur.close()
+                return stream_response(event, stream_cur, [stream_cur.close, conn.close])
             
             elif resource_type == 'color':
                 if resource_id:
                     cur.execute("SELECT * FROM colors WHERE id = %s", (resource_id,))
-                    result = dict(cur.fetchone()) if cur.rowcount > 0 else None
+                    result = cur.fetchone() if cur.rowcount > 0 else None
                 else:
                     cur.execute("SELECT * FROM colors ORDER BY id")
-                    result = [dict(row) for row in cur.fetchall()]
+                    result = cur.fetchall()
             
             else:
+                # Выпадающим спискам хватает id и name без цветов: ?fields=id,name&include=
+                try:
+                    fields = sparse_fields(params, MATERIAL_FIELDS)
+                    include = included(params, MATERIAL_INCLUDES)
+                except ValueError as e:
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': str(e)}),
+                        'isBase64Encoded': False
+                    }
+                columns = ', '.join(fields) if fields else '*'
+                
                 if resource_id:
-                    cur.execute("SELECT * FROM materials WHERE id = %s", (resource_id,))
+                    cur.execute(f"SELECT {columns} FROM materials WHERE id = %s", (resource_id,))
                     material = cur.fetchone()
-                    if material:
-                        mat_dict = dict(material)
+                    if material and 'colors' in include:
                         cur.execute(
                             "SELECT c.* FROM colors c JOIN material_colors mc ON c.id = mc.color_id WHERE mc.material_id = %s",
                             (resource_id,)
                         )
-                        mat_dict['colors'] = [dict(row) for row in cur.fetchall()]
-                        result = mat_dict
-                    else:
-                        result = None
+                        material['colors'] = cur.fetchall()
+                    result = material
                 else:
-                    query = "SELECT * FROM materials"
+                    query = f"SELECT {columns} FROM materials"
                     if section_id:
                         cur.execute(f"{query} WHERE section_id = %s ORDER BY id", (section_id,))
                     else:
                         cur.execute(f"{query} ORDER BY id")
                     
                     materials = cur.fetchall()
-                    result = []
-                    for mat in materials:
-                        mat_dict = dict(mat)
+                    material_ids = [mat['id'] for mat in materials]
+                    
+                    # Цвета и остатки по цветам для всех материалов - по одному запросу, если они нужны;
+                    # строки курсора дополняются на месте и сериализуются без копий
+                    if 'colors' in include:
                         cur.execute(
-                            "SELECT c.* FROM colors c JOIN material_colors mc ON c.id = mc.color_id WHERE mc.material_id = %s",
-                            (mat['id'],)
+                            """SELECT mc.material_id, c.*
+                               FROM colors c JOIN material_colors mc ON c.id = mc.color_id
+                               WHERE mc.material_id = ANY(%s)
+                               ORDER BY mc.id""",
+                            (material_ids,)
                         )
-                        mat_dict['colors'] = [dict(row) for row in cur.fetchall()]
-                        
+                        colors_by_material = {}
+                        for color in cur.fetchall():
+                            colors_by_material.setdefault(color.pop('material_id'), []).append(color)
+                        for mat in materials:
+                            mat['colors'] = colors_by_material.get(mat['id'], [])
+                    
+                    if 'color_inventory' in include:
                         cur.execute(
-                            """SELECT mci.color_id, mci.quantity, c.name as color_name, c.hex_code
+                            """SELECT mci.material_id, mci.color_id, mci.quantity, c.name as color_name, c.hex_code
                                FROM material_color_inventory mci
                                JOIN colors c ON c.id = mci.color_id
-                               WHERE mci.material_id = %s AND mci.quantity > 0
-                               ORDER BY c.name""",
-                            (mat['id'],)
+                               WHERE mci.material_id = ANY(%s) AND mci.quantity > 0
+                               ORDER BY mci.material_id, c.name""",
+                            (material_ids,)
                         )
-                        mat_dict['color_inventory'] = [dict(row) for row in cur.fetchall()]
-                        result.append(mat_dict)
+                        inventory_by_material = {}
+                        for stock in cur.fetchall():
+                            inventory_by_material.setdefault(stock.pop('material_id'), []).append(stock)
+                        for mat in materials:
+                            mat['color_inventory'] = inventory_by_material.get(mat['id'], [])
+                    
+                    result = materials
             
             cur.close()
             conn.close()
@@ -116,7 +414,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, default=str),
+                'body': json_body(result),
                 'isBase64Encoded': False
             }
         
@@ -135,7 +433,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         return {
                             'statusCode': 403,
                             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                            'body': json.dumps({'error': 'Доступ запрещен'}),
+                            'body': json_body({'error': 'Доступ запрещен'}),
                             'isBase64Encoded': False
                         }
             
@@ -146,12 +444,31 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Название обязательно'}),
+                        'body': json_body({'error': 'Название обязательно'}),
                         'isBase64Encoded': False
                     }
                 
                 cur.execute("INSERT INTO sections (name, parent_id) VALUES (%s, %s) RETURNING *", (name, parent_id))
-                result = dict(cur.fetchone())
+                result = cur.fetchone()
+                conn.commit()
+            
+            elif resource_type == 'checkpoint':
+                # SHARE-блокировка останавливает все списания - только администратору или руководителю
+                user_row = None
+                if user_id:
+                    cur.execute("SELECT role FROM users WHERE id = %s", (user_id,))
+                    user_row = cur.fetchone()
+                if not user_row or user_row['role'] not in ['admin', 'supervisor']:
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 403,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': 'Доступ запрещен'}),
+                        'isBase64Encoded': False
+                    }
+                
+                result = create_checkpoint(cur)
                 conn.commit()
             
             elif resource_type == 'color':
@@ -162,12 +479,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Название обязательно'}),
+                        'body': json_body({'error': 'Название обязательно'}),
                         'isBase64Encoded': False
                     }
                 
                 cur.execute("INSERT INTO colors (name, hex_code) VALUES (%s, %s) RETURNING *", (name, hex_code))
-                result = dict(cur.fetchone())
+                result = cur.fetchone()
                 conn.commit()
             
             else:
@@ -184,7 +501,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Название обязательно'}),
+                        'body': json_body({'error': 'Название обязательно'}),
                         'isBase64Encoded': False
                     }
                 
@@ -203,7 +520,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     )
                 
                 conn.commit()
-                result = dict(material)
+                result = material
             
             cur.close()
             conn.close()
@@ -211,7 +528,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 201,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, default=str),
+                'body': json_body(result),
                 'isBase64Encoded': False
             }
         
@@ -224,7 +541,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'ID обязателен'}),
+                    'body': json_body({'error': 'ID обязателен'}),
                     'isBase64Encoded': False
                 }
             
@@ -239,7 +556,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         return {
                             'statusCode': 403,
                             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                            'body': json.dumps({'error': 'Доступ запрещен'}),
+                            'body': json_body({'error': 'Доступ запрещен'}),
                             'isBase64Encoded': False
                         }
             
@@ -261,7 +578,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 if updates:
                     values.append(resource_id)
                     cur.execute(f"UPDATE sections SET {', '.join(updates)} WHERE id = %s RETURNING *", values)
-                    result = dict(cur.fetchone()) if cur.rowcount > 0 else None
+                    result = cur.fetchone() if cur.rowcount > 0 else None
                     conn.commit()
                 else:
                     result = {'error': 'Нет данных для обновления'}
@@ -279,7 +596,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 if updates:
                     values.append(resource_id)
                     cur.execute(f"UPDATE colors SET {', '.join(updates)} WHERE id = %s RETURNING *", values)
-                    result = dict(cur.fetchone()) if cur.rowcount > 0 else None
+                    result = cur.fetchone() if cur.rowcount > 0 else None
                     conn.commit()
                 else:
                     result = {'error': 'Нет данных для обновления'}
@@ -294,6 +611,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         values.append(body_data[field])
                 
                 if 'quantity_change' in body_data:
+                    color_id = body_data.get('color_id')
+                    quantity_change = body_data['quantity_change']
+                    
+                    if color_id and quantity_change < 0:
+                        shortages = find_shortages(cur, [{'material_id': resource_id, 'color_id': color_id, 'quantity': -quantity_change}], False)
+                        if shortages:
+                            cur.close()
+                            conn.close()
+                            return {
+                                'statusCode': 409,
+                                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                                'body': json_body({'error': 'Недостаточно материала на складе', 'shortages': shortages}),
+                                'isBase64Encoded': False
+                            }
+                    else:
+                        # Приход блокирует остатки в том же порядке, что отгрузки и списания, - без взаимных блокировок
+                        lock_stock(cur, [{'material_id': resource_id, 'color_id': color_id}])
+                    
                     updates.append("quantity = quantity + %s")
                     values.append(body_data['quantity_change'])
                     
@@ -307,27 +642,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     )
                     
                     if body_data.get('ship_material'):
-                        color_id = body_data.get('color_id')
                         recipient = body_data.get('recipient', '')
-                        quantity = abs(body_data['quantity_change'])
+                        quantity = abs(quantity_change)
                         
                         cur.execute(
-                            "INSERT INTO shipments (material_id, color_id, quantity, recipient, comment) VALUES (%s, %s, %s, %s, %s)",
+                            """INSERT INTO shipments (material_id, color_id, quantity, recipient, comment) VALUES (%s, %s, %s, %s, %s)
+                               RETURNING material_id, color_id, quantity, shipped_at""",
                             (resource_id, color_id, quantity, recipient, comment)
                         )
-                        
+                        _adjust_shipment_rollup(cur, cur.fetchone())
+                    
+                    # Остаток по цвету меняется один раз: и для отправки, и для ручного списания/прихода
+                    if color_id and quantity_change < 0:
                         cur.execute(
-                            """INSERT INTO material_color_inventory (material_id, color_id, quantity)
-                               VALUES (%s, %s, -%s)
-                               ON CONFLICT (material_id, color_id)
-                               DO UPDATE SET quantity = material_color_inventory.quantity - EXCLUDED.quantity""",
-                            (resource_id, color_id, quantity)
+                            """UPDATE material_color_inventory 
+                               SET quantity = quantity + %s, updated_at = NOW()
+                               WHERE material_id = %s AND color_id = %s""",
+                            (quantity_change, resource_id, color_id)
                         )
-                    
-                    if body_data.get('color_id'):
-                        color_id = body_data.get('color_id')
-                        quantity_change = body_data['quantity_change']
-                        
+                    elif color_id:
                         cur.execute(
                             """INSERT INTO material_color_inventory (material_id, color_id, quantity)
                                VALUES (%s, %s, %s)
@@ -342,7 +675,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     updates.append("updated_at = CURRENT_TIMESTAMP")
                     values.append(resource_id)
                     cur.execute(f"UPDATE materials SET {', '.join(updates)} WHERE id = %s RETURNING *", values)
-                    result = dict(cur.fetchone()) if cur.rowcount > 0 else None
+                    result = cur.fetchone() if cur.rowcount > 0 else None
                     conn.commit()
                     
                     if 'color_ids' in body_data:
@@ -359,7 +692,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, default=str),
+                'body': json_body(result),
                 'isBase64Encoded': False
             }
         
@@ -371,7 +704,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'ID не передан'}, ensure_ascii=False),
+                    'body': json_body({'error': 'ID не передан'}),
                     'isBase64Encoded': False
                 }
             
@@ -386,7 +719,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         return {
                             'statusCode': 403,
                             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                            'body': json.dumps({'error': 'Доступ запрещен'}),
+                            'body': json_body({'error': 'Доступ запрещен'}),
                             'isBase64Encoded': False
                         }
             
@@ -405,7 +738,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True}),
+                'body': json_body({'success': True}),
                 'isBase64Encoded': False
             }
         
@@ -413,13 +746,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
+            'body': json_body({'error': str(e)}),
             'isBase64Encoded': False
         }
     
     return {
         'statusCode': 405,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Метод не поддерживается'}),
+        'body': json_body({'error': 'Метод не поддерживается'}),
         'isBase64Encoded': False
     }
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Business: Stock pre-check for every write that deducts material, and the inventory checkpoints those writes keep fresh
+          (kept identical in the orders and materials directories)
+Args: cursor inside the writing transaction; lines as dicts with material_id, color_id, quantity
+Returns: Shortages per material and color, with the stock rows locked until the transaction ends
+"""
+
+import json
+import time
+from datetime import timedelta
+from typing import Any, Dict, List
+
+# Контрольная точка остатков снимается не реже раза в интервал: stock_as_of дочитывает движения не больше чем за него
+CHECKPOINT_INTERVAL = timedelta(days=1)
+
+# Тёплый контейнер не спрашивает базу, пока следующая контрольная точка заведомо не нужна
+_checkpoint_due_at = 0.0
+
+SHORTAGES_SQL = """
+    SELECT 
+        l.material_id, m.name as material_name,
+        l.color_id, c.name as color_name,
+        l.requested,
+        COALESCE(mci.quantity, 0) as available,
+        l.requested - COALESCE(mci.quantity, 0) as missing
+    FROM (
+        SELECT material_id, color_id, SUM(quantity) as requested
+        FROM json_to_recordset(%(lines)s::json) AS x(material_id INTEGER, color_id INTEGER, quantity NUMERIC)
+        GROUP BY material_id, color_id
+    ) l
+    JOIN materials m ON m.id = l.material_id AND (m.auto_deduct OR NOT %(deducting_only)s)
+    LEFT JOIN colors c ON c.id = l.color_id
+    LEFT JOIN material_color_inventory mci 
+        ON mci.material_id = l.material_id AND mci.color_id = l.color_id
+    WHERE l.requested > COALESCE(mci.quantity, 0)
+    ORDER BY m.name, c.name
+"""
+
+
+def _payload(lines: List[Dict[str, Any]]) -> str:
+    return json.dumps([
+        {'material_id': line.get('material_id'), 'color_id': line.get('color_id'), 'quantity': line.get('quantity')}
+        for line in lines
+    ])
+
+
+def validate_lines(lines: List[Dict[str, Any]]) -> None:
+    """ValueError unless every line ships a positive quantity"""
+    for line in lines:
+        try:
+            quantity = float(line.get('quantity'))
+        except (TypeError, ValueError):
+            quantity = 0
+        if not quantity > 0:
+            raise ValueError('Количество в каждой позиции должно быть больше нуля')
+
+
+def lock_stock(cur, lines: List[Dict[str, Any]]) -> None:
+    """Lock the materials rows, then their color stock rows, each in id order - the same order for every writer"""
+    payload = _payload(lines)
+    cur.execute("""
+        SELECT id FROM materials
+        WHERE id IN (SELECT material_id FROM json_to_recordset(%s::json) AS x(material_id INTEGER))
+        ORDER BY id
+        FOR UPDATE
+    """, (payload,))
+    cur.execute("""
+        SELECT id FROM material_color_inventory
+        WHERE (material_id, color_id) IN (
+            SELECT material_id, color_id FROM json_to_recordset(%s::json) AS x(material_id INTEGER, color_id INTEGER)
+        )
+        ORDER BY id
+        FOR UPDATE
+    """, (payload,))
+
+
+def find_shortages(cur, lines: List[Dict[str, Any]], deducting_only: bool) -> List[Dict[str, Any]]:
+    """Lock the stock of all lines and check them in one query, return every short line.
+    deducting_only - skip materials without auto_deduct (shipments deduct only those)"""
+    if not lines:
+        return []
+    # Параллельное списание ждёт блокировки и проверяет уже обновлённый остаток, а не падает на CHECK (quantity >= 0)
+    lock_stock(cur, lines)
+    cur.execute(SHORTAGES_SQL, {'lines': _payload(lines), 'deducting_only': deducting_only})
+    return cur.fetchall()
+
+
+def create_checkpoint(cur) -> Dict[str, Any]:
+    """Snapshot material and color stock; the SHARE locks wait for in-flight writers so no movement falls between snapshot and ledger"""
+    cur.execute("LOCK TABLE materials, material_color_inventory IN SHARE MODE")
+    cur.execute("INSERT INTO inventory_checkpoints (taken_at) VALUES (clock_timestamp()) RETURNING id, taken_at")
+    checkpoint = cur.fetchone()
+    # Общий остаток материала - строкой с color_id = NULL, как его пишет триггер журнала
+    cur.execute(
+        """INSERT INTO inventory_checkpoint_items (checkpoint_id, material_id, color_id, quantity)
+           SELECT %(id)s, material_id, color_id, quantity
+           FROM material_color_inventory
+           WHERE quantity <> 0
+           UNION ALL
+           SELECT %(id)s, id, NULL, quantity
+           FROM materials
+           WHERE COALESCE(quantity, 0) <> 0""",
+        {'id': checkpoint['id']}
+    )
+    checkpoint['items'] = cur.rowcount
+    return checkpoint
+
+
+def _checkpoint_age(cur) -> timedelta:
+    cur.execute("SELECT clock_timestamp()::timestamp - MAX(taken_at) as age FROM inventory_checkpoints")
+    age = cur.fetchone()['age']
+    return CHECKPOINT_INTERVAL if age is None else age
+
+
+def checkpoint_if_due(conn, cur) -> None:
+    """Take a checkpoint in its own transaction once the latest one is CHECKPOINT_INTERVAL old.
+    Every stock write calls this before it locks anything, so no scheduler is needed"""
+    global _checkpoint_due_at
+    if time.monotonic() < _checkpoint_due_at:
+        return
+    
+    age = _checkpoint_age(cur)
+    if age >= CHECKPOINT_INTERVAL:
+        # Точку снимает один запрос, остальные не ждут его блокировок
+        cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('inventory_checkpoint')) as locked")
+        if not cur.fetchone()['locked']:
+            conn.rollback()
+            return
+        # Повторная проверка в новом снимке: точку мог только что снять другой запрос
+        age = _checkpoint_age(cur)
+        if age >= CHECKPOINT_INTERVAL:
+            create_checkpoint(cur)
+            age = timedelta(0)
+    conn.commit()
+    _checkpoint_due_at = time.monotonic() + (CHECKPOINT_INTERVAL - age).total_seconds()
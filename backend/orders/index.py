@@ -6,11 +6,305 @@ Returns: Orders list or operation result
 
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 from datetime import datetime, timedelta
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from perf import InstrumentedConnection, instrumented
+from responses import compressed, export_months, export_response, included, json_body, sparse_fields, stream_response
+from stock import checkpoint_if_due, find_shortages, validate_lines
 
+# Столбцы orders для ?fields= и вложенные списки для ?include= в GET списка и заказа по id
+ORDER_FIELDS = (
+    'id', 'order_number', 'material', 'quantity', 'size', 'color', 'status', 'completed_quantity', 'created_by',
+    'created_at', 'updated_at', 'section_id', 'comment', 'completed_at', 'shipped_at', 'auto_deduct'
+)
+ORDER_INCLUDES = ('items',)
+
+# Выгрузки отгрузок: таблица -> (запрос, колонки)
+SHIPMENT_EXPORTS = {
+    'shipped_orders': ("""
+        SELECT so.id, o.order_number, m.name, c.name, so.quantity, so.is_defective, so.shipped_at, u.full_name, so.comment
+        FROM shipped_orders so
+        JOIN orders o ON o.id = so.order_id
+        LEFT JOIN materials m ON m.id = so.material_id
+        LEFT JOIN colors c ON c.id = so.color_id
+        LEFT JOIN users u ON u.id = so.shipped_by
+        WHERE so.shipped_at >= (%(start)s || '-01')::date
+          AND so.shipped_at < (%(end)s || '-01')::date + INTERVAL '1 month'
+        ORDER BY so.shipped_at, so.id
+    """, ['id', 'order_number', 'material', 'color', 'quantity', 'is_defective', 'shipped_at', 'shipped_by', 'comment']),
+    'free_shipments': ("""
+        SELECT fs.id, m.name, c.name, fs.quantity, fs.is_defective, fs.shipped_at, u.full_name, fs.comment
+        FROM free_shipments fs
+        LEFT JOIN materials m ON m.id = fs.material_id
+        LEFT JOIN colors c ON c.id = fs.color_id
+        LEFT JOIN users u ON u.id = fs.shipped_by
+        WHERE fs.shipped_at >= (%(start)s || '-01')::date
+          AND fs.shipped_at < (%(end)s || '-01')::date + INTERVAL '1 month'
+        ORDER BY fs.shipped_at, fs.id
+    """, ['id', 'material', 'color', 'quantity', 'is_defective', 'shipped_at', 'shipped_by', 'comment']),
+    'shipments': ("""
+        SELECT sh.id, m.name, c.name, sh.quantity, sh.recipient, sh.comment, sh.shipped_at
+        FROM shipments sh
+        LEFT JOIN materials m ON m.id = sh.material_id
+        LEFT JOIN colors c ON c.id = sh.color_id
+        WHERE sh.shipped_at >= (%(start)s || '-01')::date
+          AND sh.shipped_at < (%(end)s || '-01')::date + INTERVAL '1 month'
+        ORDER BY sh.shipped_at, sh.id
+    """, ['id', 'material', 'color', 'quantity', 'recipient', 'comment', 'shipped_at'])
+}
+
+# Сводка для главного экрана: короткий кэш в тёплом контейнере, порог "мало на складе" как в MaterialsInventory
+SUMMARY_TTL = timedelta(seconds=30)
+LOW_STOCK_THRESHOLD = 10
+_SUMMARY_CACHE: Dict[int, Tuple[datetime, Dict[str, Any]]] = {}
+
+SUMMARY_SQL = """
+    SELECT 
+        o.by_status as orders_by_status,
+        o.total as orders_total,
+        r.by_status as requests_by_status,
+        i.items_in_progress,
+        i.orders_in_progress,
+        sh.order_items as shipped_order_items_today,
+        sh.free as free_shipments_today,
+        sh.quantity as shipped_quantity_today,
+        sh.defect_count as defects_today,
+        sh.defect_quantity as defective_quantity_today,
+        sh.warehouse_quantity as warehouse_shipped_today,
+        ls.count as low_stock_count,
+        ls.materials as low_stock_materials
+    FROM (
+        SELECT COALESCE(json_object_agg(status, n), '{}'::json) as by_status, COALESCE(SUM(n), 0)::bigint as total
+        FROM (SELECT status, COUNT(*) as n FROM orders GROUP BY status) x
+    ) o
+    CROSS JOIN (
+        SELECT COALESCE(json_object_agg(status, n), '{}'::json) as by_status
+        FROM (SELECT status, COUNT(*) as n FROM requests GROUP BY status) x
+    ) r
+    CROSS JOIN (
+        SELECT 
+            COUNT(*) FILTER (WHERE COALESCE(oi.quantity_completed, 0) < oi.quantity_required) as items_in_progress,
+            COUNT(DISTINCT oi.order_id) as orders_in_progress
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE o.status = 'in_progress'
+    ) i
+    CROSS JOIN (
+        SELECT 
+            COALESCE(SUM(shipment_count) FILTER (WHERE source = 'order'), 0)::bigint as order_items,
+            COALESCE(SUM(shipment_count) FILTER (WHERE source = 'free'), 0)::bigint as free,
+            COALESCE(SUM(quantity) FILTER (WHERE source <> 'warehouse' AND NOT is_defective), 0)::bigint as quantity,
+            COALESCE(SUM(shipment_count) FILTER (WHERE source <> 'warehouse' AND is_defective), 0)::bigint as defect_count,
+            COALESCE(SUM(quantity) FILTER (WHERE source <> 'warehouse' AND is_defective), 0)::bigint as defect_quantity,
+            COALESCE(SUM(quantity) FILTER (WHERE source = 'warehouse'), 0)::bigint as warehouse_quantity
+        FROM shipment_daily_rollups
+        WHERE day = CURRENT_DATE
+    ) sh
+    CROSS JOIN (
+        SELECT 
+            COUNT(*) as count,
+            COALESCE(json_agg(json_build_object('id', id, 'name', name, 'quantity', quantity) ORDER BY quantity, name), '[]'::json) as materials
+        FROM materials
+        WHERE COALESCE(quantity, 0) < %s
+    ) ls
+"""
+
+# Отчёт по браку: измерение группировки -> (выражение в SELECT, выражение в GROUP BY)
+DEFECT_GROUPS = {
+    'material': ('d.material_id, m.name as material_name', 'd.material_id, m.name'),
+    'color': ('d.color_id, c.name as color_name', 'd.color_id, c.name'),
+    'section': ('m.section_id, sec.name as section_name', 'm.section_id, sec.name'),
+    'order': ('d.order_id, o.order_number', 'd.order_id, o.order_number'),
+    'period': ('date_trunc(%(period)s, d.shipped_at)::date as period', 'date_trunc(%(period)s, d.shipped_at)::date')
+}
+DEFECT_PERIODS = ('day', 'week', 'month')
+
+# Строки отчёта: по заявкам - из сырых отгрузок, иначе из дневных итогов shipment_daily_rollups
+DEFECT_ROWS_SQL = """
+    SELECT so.order_id, so.material_id, so.color_id, so.quantity, COALESCE(so.is_defective, false) as is_defective, 
+           so.shipped_at, 1 as shipment_count
+    FROM shipped_orders so
+    WHERE so.shipped_at >= %(start)s::timestamp AND so.shipped_at < %(end)s::timestamp
+    UNION ALL
+    SELECT NULL, fs.material_id, fs.color_id, fs.quantity, COALESCE(fs.is_defective, false), fs.shipped_at, 1
+    FROM free_shipments fs
+    WHERE fs.shipped_at >= %(start)s::timestamp AND fs.shipped_at < %(end)s::timestamp
+"""
+
+DEFECT_ROLLUP_ROWS_SQL = """
+    SELECT NULL::integer as order_id, material_id, color_id, quantity, is_defective, day as shipped_at, shipment_count
+    FROM shipment_daily_rollups
+    WHERE source IN ('order', 'free') AND day >= %(start)s::date AND day < %(end)s::date
+"""
+
+DEFECT_ITEMS_SQL = """
+    SELECT
+        d.id, d.source, d.order_id, o.order_number,
+        d.material_id, m.name as material_name, d.color_id, c.name as color_name,
+        d.quantity, d.shipped_at
+    FROM (
+        SELECT so.id, 'order' as source, so.order_id, so.material_id, so.color_id, so.quantity, so.shipped_at
+        FROM shipped_orders so
+        WHERE so.is_defective = true AND so.shipped_at >= %(start)s::timestamp AND so.shipped_at < %(end)s::timestamp
+        UNION ALL
+        SELECT fs.id, 'free', NULL, fs.material_id, fs.color_id, fs.quantity, fs.shipped_at
+        FROM free_shipments fs
+        WHERE fs.is_defective = true AND fs.shipped_at >= %(start)s::timestamp AND fs.shipped_at < %(end)s::timestamp
+    ) d
+    LEFT JOIN orders o ON o.id = d.order_id
+    LEFT JOIN materials m ON m.id = d.material_id
+    LEFT JOIN colors c ON c.id = d.color_id
+    ORDER BY d.shipped_at DESC, d.id DESC
+"""
+
+RESERVATIONS_SQL = """
+    SELECT oi.material_id, oi.color_id, SUM(oi.quantity_required) as reserved_quantity
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+    WHERE o.status <> 'shipped' AND oi.material_id IS NOT NULL
+    GROUP BY oi.material_id, oi.color_id
+"""
+
+# Дневные итоги отгрузок из сырых таблиц - для пересборки shipment_daily_rollups
+SHIPMENT_ROLLUPS_SQL = """
+    SELECT shipped_at::date as day, source, material_id, color_id, is_defective, 
+           COUNT(*) as shipment_count, SUM(quantity) as quantity
+    FROM (
+        SELECT 'order' as source, material_id, color_id, quantity, COALESCE(is_defective, false) as is_defective, shipped_at
+        FROM shipped_orders
+        UNION ALL
+        SELECT 'free', material_id, color_id, quantity, COALESCE(is_defective, false), shipped_at
+        FROM free_shipments
+        UNION ALL
+        SELECT 'warehouse', material_id, color_id, quantity, false, shipped_at
+        FROM shipments
+    ) s
+    WHERE shipped_at IS NOT NULL
+    GROUP BY shipped_at::date, source, material_id, color_id, is_defective
+"""
+
+
+def _adjust_shipment_rollup(cur, source: str, shipment: Dict[str, Any], sign: int) -> None:
+    """Add (sign=1) or remove (sign=-1) one shipment row in the shipment_daily_rollups ledger"""
+    if not shipment or shipment['shipped_at'] is None:
+        return
+    cur.execute("""
+        INSERT INTO shipment_daily_rollups (day, source, material_id, color_id, is_defective, shipment_count, quantity)
+        VALUES (%s::date, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (day, source, material_id, (COALESCE(color_id, 0)), is_defective)
+        DO UPDATE SET 
+            shipment_count = shipment_daily_rollups.shipment_count + EXCLUDED.shipment_count,
+            quantity = shipment_daily_rollups.quantity + EXCLUDED.quantity,
+            updated_at = NOW()
+    """, (shipment['shipped_at'], source, shipment['material_id'], shipment['color_id'],
+          bool(shipment['is_defective']), sign, sign * shipment['quantity']))
+    if sign < 0:
+        # Опустевшая строка не должна мешать удалению материала или цвета
+        cur.execute("""
+            DELETE FROM shipment_daily_rollups 
+            WHERE day = %s::date AND source = %s AND material_id = %s AND COALESCE(color_id, 0) = COALESCE(%s, 0)
+              AND is_defective = %s AND shipment_count = 0
+        """, (shipment['shipped_at'], source, shipment['material_id'], shipment['color_id'], bool(shipment['is_defective'])))
+
+
+def _adjust_reservations(cur, order_id: int, sign: int) -> None:
+    """Add (sign=1) or release (sign=-1) the order's items in the material_reservations ledger"""
+    cur.execute("""
+        INSERT INTO material_reservations (material_id, color_id, reserved_quantity)
+        SELECT material_id, color_id, %s * SUM(quantity_required)
+        FROM order_items
+        WHERE order_id = %s AND material_id IS NOT NULL
+        GROUP BY material_id, color_id
+        ON CONFLICT (material_id, (COALESCE(color_id, 0)))
+        DO UPDATE SET 
+            reserved_quantity = material_reservations.reserved_quantity + EXCLUDED.reserved_quantity,
+            updated_at = NOW()
+    """, (sign, order_id))
+    if sign < 0:
+        # Снятый до нуля резерв удаляем, чтобы журнал не рос и не попадал в отчёт о доступности
+        cur.execute("""
+            DELETE FROM material_reservations
+            WHERE reserved_quantity = 0
+              AND (material_id, COALESCE(color_id, 0)) IN (
+                  SELECT material_id, COALESCE(color_id, 0) FROM order_items
+                  WHERE order_id = %s AND material_id IS NOT NULL
+              )
+        """, (order_id,))
+
+
+def _dashboard_summary(cur, low_stock: int) -> Dict[str, Any]:
+    """Counts for the landing screen from one statement, reused for SUMMARY_TTL"""
+    now = datetime.now()
+    cached = _SUMMARY_CACHE.get(low_stock)
+    if cached and now - cached[0] < SUMMARY_TTL:
+        return cached[1]
+    
+    cur.execute(SUMMARY_SQL, (low_stock,))
+    summary = cur.fetchone()
+    summary['low_stock_threshold'] = low_stock
+    summary['generated_at'] = now
+    
+    _SUMMARY_CACHE.clear()
+    _SUMMARY_CACHE[low_stock] = (now, summary)
+    return summary
+
+
+def _defect_report(cur, groups: List[str], query_params: Dict[str, Any], with_items: bool) -> Dict[str, Any]:
+    """Defective vs shipped quantities per group of order and free shipments in the range"""
+    select = ', '.join(DEFECT_GROUPS[g][0] for g in groups)
+    group_by = ', '.join(DEFECT_GROUPS[g][1] for g in groups)
+    order_by = 'period, defective_quantity DESC' if 'period' in groups else 'defective_quantity DESC'
+    rows_sql = DEFECT_ROWS_SQL if 'order' in groups else DEFECT_ROLLUP_ROWS_SQL
+
+    cur.execute(f"""
+        SELECT
+            {select},
+            COALESCE(SUM(d.quantity) FILTER (WHERE d.is_defective), 0)::bigint as defective_quantity,
+            COALESCE(SUM(d.shipment_count) FILTER (WHERE d.is_defective), 0)::bigint as defect_count,
+            SUM(d.quantity)::bigint as shipped_quantity
+        FROM ({rows_sql}) d
+        LEFT JOIN materials m ON m.id = d.material_id
+        LEFT JOIN colors c ON c.id = d.color_id
+        LEFT JOIN sections sec ON sec.id = m.section_id
+        LEFT JOIN orders o ON o.id = d.order_id
+        GROUP BY {group_by}
+        HAVING SUM(d.shipment_count) FILTER (WHERE d.is_defective) > 0
+        ORDER BY {order_by}
+    """, query_params)
+    rows = cur.fetchall()
+    for row in rows:
+        row['defect_rate'] = round(100 * row['defective_quantity'] / row['shipped_quantity'], 1) if row['shipped_quantity'] else 0
+
+    cur.execute(f"""
+        SELECT
+            COALESCE(SUM(quantity) FILTER (WHERE is_defective), 0)::bigint as defective_quantity,
+            COALESCE(SUM(shipment_count) FILTER (WHERE is_defective), 0)::bigint as defect_count,
+            COALESCE(SUM(quantity), 0)::bigint as shipped_quantity
+        FROM ({DEFECT_ROLLUP_ROWS_SQL}) d
+    """, query_params)
+    totals = cur.fetchone()
+    totals['defect_rate'] = round(100 * totals['defective_quantity'] / totals['shipped_quantity'], 1) if totals['shipped_quantity'] else 0
+
+    report = {'group_by': groups, 'totals': totals, 'groups': rows}
+    if with_items:
+        cur.execute(DEFECT_ITEMS_SQL, query_params)
+        report['items'] = cur.fetchall()
+    return report
+
+
+def _shortage_response(shortages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        'statusCode': 409,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json_body({'error': 'Недостаточно материала на складе', 'shortages': shortages}),
+        'isBase64Encoded': False
+    }
+
+
+@instrumented('orders')
+@compressed
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -28,9 +322,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = psycopg2.connect(os.environ['DATABASE_URL'], connection_factory=InstrumentedConnection)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
+        if method != 'GET':
+            checkpoint_if_due(conn, cur)
+        
         if method == 'GET':
             params = event.get('queryStringParameters') or {}
             request_type = params.get('type')
@@ -54,17 +351,22 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 ''')
                 requests = cur.fetchall()
                 
+                # Позиции всех заявок одним запросом
+                cur.execute('''
+                    SELECT id, request_id, material_name, quantity_required, 
+                           quantity_completed, color, size, comment
+                    FROM request_items
+                    WHERE request_id = ANY(%s)
+                    ORDER BY id
+                ''', ([req['id'] for req in requests],))
+                items_by_request = {}
+                for item in cur.fetchall():
+                    items_by_request.setdefault(item['request_id'], []).append(item)
+                
                 for req in requests:
-                    cur.execute('''
-                        SELECT id, request_id, material_name, quantity_required, 
-                               quantity_completed, color, size, comment
-                        FROM request_items
-                        WHERE request_id = %s
-                        ORDER BY id
-                    ''', (req['id'],))
-                    req['items'] = cur.fetchall()
+                    req['items'] = items_by_request.get(req['id'], [])
                 
-                result = [dict(r) for r in requests]
+                result = requests
                 
                 return {
                     'statusCode': 200,
@@ -72,12 +374,226 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'Content-Type': 'application/json',
                         'Access-Control-Allow-Origin': '*'
                     },
-                    'body': json.dumps(result, default=str, ensure_ascii=False),
+                    'body': json_body(result),
+                    'isBase64Encoded': False
+                }
+            
+            # Shipment exports (CSV/XLSX) for accounting
+            if request_type == 'export':
+                table = params.get('table', 'shipped_orders')
+                if table not in SHIPMENT_EXPORTS:
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': 'Неизвестная таблица выгрузки'}),
+                        'isBase64Encoded': False
+                    }
+                
+                try:
+                    start_month, end_month = export_months(params)
+                except ValueError:
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': 'from и to должны быть в формате YYYY-MM, year - целым числом'}),
+                        'isBase64Encoded': False
+                    }
+                query, columns = SHIPMENT_EXPORTS[table]
+                
+                cur.close()
+                return export_response(
+                    event, conn, query, {'start': start_month, 'end': end_month}, columns,
+                    params.get('format', 'csv'), f"{table}_{start_month}_{end_month}", [conn.close]
+                )
+            
+            # Available-to-promise: on-hand stock minus reservations of open orders
+            if request_type == 'availability':
+                material_id = params.get('material_id')
+                color_id = params.get('color_id') or None
+                
+                availability_query = '''
+                    SELECT 
+                        r.material_id, r.color_id,
+                        COALESCE(mci.quantity, CASE WHEN r.color_id IS NULL THEN m.quantity END, 0) as on_hand,
+                        r.reserved_quantity as reserved,
+                        COALESCE(mci.quantity, CASE WHEN r.color_id IS NULL THEN m.quantity END, 0) - r.reserved_quantity as available
+                    FROM material_reservations r
+                    JOIN materials m ON m.id = r.material_id
+                    LEFT JOIN material_color_inventory mci 
+                        ON mci.material_id = r.material_id AND mci.color_id = r.color_id
+                '''
+                
+                if material_id:
+                    cur.execute('''
+                        SELECT 
+                            m.id as material_id, %s::int as color_id,
+                            COALESCE(mci.quantity, CASE WHEN %s::int IS NULL THEN m.quantity END, 0) as on_hand,
+                            COALESCE(r.reserved_quantity, 0) as reserved,
+                            COALESCE(mci.quantity, CASE WHEN %s::int IS NULL THEN m.quantity END, 0) 
+                                - COALESCE(r.reserved_quantity, 0) as available
+                        FROM materials m
+                        LEFT JOIN material_color_inventory mci 
+                            ON mci.material_id = m.id AND mci.color_id = %s::int
+                        LEFT JOIN material_reservations r 
+                            ON r.material_id = m.id AND COALESCE(r.color_id, 0) = COALESCE(%s::int, 0)
+                        WHERE m.id = %s
+                    ''', (color_id, color_id, color_id, color_id, color_id, material_id))
+                    row = cur.fetchone()
+                    result = row
+                else:
+                    cur.execute(f"{availability_query} WHERE r.reserved_quantity <> 0 ORDER BY r.material_id, r.color_id")
+                    result = cur.fetchall()
+                
+                cur.close()
+                conn.close()
+                
+                return {
+                    'statusCode': 200 if result is not None else 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json_body(result if result is not None else {'error': 'Материал не найден'}),
+                    'isBase64Encoded': False
+                }
+            
+            # Shortage report: outstanding demand of open orders vs. stock
+            if request_type == 'shortage':
+                only_short = params.get('only_short', 'true') != 'false'
+                
+                cur.execute('''
+                    WITH open_lines AS (
+                        SELECT 
+                            oi.order_id, oi.material_id, oi.color_id,
+                            SUM(oi.quantity_required - COALESCE(oi.quantity_completed, 0)) as outstanding
+                        FROM order_items oi
+                        JOIN orders o ON o.id = oi.order_id
+                        WHERE o.status <> 'shipped'
+                          AND oi.material_id IS NOT NULL
+                          AND oi.quantity_required > COALESCE(oi.quantity_completed, 0)
+                        GROUP BY oi.order_id, oi.material_id, oi.color_id
+                    ),
+                    demand AS (
+                        SELECT 
+                            ol.material_id, ol.color_id,
+                            SUM(ol.outstanding) as demand,
+                            json_agg(json_build_object(
+                                'order_id', o.id,
+                                'order_number', o.order_number,
+                                'status', o.status,
+                                'outstanding', ol.outstanding
+                            ) ORDER BY o.created_at) as orders
+                        FROM open_lines ol
+                        JOIN orders o ON o.id = ol.order_id
+                        GROUP BY ol.material_id, ol.color_id
+                    )
+                    SELECT 
+                        d.material_id,
+                        m.name as material_name,
+                        d.color_id,
+                        c.name as color_name,
+                        d.demand,
+                        s.on_hand,
+                        GREATEST(d.demand - s.on_hand, 0) as shortfall,
+                        CASE WHEN d.demand > s.on_hand THEN d.orders ELSE '[]'::json END as blocked_orders
+                    FROM demand d
+                    JOIN materials m ON m.id = d.material_id
+                    LEFT JOIN colors c ON c.id = d.color_id
+                    LEFT JOIN material_color_inventory mci 
+                        ON mci.material_id = d.material_id AND mci.color_id = d.color_id
+                    CROSS JOIN LATERAL (
+                        SELECT COALESCE(mci.quantity, CASE WHEN d.color_id IS NULL THEN m.quantity END, 0) as on_hand
+                    ) s
+                    WHERE NOT %s OR d.demand > s.on_hand
+                    ORDER BY shortfall DESC, m.name, c.name
+                ''', (only_short,))
+                result = cur.fetchall()
+                
+                cur.close()
+                conn.close()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json_body(result),
+                    'isBase64Encoded': False
+                }
+            
+            # Dashboard counts for supervisors (one query, briefly cached)
+            if request_type == 'summary':
+                try:
+                    low_stock = int(params.get('low_stock', LOW_STOCK_THRESHOLD))
+                except ValueError:
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': 'low_stock должен быть целым числом'}),
+                        'isBase64Encoded': False
+                    }
+                
+                result = _dashboard_summary(cur, low_stock)
+                cur.close()
+                conn.close()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json_body(result),
                     'isBase64Encoded': False
                 }
             
+            # Defect (брак) report aggregated in SQL instead of in DefectiveReport.tsx
+            if request_type == 'defects':
+                groups = [g.strip() for g in params.get('group_by', 'material,color').split(',') if g.strip()]
+                period = params.get('period', 'day')
+                dates_valid = True
+                try:
+                    start = datetime.strptime(params['from'], '%Y-%m-%d') if params.get('from') else None
+                    end = datetime.strptime(params['to'], '%Y-%m-%d') + timedelta(days=1) if params.get('to') else None
+                except ValueError:
+                    dates_valid = False
+
+                if not groups or any(g not in DEFECT_GROUPS for g in groups) or period not in DEFECT_PERIODS or not dates_valid:
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({
+                            'error': 'Неверные параметры отчёта',
+                            'group_by': list(DEFECT_GROUPS),
+                            'period': list(DEFECT_PERIODS),
+                            'date_format': 'YYYY-MM-DD'
+                        }),
+                        'isBase64Encoded': False
+                    }
+
+                # Без границ - весь период; to включительно
+                query_params = {
+                    'start': start or '-infinity',
+                    'end': end or 'infinity',
+                    'period': period
+                }
+                result = _defect_report(cur, list(dict.fromkeys(groups)), query_params, params.get('items') == 'true')
+                result['from'] = params.get('from')
+                result['to'] = params.get('to')
+                cur.close()
+                conn.close()
+
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json_body(result),
+                    'isBase64Encoded': False
+                }
+
+            # Истории отгрузок отдаются без пагинации - читаем их серверным курсором порциями, не держа всё в памяти
             if get_free_shipments:
-                cur.execute("""
+                stream_cur = conn.cursor(name='free_shipments', cursor_factory=RealDictCursor)
+                stream_cur.execute("""
                     SELECT 
                         id,
                         material_id,
@@ -90,10 +606,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     FROM free_shipments
                     ORDER BY shipped_at DESC
                 """)
-                free_shipments = cur.fetchall()
-                result = [dict(item) for item in free_shipments]
+                cur.close()
+                return stream_response(event, stream_cur, [stream_cur.close, conn.close])
             elif get_shipped:
-                cur.execute("""
+                stream_cur = conn.cursor(name='shipped_orders', cursor_factory=RealDictCursor)
+                stream_cur.execute("""
                     SELECT 
                         so.id,
                         so.order_id,
@@ -108,36 +625,55 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     JOIN orders o ON o.id = so.order_id
                     ORDER BY so.shipped_at DESC
                 """)
-                shipped_items = cur.fetchall()
-                result = [dict(item) for item in shipped_items]
-            elif order_id:
-                cur.execute("SELECT * FROM orders WHERE id = %s", (order_id,))
+                cur.close()
+                return stream_response(event, stream_cur, [stream_cur.close, conn.close])
+            
+            # Выпадающим спискам хватает пары столбцов без позиций: ?fields=id,order_number&include=
+            try:
+                fields = sparse_fields(params, ORDER_FIELDS)
+                include = included(params, ORDER_INCLUDES)
+            except ValueError as e:
+                cur.close()
+                conn.close()
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json_body({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
+            columns = ', '.join(fields) if fields else '*'
+            
+            if order_id:
+                cur.execute(f"SELECT {columns} FROM orders WHERE id = %s", (order_id,))
                 order = cur.fetchone()
                 
-                if order:
+                if order and 'items' in include:
                     cur.execute("SELECT * FROM order_items WHERE order_id = %s", (order_id,))
-                    items = cur.fetchall()
-                    order_dict = dict(order)
-                    order_dict['items'] = [dict(item) for item in items]
-                    result = order_dict
-                else:
-                    result = None
+                    order['items'] = cur.fetchall()
+                result = order
             else:
-                query = "SELECT * FROM orders"
+                query = f"SELECT {columns} FROM orders"
                 if status_filter:
                     cur.execute(f"{query} WHERE status = %s ORDER BY created_at DESC", (status_filter,))
                 else:
                     cur.execute(f"{query} ORDER BY created_at DESC")
                 
                 orders = cur.fetchall()
-                result = []
                 
-                for order in orders:
-                    order_dict = dict(order)
-                    cur.execute("SELECT * FROM order_items WHERE order_id = %s", (order['id'],))
-                    items = cur.fetchall()
-                    order_dict['items'] = [dict(item) for item in items]
-                    result.append(order_dict)
+                if 'items' in include:
+                    # Позиции всех заказов одним запросом вместо запроса на каждый заказ
+                    cur.execute(
+                        "SELECT * FROM order_items WHERE order_id = ANY(%s) ORDER BY id",
+                        ([order['id'] for order in orders],)
+                    )
+                    items_by_order = {}
+                    for item in cur.fetchall():
+                        items_by_order.setdefault(item['order_id'], []).append(item)
+                    
+                    # Строки курсора дополняются на месте и сериализуются без копий
+                    for order in orders:
+                        order['items'] = items_by_order.get(order['id'], [])
+                result = orders
             
             cur.close()
             conn.close()
@@ -145,7 +681,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, default=str),
+                'body': json_body(result),
                 'isBase64Encoded': False
             }
         
@@ -154,6 +690,65 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             params = event.get('queryStringParameters') or {}
             request_type = params.get('type')
             
+            # Rebuild the reservation ledger from open orders
+            if request_type == 'reservations' and params.get('action') == 'rebuild':
+                cur.execute("LOCK TABLE material_reservations IN EXCLUSIVE MODE")
+                cur.execute(f'''
+                    SELECT COUNT(*) as drift
+                    FROM ({RESERVATIONS_SQL}) e
+                    FULL JOIN material_reservations r 
+                        ON r.material_id = e.material_id AND COALESCE(r.color_id, 0) = COALESCE(e.color_id, 0)
+                    WHERE COALESCE(e.reserved_quantity, 0) <> COALESCE(r.reserved_quantity, 0)
+                ''')
+                drift = cur.fetchone()['drift']
+                
+                cur.execute("DELETE FROM material_reservations")
+                cur.execute(f'''
+                    INSERT INTO material_reservations (material_id, color_id, reserved_quantity)
+                    {RESERVATIONS_SQL}
+                ''')
+                rebuilt = cur.rowcount
+                conn.commit()
+                cur.close()
+                conn.close()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json_body({'rebuilt': rebuilt, 'drift': drift}),
+                    'isBase64Encoded': False
+                }
+
+            if request_type == 'shipment_rollups' and params.get('action') == 'rebuild':
+                cur.execute("LOCK TABLE shipment_daily_rollups IN EXCLUSIVE MODE")
+                cur.execute(f'''
+                    SELECT COUNT(*) as drift
+                    FROM ({SHIPMENT_ROLLUPS_SQL}) e
+                    FULL JOIN shipment_daily_rollups r
+                        ON r.day = e.day AND r.source = e.source AND r.material_id = e.material_id
+                        AND COALESCE(r.color_id, 0) = COALESCE(e.color_id, 0) AND r.is_defective = e.is_defective
+                    WHERE COALESCE(e.shipment_count, 0) <> COALESCE(r.shipment_count, 0)
+                       OR COALESCE(e.quantity, 0) <> COALESCE(r.quantity, 0)
+                ''')
+                drift = cur.fetchone()['drift']
+
+                cur.execute("DELETE FROM shipment_daily_rollups")
+                cur.execute(f'''
+                    INSERT INTO shipment_daily_rollups (day, source, material_id, color_id, is_defective, shipment_count, quantity)
+                    {SHIPMENT_ROLLUPS_SQL}
+                ''')
+                rebuilt = cur.rowcount
+                conn.commit()
+                cur.close()
+                conn.close()
+
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json_body({'rebuilt': rebuilt, 'drift': drift}),
+                    'isBase64Encoded': False
+                }
+
             # Handle request creation
             if request_type == 'requests':
                 request_number = body_data.get('request_number')
@@ -166,7 +761,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Не указаны обязательные поля'}, ensure_ascii=False),
+                        'body': json_body({'error': 'Не указаны обязательные поля'}),
                         'isBase64Encoded': False
                     }
                 
@@ -199,7 +794,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'id': request_id, 'message': 'Заявка создана'}, ensure_ascii=False),
+                    'body': json_body({'id': request_id, 'message': 'Заявка создана'}),
                     'isBase64Encoded': False
                 }
             
@@ -208,6 +803,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 shipped_by = body_data.get('shipped_by')
                 comment = body_data.get('comment', '')
                 
+                try:
+                    validate_lines(shipped_items)
+                except ValueError as e:
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': str(e)}),
+                        'isBase64Encoded': False
+                    }
+                
+                shortages = find_shortages(cur, [item for item in shipped_items if not item.get('is_defective', False)], True)
+                if shortages:
+                    cur.close()
+                    conn.close()
+                    return _shortage_response(shortages)
+                
                 for item in shipped_items:
                     material_id = item.get('material_id')
                     color_id = item.get('color_id')
@@ -216,9 +829,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     
                     cur.execute(
                         """INSERT INTO free_shipments (material_id, color_id, quantity, is_defective, shipped_by, comment)
-                           VALUES (%s, %s, %s, %s, %s, %s)""",
+                           VALUES (%s, %s, %s, %s, %s, %s)
+                           RETURNING material_id, color_id, quantity, is_defective, shipped_at""",
                         (material_id, color_id, quantity, is_defective, shipped_by, comment)
                     )
+                    _adjust_shipment_rollup(cur, 'free', cur.fetchone(), 1)
                     
                     if not is_defective:
                         cur.execute(
@@ -235,11 +850,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                             )
                             
                             cur.execute(
-                                """INSERT INTO material_color_inventory (material_id, color_id, quantity)
-                                   VALUES (%s, %s, -%s)
-                                   ON CONFLICT (material_id, color_id)
-                                   DO UPDATE SET quantity = material_color_inventory.quantity - EXCLUDED.quantity""",
-                                (material_id, color_id, quantity)
+                                """UPDATE material_color_inventory 
+                                   SET quantity = quantity - %s, updated_at = NOW()
+                                   WHERE material_id = %s AND color_id = %s""",
+                                (quantity, material_id, color_id)
                             )
                 
                 conn.commit()
@@ -249,7 +863,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 201,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': 'Materials shipped successfully'}),
+                    'body': json_body({'message': 'Materials shipped successfully'}),
                     'isBase64Encoded': False
                 }
             
@@ -264,7 +878,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Заполните обязательные поля'}),
+                    'body': json_body({'error': 'Заполните обязательные поля'}),
                     'isBase64Encoded': False
                 }
             
@@ -283,13 +897,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     (order_id, item.get('material_id'), item.get('color_id'), item.get('quantity_required'))
                 )
             
+            _adjust_reservations(cur, order_id, 1)
             conn.commit()
             
             cur.execute("SELECT * FROM order_items WHERE order_id = %s", (order_id,))
-            items_result = cur.fetchall()
-            
-            order_dict = dict(order)
-            order_dict['items'] = [dict(item) for item in items_result]
+            order['items'] = cur.fetchall()
             
             cur.close()
             conn.close()
@@ -297,7 +909,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 201,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(order_dict, default=str),
+                'body': json_body(order),
                 'isBase64Encoded': False
             }
         
@@ -315,7 +927,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Не указаны item_id или quantity_completed'}, ensure_ascii=False),
+                        'body': json_body({'error': 'Не указаны item_id или quantity_completed'}),
                         'isBase64Encoded': False
                     }
                 
@@ -331,7 +943,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 404,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Позиция не найдена'}, ensure_ascii=False),
+                        'body': json_body({'error': 'Позиция не найдена'}),
                         'isBase64Encoded': False
                     }
                 
@@ -368,7 +980,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': 'Количество обновлено', 'new_status': new_status}, ensure_ascii=False),
+                    'body': json_body({'message': 'Количество обновлено', 'new_status': new_status}),
                     'isBase64Encoded': False
                 }
             
@@ -379,50 +991,79 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'ID обязателен'}),
+                    'body': json_body({'error': 'ID обязателен'}),
                     'isBase64Encoded': False
                 }
             
             if item_id and 'quantity_completed' in body_data:
+                cur.execute("SELECT status FROM orders WHERE id = %s FOR UPDATE", (order_id,))
+                order_row = cur.fetchone()
+                
                 cur.execute(
                     "UPDATE order_items SET quantity_completed = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING *",
                     (body_data['quantity_completed'], item_id)
                 )
-                conn.commit()
                 
-                cur.execute("""
-                    SELECT 
-                        CASE 
-                            WHEN COUNT(*) = COUNT(CASE WHEN quantity_completed >= quantity_required THEN 1 END) 
-                            THEN 'completed'
-                            WHEN COUNT(CASE WHEN quantity_completed > 0 THEN 1 END) > 0 
-                            THEN 'in_progress'
-                            ELSE 'new'
-                        END as new_status
-                    FROM order_items WHERE order_id = %s
-                """, (order_id,))
-                
-                status_row = cur.fetchone()
-                new_status = status_row['new_status'] if status_row else 'new'
-                
-                completed_at = datetime.now() if new_status == 'completed' else None
-                cur.execute(
-                    "UPDATE orders SET status = %s, completed_at = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
-                    (new_status, completed_at, order_id)
-                )
+                # Отгруженный заказ остаётся отгруженным: правка выполнения не возвращает его в работу
+                # (иначе он выпал бы из shipped без возврата резерва в material_reservations)
+                if order_row and order_row['status'] != 'shipped':
+                    cur.execute("""
+                        SELECT 
+                            CASE 
+                                WHEN COUNT(*) = COUNT(CASE WHEN quantity_completed >= quantity_required THEN 1 END) 
+                                THEN 'completed'
+                                WHEN COUNT(CASE WHEN quantity_completed > 0 THEN 1 END) > 0 
+                                THEN 'in_progress'
+                                ELSE 'new'
+                            END as new_status
+                        FROM order_items WHERE order_id = %s
+                    """, (order_id,))
+                    
+                    status_row = cur.fetchone()
+                    new_status = status_row['new_status'] if status_row else 'new'
+                    
+                    completed_at = datetime.now() if new_status == 'completed' else None
+                    cur.execute(
+                        "UPDATE orders SET status = %s, completed_at = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+                        (new_status, completed_at, order_id)
+                    )
                 conn.commit()
             
             if 'status' in body_data:
                 new_status = body_data['status']
                 
+                cur.execute("SELECT status, auto_deduct FROM orders WHERE id = %s FOR UPDATE", (order_id,))
+                order_row = cur.fetchone()
+                
+                # Резерв снимается при отгрузке и возвращается, если отгрузку отменили
+                if order_row and (order_row['status'] == 'shipped') != (new_status == 'shipped'):
+                    _adjust_reservations(cur, order_id, -1 if new_status == 'shipped' else 1)
+                
                 if new_status == 'shipped':
                     shipped_items = body_data.get('shipped_items', [])
                     shipped_by = body_data.get('shipped_by')
                     
-                    cur.execute("SELECT auto_deduct FROM orders WHERE id = %s", (order_id,))
-                    order_row = cur.fetchone()
                     order_auto_deduct = order_row['auto_deduct'] if order_row else True
                     
+                    try:
+                        validate_lines(shipped_items)
+                    except ValueError as e:
+                        cur.close()
+                        conn.close()
+                        return {
+                            'statusCode': 400,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json_body({'error': str(e)}),
+                            'isBase64Encoded': False
+                        }
+                    
+                    if order_auto_deduct:
+                        shortages = find_shortages(cur, [item for item in shipped_items if not item.get('is_defective', False)], True)
+                        if shortages:
+                            cur.close()
+                            conn.close()
+                            return _shortage_response(shortages)
+                    
                     for item in shipped_items:
                         material_id = item.get('material_id')
                         color_id = item.get('color_id')
@@ -431,9 +1072,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         
                         cur.execute(
                             """INSERT INTO shipped_orders (order_id, material_id, color_id, quantity, is_defective, shipped_by)
-                               VALUES (%s, %s, %s, %s, %s, %s)""",
+                               VALUES (%s, %s, %s, %s, %s, %s)
+                               RETURNING material_id, color_id, quantity, is_defective, shipped_at""",
                             (order_id, material_id, color_id, quantity, is_defective, shipped_by)
                         )
+                        _adjust_shipment_rollup(cur, 'order', cur.fetchone(), 1)
                         
                         if not is_defective and order_auto_deduct:
                             cur.execute(
@@ -450,11 +1093,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                                 )
                                 
                                 cur.execute(
-                                    """INSERT INTO material_color_inventory (material_id, color_id, quantity)
-                                       VALUES (%s, %s, -%s)
-                                       ON CONFLICT (material_id, color_id)
-                                       DO UPDATE SET quantity = material_color_inventory.quantity - EXCLUDED.quantity""",
-                                    (material_id, color_id, quantity)
+                                    """UPDATE material_color_inventory 
+                                       SET quantity = quantity - %s, updated_at = NOW()
+                                       WHERE material_id = %s AND color_id = %s""",
+                                    (quantity, material_id, color_id)
                                 )
                     
                     cur.execute(
@@ -474,10 +1116,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if order:
                 cur.execute("SELECT * FROM order_items WHERE order_id = %s", (order_id,))
-                items = cur.fetchall()
-                order_dict = dict(order)
-                order_dict['items'] = [dict(item) for item in items]
-                result = order_dict
+                order['items'] = cur.fetchall()
+                result = order
             else:
                 result = None
             
@@ -487,7 +1127,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, default=str),
+                'body': json_body(result),
                 'isBase64Encoded': False
             }
         
@@ -513,7 +1153,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 404,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Заявка не найдена'}, ensure_ascii=False),
+                        'body': json_body({'error': 'Заявка не найдена'}),
                         'isBase64Encoded': False
                     }
                 
@@ -524,14 +1164,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': 'Статус обновлен'}, ensure_ascii=False),
+                    'body': json_body({'message': 'Статус обновлен'}),
                     'isBase64Encoded': False
                 }
             
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Неверные параметры'}, ensure_ascii=False),
+                'body': json_body({'error': 'Неверные параметры'}),
                 'isBase64Encoded': False
             }
         
@@ -547,7 +1187,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'ID заявки не передан'}, ensure_ascii=False),
+                        'body': json_body({'error': 'ID заявки не передан'}),
                         'isBase64Encoded': False
                     }
                 
@@ -560,7 +1200,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 404,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Заявка не найдена'}, ensure_ascii=False),
+                        'body': json_body({'error': 'Заявка не найдена'}),
                         'isBase64Encoded': False
                     }
                 
@@ -571,7 +1211,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': 'Заявка удалена'}, ensure_ascii=False),
+                    'body': json_body({'message': 'Заявка удалена'}),
                     'isBase64Encoded': False
                 }
             
@@ -611,7 +1251,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                                 (material_id, color_id, quantity)
                             )
                     
-                    cur.execute("DELETE FROM free_shipments WHERE id = %s", (shipment_id,))
+                    cur.execute(
+                        "DELETE FROM free_shipments WHERE id = %s RETURNING material_id, color_id, quantity, is_defective, shipped_at",
+                        (shipment_id,)
+                    )
+                    _adjust_shipment_rollup(cur, 'free', cur.fetchone(), -1)
                     conn.commit()
                     cur.close()
                     conn.close()
@@ -619,7 +1263,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 200,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'success': True, 'message': 'Свободная отправка удалена, материалы возвращены на склад'}),
+                        'body': json_body({'success': True, 'message': 'Свободная отправка удалена, материалы возвращены на склад'}),
                         'isBase64Encoded': False
                     }
                 elif shipment_type == 'order':
@@ -631,11 +1275,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         return {
                             'statusCode': 404,
                             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                            'body': json.dumps({'error': 'Запись не найдена'}, ensure_ascii=False),
+                            'body': json_body({'error': 'Запись не найдена'}),
                             'isBase64Encoded': False
                         }
                     
-                    cur.execute("DELETE FROM shipped_orders WHERE id = %s", (shipment_id,))
+                    cur.execute(
+                        "DELETE FROM shipped_orders WHERE id = %s RETURNING material_id, color_id, quantity, is_defective, shipped_at",
+                        (shipment_id,)
+                    )
+                    _adjust_shipment_rollup(cur, 'order', cur.fetchone(), -1)
                     conn.commit()
                     cur.close()
                     conn.close()
@@ -643,7 +1291,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 200,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'success': True, 'message': 'Брак утилизирован'}, ensure_ascii=False),
+                        'body': json_body({'success': True, 'message': 'Брак утилизирован'}),
                         'isBase64Encoded': False
                     }
                 
@@ -651,7 +1299,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Неверный тип отправки'}, ensure_ascii=False),
+                    'body': json_body({'error': 'Неверный тип отправки'}),
                     'isBase64Encoded': False
                 }
             
@@ -659,11 +1307,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'ID обязателен'}),
+                    'body': json_body({'error': 'ID обязателен'}),
                     'isBase64Encoded': False
                 }
             
-            cur.execute("SELECT completed_at FROM orders WHERE id = %s", (order_id,))
+            cur.execute("SELECT status, completed_at FROM orders WHERE id = %s FOR UPDATE", (order_id,))
             order = cur.fetchone()
             
             if order and order['completed_at']:
@@ -674,10 +1322,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 403,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Заявку можно удалить только через 6 месяцев после выполнения'}),
+                        'body': json_body({'error': 'Заявку можно удалить только через 6 месяцев после выполнения'}),
                         'isBase64Encoded': False
                     }
             
+            if order and order['status'] != 'shipped':
+                _adjust_reservations(cur, order_id, -1)
+            
             cur.execute("DELETE FROM order_items WHERE order_id = %s", (order_id,))
             cur.execute("DELETE FROM orders WHERE id = %s", (order_id,))
             conn.commit()
@@ -687,7 +1338,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True}),
+                'body': json_body({'success': True}),
                 'isBase64Encoded': False
             }
         
@@ -695,13 +1346,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
+            'body': json_body({'error': str(e)}),
             'isBase64Encoded': False
         }
     
     return {
         'statusCode': 405,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Метод не поддерживается'}),
+        'body': json_body({'error': 'Метод не поддерживается'}),
         'isBase64Encoded': False
     }
\ No newline at end of file
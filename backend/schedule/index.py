@@ -1,16 +1,79 @@
 """
 Business: Manage time tracking with monthly timesheet view and manual employee list
-Args: event with httpMethod, query params for month/year filtering, type for employees management
+Args: event with httpMethod, query params for month/year or from/to range filtering, type for employees management
 Returns: Time tracking data grouped by employee or operation result
 """
 
 import json
 import os
-from typing import Dict, Any
-from datetime import datetime
+from typing import Dict, Any, List
+from datetime import date
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from perf import InstrumentedConnection, instrumented
+from responses import compressed, export_months, export_response, json_body
 
+# Рекомендательные блокировки месяцев табеля: первый ключ общий, второй - месяц как YYYYMM
+MONTH_LOCK_KEY = 7301
+
+
+def _month_start(year: Any, month: Any) -> str:
+    """First day of the month as YYYY-MM-DD; ValueError unless both are whole numbers and month is 1..12"""
+    year, month = int(year), int(month)
+    if not 1 <= month <= 12:
+        raise ValueError(f'month out of range: {month}')
+    return f"{year:04d}-{month:02d}-01"
+
+
+def _month_param(value: str) -> str:
+    """First day of a YYYY-MM query parameter"""
+    year, _, month = value.partition('-')
+    return _month_start(year, month)
+
+
+def _lock_month(cur, month_start: str) -> None:
+    """Exclusive lock of a month being closed or reopened, held until commit; waits for cell writes in flight"""
+    cur.execute("SELECT pg_advisory_xact_lock(%s, to_char(%s::date, 'YYYYMM')::int)", (MONTH_LOCK_KEY, month_start))
+
+
+def _closed_months(cur, dates: List[str]) -> List[str]:
+    """Closed timesheet months (YYYY-MM) among the given work dates.
+    Takes a shared lock on every month until commit, so the month cannot be closed between this check and the write"""
+    cur.execute(
+        """SELECT pg_advisory_xact_lock_shared(%s, to_char(month, 'YYYYMM')::int)
+           FROM (SELECT DISTINCT date_trunc('month', d::date)::date as month FROM unnest(%s::text[]) d) m""",
+        (MONTH_LOCK_KEY, list(dates))
+    )
+    cur.execute(
+        """SELECT to_char(month, 'YYYY-MM') as month
+           FROM timesheet_closed_months
+           WHERE month IN (SELECT DISTINCT date_trunc('month', d::date)::date FROM unnest(%s::text[]) d)
+           ORDER BY month""",
+        (list(dates),)
+    )
+    return [row['month'] for row in cur.fetchall()]
+
+
+def _closed_response(months: List[str]) -> Dict[str, Any]:
+    return {
+        'statusCode': 409,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json_body({'error': 'Период закрыт для редактирования', 'closed_months': months}),
+        'isBase64Encoded': False
+    }
+
+
+def _bad_request(message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 400,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json_body({'error': message}),
+        'isBase64Encoded': False
+    }
+
+
+@instrumented('schedule')
+@compressed
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -28,7 +91,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = psycopg2.connect(os.environ['DATABASE_URL'], connection_factory=InstrumentedConnection)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         if method == 'GET':
@@ -42,7 +105,117 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                        ORDER BY full_name"""
                 )
                 employees = cur.fetchall()
-                result = [dict(row) for row in employees]
+                result = employees
+            
+            elif req_type == 'export':
+                try:
+                    start_month, end_month = export_months(params)
+                except ValueError:
+                    cur.close()
+                    conn.close()
+                    return _bad_request('from и to должны быть в формате YYYY-MM, year - целым числом')
+                
+                cur.close()
+                return export_response(
+                    event, conn,
+                    """SELECT te.id, te.full_name, tt.work_date, tt.hours
+                       FROM time_tracking tt
+                       JOIN timesheet_employees te ON te.id = tt.employee_id
+                       WHERE tt.work_date >= (%(start)s || '-01')::date
+                         AND tt.work_date < (%(end)s || '-01')::date + INTERVAL '1 month'
+                       ORDER BY te.full_name, te.id, tt.work_date""",
+                    {'start': start_month, 'end': end_month},
+                    ['employee_id', 'full_name', 'work_date', 'hours'],
+                    params.get('format', 'csv'),
+                    f"time_tracking_{start_month}_{end_month}",
+                    [conn.close]
+                )
+            
+            elif params.get('from') and params.get('to'):
+                # Диапазон месяцев: ячейки и итоги по сотрудникам за каждый месяц
+                employee_ids = params.get('employee_ids', '')
+                include_days = params.get('days', 'true') != 'false'
+                
+                try:
+                    start_date = _month_param(params['from'])
+                    end_month = _month_param(params['to'])[:7]
+                    emp_id_list = [int(x) for x in employee_ids.split(',') if x] or None
+                except ValueError:
+                    cur.close()
+                    conn.close()
+                    return _bad_request('from и to должны быть в формате YYYY-MM, employee_ids - целыми числами')
+                
+                cur.execute(
+                    """SELECT id, full_name
+                       FROM timesheet_employees
+                       WHERE %(ids)s::int[] IS NULL OR id = ANY(%(ids)s::int[])
+                       ORDER BY full_name""",
+                    {'ids': emp_id_list}
+                )
+                employees_map = {
+                    emp['id']: {
+                        'employee_id': emp['id'],
+                        'full_name': emp['full_name'],
+                        'days': {},
+                        'months': {},
+                        'total_hours': 0.0,
+                        'worked_days': 0
+                    }
+                    for emp in cur.fetchall()
+                }
+                
+                range_filter = """
+                    WHERE (%(ids)s::int[] IS NULL OR employee_id = ANY(%(ids)s::int[]))
+                      AND work_date >= %(start)s::date
+                      AND work_date < (%(end)s || '-01')::date + INTERVAL '1 month'
+                """
+                range_params = {'ids': emp_id_list, 'start': start_date, 'end': end_month}
+                
+                # Закрытые месяцы читаются из итогов, открытые - агрегируются по дневным ячейкам
+                cur.execute(
+                    f"""SELECT employee_id, to_char(month, 'YYYY-MM') as month, total_hours, worked_days
+                        FROM timesheet_month_summaries
+                        WHERE (%(ids)s::int[] IS NULL OR employee_id = ANY(%(ids)s::int[]))
+                          AND month >= %(start)s::date
+                          AND month <= (%(end)s || '-01')::date
+                        UNION ALL
+                        SELECT employee_id,
+                               to_char(date_trunc('month', work_date), 'YYYY-MM') as month,
+                               SUM(hours) as total_hours,
+                               COUNT(*) FILTER (WHERE hours > 0) as worked_days
+                        FROM time_tracking
+                        {range_filter}
+                          AND date_trunc('month', work_date)::date NOT IN (SELECT month FROM timesheet_closed_months)
+                        GROUP BY employee_id, 2""",
+                    range_params
+                )
+                for row in cur.fetchall():
+                    emp = employees_map.get(row['employee_id'])
+                    if emp:
+                        emp['months'][row['month']] = {
+                            'total_hours': float(row['total_hours']),
+                            'worked_days': row['worked_days']
+                        }
+                        emp['total_hours'] += float(row['total_hours'])
+                        emp['worked_days'] += row['worked_days']
+                
+                if include_days:
+                    cur.execute(
+                        f"""SELECT employee_id, work_date, hours, id as record_id
+                            FROM time_tracking
+                            {range_filter}
+                            ORDER BY work_date""",
+                        range_params
+                    )
+                    for record in cur.fetchall():
+                        emp = employees_map.get(record['employee_id'])
+                        if emp:
+                            emp['days'][record['work_date'].strftime('%Y-%m-%d')] = {
+                                'hours': float(record['hours']),
+                                'record_id': record['record_id']
+                            }
+                
+                result = list(employees_map.values())
             
             else:
                 month = params.get('month')
@@ -50,14 +223,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 employee_ids = params.get('employee_ids', '')
                 
                 if month and year and employee_ids:
-                    start_date = f"{year}-{month:0>2}-01"
+                    try:
+                        start_date = _month_start(year, month)
+                        emp_id_list = [int(x) for x in employee_ids.split(',') if x]
+                    except ValueError:
+                        cur.close()
+                        conn.close()
+                        return _bad_request('month, year и employee_ids должны быть целыми числами')
                     
                     if int(month) == 12:
                         end_date = f"{int(year)+1}-01-01"
                     else:
-                        end_date = f"{year}-{int(month)+1:0>2}-01"
-                    
-                    emp_id_list = [int(x) for x in employee_ids.split(',') if x]
+                        end_date = f"{int(year)}-{int(month)+1:0>2}-01"
                     placeholders = ','.join(['%s'] * len(emp_id_list))
                     
                     cur.execute(
@@ -111,7 +288,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, default=str),
+                'body': json_body(result),
                 'isBase64Encoded': False
             }
         
@@ -126,7 +303,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Укажите ФИО'}),
+                        'body': json_body({'error': 'Укажите ФИО'}),
                         'isBase64Encoded': False
                     }
                 
@@ -138,7 +315,161 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 )
                 employee = cur.fetchone()
                 conn.commit()
-                result = dict(employee)
+                result = employee
+            
+            elif req_type == 'close_month':
+                month = body_data.get('month')
+                year = body_data.get('year')
+                
+                if not month or not year:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': 'Укажите month и year'}),
+                        'isBase64Encoded': False
+                    }
+                
+                try:
+                    month_start = _month_start(year, month)
+                except ValueError:
+                    cur.close()
+                    conn.close()
+                    return _bad_request('month и year должны быть целыми числами, month от 1 до 12')
+                
+                # Ячейки месяца, уже прошедшие проверку _closed_months, дописываются до закрытия и попадут в итоги
+                _lock_month(cur, month_start)
+                cur.execute(
+                    """INSERT INTO timesheet_closed_months (month, closed_by)
+                       VALUES (%s::date, %s)
+                       ON CONFLICT (month) DO NOTHING
+                       RETURNING month, closed_at""",
+                    (month_start, body_data.get('closed_by'))
+                )
+                closed_row = cur.fetchone()
+                
+                if not closed_row:
+                    cur.close()
+                    conn.close()
+                    return _closed_response([month_start[:7]])
+                
+                cur.execute(
+                    """INSERT INTO timesheet_month_summaries (employee_id, month, full_name, total_hours, worked_days)
+                       SELECT tt.employee_id, %(month)s::date, te.full_name,
+                              SUM(tt.hours), COUNT(*) FILTER (WHERE tt.hours > 0)
+                       FROM time_tracking tt
+                       JOIN timesheet_employees te ON te.id = tt.employee_id
+                       WHERE tt.work_date >= %(month)s::date
+                         AND tt.work_date < %(month)s::date + INTERVAL '1 month'
+                       GROUP BY tt.employee_id, te.full_name""",
+                    {'month': month_start}
+                )
+                summaries = cur.rowcount
+                
+                # Заранее создаём секцию time_tracking на следующий год
+                cur.execute("SELECT ensure_time_tracking_partition(%s)", (int(month_start[:4]) + 1,))
+                
+                # По желанию удаляем дневные ячейки: итоги уже зафиксированы
+                trimmed = 0
+                if body_data.get('trim'):
+                    cur.execute(
+                        """DELETE FROM time_tracking
+                           WHERE work_date >= %(month)s::date
+                             AND work_date < %(month)s::date + INTERVAL '1 month'""",
+                        {'month': month_start}
+                    )
+                    trimmed = cur.rowcount
+                    cur.execute("UPDATE timesheet_closed_months SET trimmed = TRUE WHERE month = %s::date", (month_start,))
+                
+                conn.commit()
+                result = {
+                    'month': month_start[:7],
+                    'closed_at': closed_row['closed_at'],
+                    'summaries': summaries,
+                    'trimmed': trimmed
+                }
+            
+            elif req_type == 'bulk':
+                cells = body_data.get('cells', [])
+                
+                if not cells or not all(cell.get('employee_id') and cell.get('work_date') for cell in cells):
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': 'Укажите cells с employee_id и work_date'}),
+                        'isBase64Encoded': False
+                    }
+                
+                # Последняя запись по ячейке побеждает; hours = null означает удаление
+                try:
+                    grid = {
+                        (int(cell['employee_id']), date.fromisoformat(cell['work_date']).isoformat()): cell.get('hours')
+                        for cell in cells
+                    }
+                except (TypeError, ValueError):
+                    cur.close()
+                    conn.close()
+                    return _bad_request('employee_id должен быть целым числом, work_date - датой YYYY-MM-DD')
+                upserts = [(eid, day, hours) for (eid, day), hours in grid.items() if hours is not None]
+                deletes = [(eid, day) for (eid, day), hours in grid.items() if hours is None]
+                
+                closed = _closed_months(cur, [day for _, day in grid])
+                if closed:
+                    cur.close()
+                    conn.close()
+                    return _closed_response(closed)
+                
+                # Годовые секции time_tracking для всех лет в сетке
+                cur.execute(
+                    "SELECT ensure_time_tracking_partition(y) FROM unnest(%s::int[]) y",
+                    (sorted({int(day[:4]) for _, day in grid}),)
+                )
+                
+                if upserts:
+                    execute_values(
+                        cur,
+                        """INSERT INTO time_tracking (employee_id, work_date, hours)
+                           VALUES %s
+                           ON CONFLICT (employee_id, work_date)
+                           DO UPDATE SET hours = EXCLUDED.hours, updated_at = NOW()""",
+                        upserts,
+                        template="(%s, %s::date, %s)",
+                        page_size=len(upserts)
+                    )
+                
+                deleted = 0
+                if deletes:
+                    execute_values(
+                        cur,
+                        """DELETE FROM time_tracking t
+                           USING (VALUES %s) AS v(employee_id, work_date)
+                           WHERE t.employee_id = v.employee_id AND t.work_date = v.work_date""",
+                        deletes,
+                        template="(%s::int, %s::date)",
+                        page_size=len(deletes)
+                    )
+                    deleted = cur.rowcount
+                
+                dates = [day for _, day in grid]
+                cur.execute(
+                    """SELECT employee_id, 
+                              to_char(date_trunc('month', work_date), 'YYYY-MM') as month,
+                              SUM(hours) as total_hours,
+                              COUNT(*) FILTER (WHERE hours > 0) as worked_days
+                       FROM time_tracking
+                       WHERE employee_id = ANY(%s)
+                         AND work_date >= date_trunc('month', %s::date)
+                         AND work_date < date_trunc('month', %s::date) + INTERVAL '1 month'
+                       GROUP BY employee_id, 2
+                       ORDER BY employee_id, 2""",
+                    (sorted({eid for eid, _ in grid}), min(dates), max(dates))
+                )
+                totals = [
+                    {**row, 'total_hours': float(row['total_hours'])}
+                    for row in cur.fetchall()
+                ]
+                conn.commit()
+                
+                result = {'upserted': len(upserts), 'deleted': deleted, 'totals': totals}
             
             else:
                 employee_id = body_data.get('employee_id')
@@ -149,10 +480,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Заполните обязательные поля'}),
+                        'body': json_body({'error': 'Заполните обязательные поля'}),
                         'isBase64Encoded': False
                     }
                 
+                closed = _closed_months(cur, [work_date])
+                if closed:
+                    cur.close()
+                    conn.close()
+                    return _closed_response(closed)
+                
                 cur.execute(
                     """INSERT INTO time_tracking (employee_id, work_date, hours) 
                        VALUES (%s, %s, %s) 
@@ -163,7 +500,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 )
                 record = cur.fetchone()
                 conn.commit()
-                result = dict(record)
+                result = record
             
             cur.close()
             conn.close()
@@ -171,7 +508,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 201,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, default=str),
+                'body': json_body(result),
                 'isBase64Encoded': False
             }
         
@@ -185,10 +522,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Укажите employee_id, work_date и hours'}),
+                    'body': json_body({'error': 'Укажите employee_id, work_date и hours'}),
                     'isBase64Encoded': False
                 }
             
+            closed = _closed_months(cur, [work_date])
+            if closed:
+                cur.close()
+                conn.close()
+                return _closed_response(closed)
+            
             cur.execute(
                 """INSERT INTO time_tracking (employee_id, work_date, hours) 
                    VALUES (%s, %s, %s) 
@@ -199,7 +542,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             )
             record = cur.fetchone()
             conn.commit()
-            result = dict(record) if record else None
+            result = record
             
             cur.close()
             conn.close()
@@ -207,7 +550,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, default=str),
+                'body': json_body(result),
                 'isBase64Encoded': False
             }
         
@@ -221,10 +564,29 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'ID сотрудника не передан'}, ensure_ascii=False),
+                        'body': json_body({'error': 'ID сотрудника не передан'}),
                         'isBase64Encoded': False
                     }
                 
+                try:
+                    resource_id = int(resource_id)
+                except ValueError:
+                    cur.close()
+                    conn.close()
+                    return _bad_request('ID сотрудника должен быть целым числом')
+                
+                # Ячейки закрытых месяцев удалять нельзя (итоги уже зафиксированы), а без них не удалить сотрудника
+                cur.execute(
+                    """SELECT DISTINCT date_trunc('month', work_date)::date::text as month
+                       FROM time_tracking WHERE employee_id = %s""",
+                    (resource_id,)
+                )
+                closed = _closed_months(cur, [row['month'] for row in cur.fetchall()])
+                if closed:
+                    cur.close()
+                    conn.close()
+                    return _closed_response(closed)
+                
                 cur.execute("DELETE FROM time_tracking WHERE employee_id = %s", (resource_id,))
                 cur.execute("DELETE FROM timesheet_employees WHERE id = %s RETURNING id", (resource_id,))
                 deleted = cur.fetchone()
@@ -234,7 +596,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 404,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Сотрудник не найден'}, ensure_ascii=False),
+                        'body': json_body({'error': 'Сотрудник не найден'}),
                         'isBase64Encoded': False
                     }
                 
@@ -245,14 +607,53 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'success': True, 'message': 'Сотрудник удален'}, ensure_ascii=False),
+                    'body': json_body({'success': True, 'message': 'Сотрудник удален'}),
+                    'isBase64Encoded': False
+                }
+            
+            if req_type == 'close_month' and params.get('month') and params.get('year'):
+                try:
+                    month_start = _month_start(params['year'], params['month'])
+                except ValueError:
+                    cur.close()
+                    conn.close()
+                    return _bad_request('month и year должны быть целыми числами, month от 1 до 12')
+                
+                _lock_month(cur, month_start)
+                
+                # Без дневных ячеек открывать период нельзя: итоги - единственные данные
+                cur.execute("SELECT trimmed FROM timesheet_closed_months WHERE month = %s::date", (month_start,))
+                closed_row = cur.fetchone()
+                if closed_row and closed_row['trimmed']:
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 409,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json_body({'error': 'Дневные данные периода удалены, открыть его нельзя'}),
+                        'isBase64Encoded': False
+                    }
+                
+                cur.execute("DELETE FROM timesheet_month_summaries WHERE month = %s::date", (month_start,))
+                cur.execute("DELETE FROM timesheet_closed_months WHERE month = %s::date RETURNING month", (month_start,))
+                reopened = cur.fetchone()
+                conn.commit()
+                cur.close()
+                conn.close()
+                
+                return {
+                    'statusCode': 200 if reopened else 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json_body(
+                        {'success': True, 'message': 'Период открыт'} if reopened else {'error': 'Период не закрыт'}
+                    ),
                     'isBase64Encoded': False
                 }
             
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Укажите type=employee и id'}, ensure_ascii=False),
+                'body': json_body({'error': 'Укажите type=employee и id'}),
                 'isBase64Encoded': False
             }
         
@@ -260,7 +661,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 405,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Метод не поддерживается'}),
+                'body': json_body({'error': 'Метод не поддерживается'}),
                 'isBase64Encoded': False
             }
     
@@ -268,6 +669,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
+            'body': json_body({'error': str(e)}),
             'isBase64Encoded': False
         }
\ No newline at end of file
@@ -9,7 +9,14 @@ import os
 from typing import Dict, Any
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from perf import InstrumentedConnection, instrumented
+from responses import compressed, json_body, sparse_fields
 
+# Столбцы, которые можно запросить через ?fields=; пароль - только по ?include_passwords=true от администратора (X-User-Id)
+USER_FIELDS = ('id', 'login', 'role', 'full_name', 'created_at', 'status', 'updated_at')
+
+@instrumented('users')
+@compressed
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -27,21 +34,44 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = psycopg2.connect(os.environ['DATABASE_URL'], connection_factory=InstrumentedConnection)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         if method == 'GET':
             params = event.get('queryStringParameters') or {}
             user_id = params.get('id')
             
+            try:
+                fields = sparse_fields(params, USER_FIELDS)
+            except ValueError as e:
+                cur.close()
+                conn.close()
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json_body({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
+            
+            columns = list(fields or USER_FIELDS)
+            if params.get('include_passwords') == 'true':
+                # Пароли отдаём только администратору, для остальных флаг игнорируется
+                admin_id = (event.get('headers') or {}).get('x-user-id')
+                if admin_id and admin_id.isdigit():
+                    cur.execute("SELECT role FROM users WHERE id = %s", (admin_id,))
+                    admin_row = cur.fetchone()
+                    if admin_row and admin_row['role'] == 'admin':
+                        columns.append('password')
+            columns = ', '.join(columns)
+            
             if user_id:
-                cur.execute("SELECT * FROM users WHERE id = %s", (user_id,))
+                cur.execute(f"SELECT {columns} FROM users WHERE id = %s", (user_id,))
                 user = cur.fetchone()
-                result = dict(user) if user else None
+                result = user
             else:
-                cur.execute("SELECT * FROM users ORDER BY id")
+                cur.execute(f"SELECT {columns} FROM users ORDER BY id")
                 users = cur.fetchall()
-                result = [dict(u) for u in users]
+                result = users
             
             cur.close()
             conn.close()
@@ -49,7 +79,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, default=str),
+                'body': json_body(result),
                 'isBase64Encoded': False
             }
         
@@ -64,7 +94,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Заполните все поля'}),
+                    'body': json_body({'error': 'Заполните все поля'}),
                     'isBase64Encoded': False
                 }
             
@@ -80,7 +110,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 201,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(dict(user), default=str),
+                'body': json_body(user),
                 'isBase64Encoded': False
             }
         
@@ -92,7 +122,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'ID обязателен'}),
+                    'body': json_body({'error': 'ID обязателен'}),
                     'isBase64Encoded': False
                 }
             
@@ -123,7 +153,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 user = cur.fetchone()
                 conn.commit()
                 
-                result = dict(user) if user else None
+                result = user
             else:
                 result = {'error': 'Нет данных для обновления'}
             
@@ -133,7 +163,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, default=str),
+                'body': json_body(result),
                 'isBase64Encoded': False
             }
         
@@ -145,7 +175,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'ID обязателен'}),
+                    'body': json_body({'error': 'ID обязателен'}),
                     'isBase64Encoded': False
                 }
             
@@ -157,7 +187,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True}),
+                'body': json_body({'success': True}),
                 'isBase64Encoded': False
             }
         
@@ -165,13 +195,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
+            'body': json_body({'error': str(e)}),
             'isBase64Encoded': False
         }
     
     return {
         'statusCode': 405,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Метод не поддерживается'}),
+        'body': json_body({'error': 'Метод не поддерживается'}),
         'isBase64Encoded': False
     }
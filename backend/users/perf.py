@@ -0,0 +1,251 @@
+"""
+Business: Per-route performance instrumentation shared by all functions (kept identical in every function directory)
+Args: handler wrapped with @instrumented(service); connections opened with connection_factory=InstrumentedConnection
+Returns: One structured log line per invocation, optional Server-Timing header, cProfile dump and JSONL event recording
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Any, Callable, List, Optional
+import psycopg2.extensions
+
+SLOW_ROUTE_MS = float(os.environ.get('PERF_SLOW_MS', '1000'))
+# Server-Timing: PERF_SERVER_TIMING=1 на каждом ответе, PERF_SERVER_TIMING_HEADER=1 разрешает X-Server-Timing: 1 для одного вызова
+SERVER_TIMING = os.environ.get('PERF_SERVER_TIMING') == '1'
+SERVER_TIMING_BY_HEADER = os.environ.get('PERF_SERVER_TIMING_HEADER') == '1'
+LOG_ENABLED = os.environ.get('PERF_LOG', '1') == '1'
+
+# cProfile: PERF_PROFILE=1 профилирует каждый вызов, PERF_PROFILE_HEADER=1 разрешает X-Profile: 1 для одного вызова
+PROFILE_ALWAYS = os.environ.get('PERF_PROFILE') == '1'
+PROFILE_BY_HEADER = os.environ.get('PERF_PROFILE_HEADER') == '1'
+PROFILE_DIR = os.environ.get('PERF_PROFILE_DIR', '')
+PROFILE_TOP = int(os.environ.get('PERF_PROFILE_TOP', '25'))
+
+# Запись входящих событий в JSONL для воспроизведения нагрузки (bench/replay.py)
+RECORD_PATH = os.environ.get('PERF_RECORD_PATH', '')
+RECORD_HEADERS = ('x-user-id',)
+SENSITIVE_KEYS = re.compile(r'pass|token|secret|auth', re.IGNORECASE)
+
+# Параметры запроса, по которым различаются логические маршруты внутри одного handler
+ROUTE_QUERY_KEYS = ('type', 'action', 'table', 'shipment_type', 'get_shipped', 'get_free_shipments')
+ROUTE_BODY_KEYS = ('type', 'free_shipment', 'ship_material', 'status', 'quantity_change', 'item_id')
+
+# Подписчики на записи о вызовах (бенчмарки, тесты): fn(record, stats)
+listeners: List[Callable[[Dict[str, Any], 'RouteStats'], None]] = []
+
+_record_lock = threading.Lock()
+
+_current_stats: ContextVar[Optional['RouteStats']] = ContextVar('perf_route_stats', default=None)
+
+
+class RouteStats:
+    def __init__(self, service: str, route: str):
+        self.service = service
+        self.route = route
+        self.queries = 0
+        self.rows = 0
+        self.db_ms = 0.0
+        self.statements: List[Dict[str, Any]] = []
+    
+    def record(self, query: Any, elapsed_ms: float, rows: int) -> None:
+        self.queries += 1
+        self.db_ms += elapsed_ms
+        if rows > 0:
+            self.rows += rows
+        sql = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+        self.statements.append({'sql': ' '.join(sql.split()), 'ms': round(elapsed_ms, 2), 'rows': rows})
+
+
+_cursor_classes: Dict[type, type] = {}
+
+
+def _instrumented_cursor_class(base: type) -> type:
+    """Subclass of any cursor class that reports each execute() to the current route"""
+    cls = _cursor_classes.get(base)
+    if cls is None:
+        def execute(self, query, vars=None):
+            stats = _current_stats.get()
+            if stats is None:
+                return base.execute(self, query, vars)
+            start = time.perf_counter()
+            try:
+                return base.execute(self, query, vars)
+            finally:
+                rows = self.rowcount if self.description is not None else 0
+                stats.record(query, (time.perf_counter() - start) * 1000, rows)
+        
+        cls = type(f'Instrumented{base.__name__}', (base,), {'execute': execute})
+        _cursor_classes[base] = cls
+    return cls
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _instrumented_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+
+def route_name(event: Dict[str, Any]) -> str:
+    method = event.get('httpMethod', 'GET')
+    params = event.get('queryStringParameters') or {}
+    parts = [method]
+    
+    for key in ROUTE_QUERY_KEYS:
+        if params.get(key):
+            parts.append(f"{key}={params[key]}" if key in ('type', 'action', 'table', 'shipment_type') else key)
+    if params.get('id'):
+        parts.append('id')
+    
+    if method in ('POST', 'PUT', 'PATCH') and event.get('body'):
+        try:
+            body = json.loads(event['body'])
+        except (TypeError, ValueError):
+            body = None
+        if isinstance(body, dict):
+            for key in ROUTE_BODY_KEYS:
+                if key in body:
+                    parts.append(f"body.{key}={body[key]}" if key == 'type' else f"body.{key}")
+    
+    return ' '.join(parts)
+
+
+def _sanitize(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: '***' if SENSITIVE_KEYS.search(str(k)) else _sanitize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_sanitize(v) for v in value]
+    return value
+
+
+def _record_event(service: str, event: Dict[str, Any], started_at: float, record: Dict[str, Any]) -> None:
+    """Append the event without secrets and with its outcome to RECORD_PATH"""
+    body = event.get('body')
+    if body:
+        try:
+            body = json.loads(body)
+        except (TypeError, ValueError):
+            body = None
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    line = json.dumps({
+        'ts': round(started_at, 6),
+        'service': service,
+        'method': event.get('httpMethod', 'GET'),
+        'query': _sanitize(event.get('queryStringParameters') or {}),
+        'body': _sanitize(body),
+        'headers': {k: headers[k] for k in RECORD_HEADERS if k in headers},
+        'route': record['route'],
+        'status': record['status'],
+        'wall_ms': record['wall_ms']
+    }, ensure_ascii=False, default=str)
+    with _record_lock:
+        with open(RECORD_PATH, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+def _wants_profile(event: Dict[str, Any]) -> bool:
+    if PROFILE_ALWAYS:
+        return True
+    if not PROFILE_BY_HEADER:
+        return False
+    headers = event.get('headers') or {}
+    return (headers.get('x-profile') or headers.get('X-Profile')) == '1'
+
+
+def _wants_server_timing(event: Dict[str, Any]) -> bool:
+    if SERVER_TIMING:
+        return True
+    if not SERVER_TIMING_BY_HEADER:
+        return False
+    headers = event.get('headers') or {}
+    return (headers.get('x-server-timing') or headers.get('X-Server-Timing')) == '1'
+
+
+def _dump_profile(profiler: cProfile.Profile, stats: RouteStats) -> None:
+    """Log the top functions by cumulative time and optionally write the raw .prof file"""
+    profile_stats = pstats.Stats(profiler)
+    top = sorted(profile_stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+    record: Dict[str, Any] = {
+        'profile': stats.service,
+        'route': stats.route,
+        'top': [
+            {
+                'function': f"{filename}:{line}({name})",
+                'calls': calls,
+                'tottime_ms': round(tottime * 1000, 3),
+                'cumtime_ms': round(cumtime * 1000, 3)
+            }
+            for (filename, line, name), (_, calls, tottime, cumtime, _) in top
+        ]
+    }
+    
+    if PROFILE_DIR:
+        slug = re.sub(r'[^A-Za-z0-9_.=-]+', '_', stats.route)
+        path = os.path.join(PROFILE_DIR, f"{stats.service}-{time.strftime('%Y%m%d-%H%M%S')}-{slug}.prof")
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(path)
+        record['stats_file'] = path
+    
+    print(json.dumps(record, ensure_ascii=False))
+
+
+def instrumented(service: str) -> Callable:
+    def decorate(handler: Callable) -> Callable:
+        @wraps(handler)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            stats = RouteStats(service, route_name(event))
+            token = _current_stats.set(stats)
+            profiler = cProfile.Profile() if _wants_profile(event) else None
+            started_at = time.time()
+            start = time.perf_counter()
+            try:
+                if profiler:
+                    response = profiler.runcall(handler, event, context)
+                else:
+                    response = handler(event, context)
+            finally:
+                _current_stats.reset(token)
+            wall_ms = (time.perf_counter() - start) * 1000
+            
+            if profiler:
+                _dump_profile(profiler, stats)
+            
+            body = response.get('body') or ''
+            record = {
+                'perf': service,
+                'route': stats.route,
+                'status': response.get('statusCode'),
+                'wall_ms': round(wall_ms, 2),
+                'db_ms': round(stats.db_ms, 2),
+                'queries': stats.queries,
+                'rows': stats.rows,
+                'response_bytes': len(body) if isinstance(body, (str, bytes)) else None
+            }
+            if wall_ms >= SLOW_ROUTE_MS:
+                record['slow'] = True
+                record['statements'] = sorted(stats.statements, key=lambda s: s['ms'], reverse=True)[:20]
+            if LOG_ENABLED:
+                print(json.dumps(record, ensure_ascii=False))
+            for listener in listeners:
+                listener(record, stats)
+            if RECORD_PATH:
+                _record_event(service, event, started_at, record)
+            
+            if _wants_server_timing(event):
+                response['headers'] = {
+                    **(response.get('headers') or {}),
+                    'Server-Timing': f"db;dur={stats.db_ms:.1f};desc=\"{stats.queries} queries\", app;dur={wall_ms - stats.db_ms:.1f}, total;dur={wall_ms:.1f}",
+                    'Timing-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'Server-Timing'
+                }
+            return response
+        
+        return wrapper
+    return decorate
@@ -0,0 +1,5 @@
+"""
+Business: Local benchmark harness for the cloud function handlers against a seeded Postgres
+Args: see bench/run.py (python -m bench.run --help)
+Returns: JSON report with per-route latency percentiles, throughput, query counts and peak memory
+"""
@@ -0,0 +1,178 @@
+"""
+Business: Compare the threaded and asyncio self-hosted servers under 50-500 concurrent polling clients
+Args: --dsn admin DSN (or BENCH_DATABASE_URL), --scale seeded order count, --clients levels, --duration per level
+Returns: JSON with requests, throughput, p50/p95/p99 latency and error count per mode and client count
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+
+from bench import db, seed
+from bench.run import _database_ready, _percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CLIENTS = '50,100,200,500'
+REQUEST_TIMEOUT = 30
+
+# Что опрашивают планшеты цеха и панели: открытые заказы, карточка заказа, доступность, склад
+PATHS = [
+    '/orders?status=new',
+    '/orders?id={order_id}',
+    '/orders?type=availability',
+    '/materials',
+    '/materials?type=color',
+]
+
+MODES = {
+    'threaded': lambda port, workers: [sys.executable, '-m', 'server', '--port', str(port),
+                                       '--workers', str(workers)],
+    'asyncio': lambda port, workers: [sys.executable, '-m', 'server.aio', '--port', str(port),
+                                      '--pool-max', str(workers), '--workers', '4'],
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def _get(port: int, path: str) -> int:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        await reader.readexactly(length)
+        return status
+    finally:
+        writer.close()
+
+
+async def _load(port: int, paths: List[str], clients: int, duration: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(n: int) -> None:
+        nonlocal errors
+        i = n
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(_get(port, path), REQUEST_TIMEOUT)
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                status = None
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status is None or status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(_percentile(latencies, 50), 3),
+        'p95_ms': round(_percentile(latencies, 95), 3),
+        'p99_ms': round(_percentile(latencies, 99), 3),
+    }
+
+
+def _wait_ready(port: int, proc: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'server exited with {proc.returncode}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def run_mode(mode: str, dsn: str, paths: List[str], levels: List[int], duration: float, workers: int,
+             log=lambda message: None) -> Dict[str, Any]:
+    port = _free_port()
+    env = {**os.environ, 'DATABASE_URL': dsn, 'PERF_LOG': '0'}
+    proc = subprocess.Popen(MODES[mode](port, workers), cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_ready(port, proc)
+        asyncio.run(_load(port, paths, 10, 1.0))
+        results = {}
+        for clients in levels:
+            log(f'{mode}: {clients} clients')
+            results[str(clients)] = asyncio.run(_load(port, paths, clients, duration))
+        return results
+    finally:
+        proc.terminate()
+        proc.wait(30)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Threaded vs asyncio server under concurrent clients')
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_DATABASE_URL'),
+                        help='admin DSN; the oms_bench_<scale> database is created and seeded if missing')
+    parser.add_argument('--scale', type=int, default=1000, help='orders in the seeded database')
+    parser.add_argument('--clients', default=DEFAULT_CLIENTS, help='comma separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per level')
+    parser.add_argument('--workers', type=int, default=16, help='threads (threaded) / asyncpg connections (asyncio)')
+    parser.add_argument('--mode', action='append', choices=sorted(MODES), help='run only this mode')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    if not args.dsn:
+        parser.error('--dsn or BENCH_DATABASE_URL is required')
+
+    dsn = db.database_dsn(args.dsn, f'oms_bench_{args.scale}')
+    if not _database_ready(dsn, args.scale):
+        dsn = db.create_database(args.dsn, f'oms_bench_{args.scale}')
+        seed.seed(dsn, args.scale)
+
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute("SELECT MIN(id) FROM orders WHERE status = 'in_progress'")
+    order_id = cur.fetchone()[0]
+    conn.close()
+    paths = [path.format(order_id=order_id) for path in PATHS]
+
+    levels = [int(n) for n in args.clients.split(',') if n.strip()]
+    log = lambda message: print(message, file=sys.stderr)
+    report = {
+        'meta': {'scale': args.scale, 'duration_s': args.duration, 'workers': args.workers, 'paths': paths},
+        'modes': {mode: run_mode(mode, dsn, paths, levels, args.duration, args.workers, log)
+                  for mode in (args.mode or sorted(MODES))},
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
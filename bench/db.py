@@ -0,0 +1,67 @@
+"""
+Business: Create a scratch database and apply db_migrations the way the platform does
+Args: admin DSN of a local Postgres (any database the user may CREATE DATABASE from)
+Returns: DSN of the migrated database, search_path set to the application schema
+"""
+
+import glob
+import os
+from typing import List
+from urllib.parse import urlsplit, urlunsplit
+import psycopg2
+
+SCHEMA = 't_p435659_order_management_sys'
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db_migrations')
+
+
+def database_dsn(admin_dsn: str, dbname: str) -> str:
+    """Same server and credentials as admin_dsn, different database"""
+    parts = urlsplit(admin_dsn)
+    return urlunsplit((parts.scheme, parts.netloc, f'/{dbname}', parts.query, parts.fragment))
+
+
+def migration_files() -> List[str]:
+    return sorted(glob.glob(os.path.join(MIGRATIONS_DIR, 'V*.sql')))
+
+
+def create_database(admin_dsn: str, dbname: str) -> str:
+    """Drop and recreate `dbname`, apply every migration in order, return its DSN"""
+    admin = psycopg2.connect(admin_dsn)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS "{dbname}"')
+        cur.execute(f'CREATE DATABASE "{dbname}"')
+    admin.close()
+
+    dsn = database_dsn(admin_dsn, dbname)
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        # Часть миграций ссылается на схему явно, часть - через search_path
+        cur.execute(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA}')
+        cur.execute(f'ALTER DATABASE "{dbname}" SET search_path = {SCHEMA}')
+        cur.execute(f'SET search_path = {SCHEMA}')
+        for path in migration_files():
+            with open(path, encoding='utf-8') as f:
+                cur.execute(f.read())
+        # Последняя применённая миграция: засеянную базу переиспользуют, только пока она совпадает
+        cur.execute(f'COMMENT ON SCHEMA {SCHEMA} IS %s', (latest_migration(),))
+    conn.close()
+    return dsn
+
+
+def latest_migration() -> str:
+    return os.path.basename(migration_files()[-1])
+
+
+def applied_migration(cur) -> str:
+    cur.execute('SELECT obj_description(%s::regnamespace)', (SCHEMA,))
+    return cur.fetchone()[0]
+
+
+def drop_database(admin_dsn: str, dbname: str) -> None:
+    admin = psycopg2.connect(admin_dsn)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS "{dbname}"')
+    admin.close()
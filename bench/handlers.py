@@ -0,0 +1,55 @@
+"""
+Business: Load backend/<fn>/index.py as a standalone module, the way the platform imports each function
+Args: function directory name (auth, users, orders, materials, schedule)
+Returns: Function with the handler module and its own copy of perf.py
+"""
+
+import importlib.util
+import json
+import os
+import sys
+from types import ModuleType
+from typing import Any, Dict, NamedTuple, Optional
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+SERVICES = ('auth', 'users', 'orders', 'materials', 'schedule')
+# Модули, которые лежат копией в нескольких функциях и не должны переиспользоваться между ними
+SHARED_MODULES = ('perf', 'responses', 'stock')
+
+
+class Function(NamedTuple):
+    service: str
+    module: ModuleType
+    perf: ModuleType
+
+
+def load(service: str) -> Function:
+    """Import the function's index.py with its directory first on sys.path"""
+    function_dir = os.path.join(BACKEND_DIR, service)
+    for name in SHARED_MODULES:
+        sys.modules.pop(name, None)
+    sys.path.insert(0, function_dir)
+    try:
+        spec = importlib.util.spec_from_file_location(f'bench_fn_{service}', os.path.join(function_dir, 'index.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        perf = sys.modules['perf']
+    finally:
+        sys.path.remove(function_dir)
+        for name in SHARED_MODULES:
+            sys.modules.pop(name, None)
+    return Function(service, module, perf)
+
+
+def event(method: str, query: Optional[Dict[str, str]] = None, body: Any = None,
+          headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """API gateway event as the platform delivers it"""
+    result = {
+        'httpMethod': method,
+        'queryStringParameters': query or {},
+        'headers': headers or {},
+        'isBase64Encoded': False,
+    }
+    if body is not None:
+        result['body'] = json.dumps(body, ensure_ascii=False)
+    return result
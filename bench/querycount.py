@@ -0,0 +1,35 @@
+"""
+Business: Count the SQL statements a handler call executes through psycopg2
+Args: Function from bench.handlers and a gateway event
+Returns: handler response and the perf.RouteStats of that call (queries, statements with sql/ms/rows)
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+from bench.handlers import Function
+
+
+@contextmanager
+def capture(function: Function) -> Iterator[List[Any]]:
+    """Collect RouteStats of every handler call made inside the block"""
+    calls: List[Any] = []
+    listener = lambda record, stats: calls.append(stats)
+    function.perf.listeners.append(listener)
+    try:
+        yield calls
+    finally:
+        function.perf.listeners.remove(listener)
+
+
+def count_queries(function: Function, event: Dict[str, Any]) -> Tuple[Dict[str, Any], Any]:
+    with capture(function) as calls:
+        response = function.module.handler(event, None)
+    return response, calls[-1]
+
+
+def repeated_statements(stats: Any, limit: int = 5) -> List[Tuple[str, int]]:
+    """Most frequent statements of a call - the usual N+1 suspects"""
+    counter = Counter(statement['sql'] for statement in stats.statements)
+    return [(sql, count) for sql, count in counter.most_common(limit) if count > 1]
@@ -0,0 +1,152 @@
+"""
+Business: Replay recorded handler traffic (PERF_RECORD_PATH JSONL) against a local database at original or scaled pacing
+Args: recording file, --database-url for the handlers, --speed time compression, --copies parallel copies of each event,
+      --workers concurrent calls, --output report file
+Returns: JSON with per-route and overall latency percentiles, error rates and dispatch lag
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault('PERF_LOG', '0')
+# Воспроизводимый трафик не должен снова попадать в запись
+os.environ.pop('PERF_RECORD_PATH', None)
+
+from bench.handlers import SERVICES, event, load
+from bench.run import _percentile
+
+
+def read_recording(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return sorted(entries, key=lambda entry: entry['ts'])
+
+
+def _to_event(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return event(entry['method'], entry.get('query') or {}, entry.get('body'), entry.get('headers') or {})
+
+
+def _distribution(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    latencies = [s['wall_ms'] for s in samples]
+    original = [s['original_ms'] for s in samples if s['original_ms'] is not None]
+    server_errors = sum(1 for s in samples if s['status'] is None or s['status'] >= 500)
+    client_errors = sum(1 for s in samples if s['status'] is not None and 400 <= s['status'] < 500)
+    return {
+        'requests': len(samples),
+        'p50_ms': round(_percentile(latencies, 50), 3),
+        'p95_ms': round(_percentile(latencies, 95), 3),
+        'p99_ms': round(_percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies), 3),
+        'recorded_p95_ms': round(_percentile(original, 95), 3) if original else None,
+        'error_rate': round(server_errors / len(samples), 4),
+        'client_error_rate': round(client_errors / len(samples), 4),
+        'status_changed': sum(1 for s in samples if s['original_status'] is not None
+                              and s['status'] != s['original_status']),
+    }
+
+
+def replay(entries: List[Dict[str, Any]], speed: float, copies: int, workers: int,
+           log=lambda message: None) -> Dict[str, Any]:
+    functions = {service: load(service) for service in SERVICES}
+    samples: List[Dict[str, Any]] = []
+    samples_lock = threading.Lock()
+
+    def issue(entry: Dict[str, Any], due: float) -> None:
+        lag_ms = (time.perf_counter() - due) * 1000
+        start = time.perf_counter()
+        try:
+            status = functions[entry['service']].module.handler(_to_event(entry), None).get('statusCode')
+        except Exception as e:
+            log(f"{entry.get('route')}: {e!r}")
+            status = None
+        sample = {
+            'route': f"{entry['service']} {entry.get('route', entry['method'])}",
+            'status': status,
+            'wall_ms': (time.perf_counter() - start) * 1000,
+            'lag_ms': max(lag_ms, 0.0),
+            'original_status': entry.get('status'),
+            'original_ms': entry.get('wall_ms'),
+        }
+        with samples_lock:
+            samples.append(sample)
+
+    first_ts = entries[0]['ts']
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for entry in entries:
+            due = started + (entry['ts'] - first_ts) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            for _ in range(copies):
+                pool.submit(issue, entry, due)
+    elapsed = time.perf_counter() - started
+
+    by_route: Dict[str, List[Dict[str, Any]]] = {}
+    for sample in samples:
+        by_route.setdefault(sample['route'], []).append(sample)
+    lags = [s['lag_ms'] for s in samples]
+    return {
+        'overall': {
+            **_distribution(samples),
+            'duration_s': round(elapsed, 3),
+            'recorded_duration_s': round(entries[-1]['ts'] - first_ts, 3),
+            'throughput_rps': round(len(samples) / elapsed, 2) if elapsed > 0 else None,
+            # Задержка старта относительно расписания: растёт, когда пул не успевает
+            'lag_p95_ms': round(_percentile(lags, 95), 3),
+        },
+        'routes': {route: _distribution(route_samples) for route, route_samples in sorted(by_route.items())},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Replay recorded handler traffic against a local database')
+    parser.add_argument('recording', help='JSONL written by handlers with PERF_RECORD_PATH set')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='database the handlers connect to (a restored copy, never production)')
+    parser.add_argument('--speed', type=float, default=1.0, help='time compression: 2 replays an hour in 30 minutes')
+    parser.add_argument('--copies', type=int, default=1, help='issue every event this many times')
+    parser.add_argument('--workers', type=int, default=32, help='concurrent handler calls')
+    parser.add_argument('--service', action='append', choices=SERVICES, help='replay only these functions')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    if args.speed <= 0 or args.copies < 1:
+        parser.error('--speed must be positive and --copies at least 1')
+    os.environ['DATABASE_URL'] = args.database_url
+
+    entries = read_recording(args.recording)
+    if args.service:
+        entries = [entry for entry in entries if entry['service'] in args.service]
+    if not entries:
+        parser.error('nothing to replay')
+
+    report = {
+        'meta': {
+            'recording': os.path.abspath(args.recording),
+            'events': len(entries),
+            'speed': args.speed,
+            'copies': args.copies,
+            'workers': args.workers,
+        },
+        **replay(entries, args.speed, args.copies, args.workers, lambda message: print(message, file=sys.stderr)),
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""
+Business: Benchmark every handler route against a seeded local Postgres and report per-route metrics as JSON
+Args: --dsn admin DSN (or BENCH_DATABASE_URL), --scales order counts, --iterations per route, --output file,
+      --compare previous report to flag regressions
+Returns: JSON with p50/p95/p99 latency, throughput, query counts, response size and peak memory per route
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# Логи perf в stdout только мешают замерам; слушатели при этом продолжают работать
+os.environ.setdefault('PERF_LOG', '0')
+
+import psycopg2
+
+from bench import db, seed
+from bench.handlers import SERVICES, Function, event, load
+
+DEFAULT_SCALES = '1000,10000,100000'
+WARMUP = 2
+
+
+class Scenario(NamedTuple):
+    route: str
+    service: str
+    build: Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def _month_bounds(today: date) -> Dict[str, str]:
+    last_month = today.replace(day=1) - timedelta(days=1)
+    year_ago = today.replace(day=1) - timedelta(days=335)
+    return {
+        'month': str(last_month.month),
+        'year': str(last_month.year),
+        'from': year_ago.strftime('%Y-%m'),
+        'to': today.strftime('%Y-%m'),
+    }
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario('auth POST login', 'auth',
+             lambda c: event('POST', body={'login': 'user1', 'password': 'pass1'})),
+    Scenario('users GET list', 'users', lambda c: event('GET')),
+    Scenario('users GET id', 'users', lambda c: event('GET', {'id': str(c['user_id'])})),
+
+    Scenario('orders GET list', 'orders', lambda c: event('GET')),
+    Scenario('orders GET list status=new', 'orders', lambda c: event('GET', {'status': 'new'})),
+    Scenario('orders GET id', 'orders', lambda c: event('GET', {'id': str(c['order_id'])})),
+    Scenario('orders GET requests', 'orders', lambda c: event('GET', {'type': 'requests'})),
+    Scenario('orders GET get_shipped', 'orders', lambda c: event('GET', {'get_shipped': 'true'})),
+    Scenario('orders GET get_free_shipments', 'orders', lambda c: event('GET', {'get_free_shipments': 'true'})),
+    Scenario('orders GET shortage', 'orders', lambda c: event('GET', {'type': 'shortage'})),
+    Scenario('orders GET availability', 'orders', lambda c: event('GET', {'type': 'availability'})),
+    Scenario('orders PUT item progress', 'orders',
+             lambda c: event('PUT', body={'id': c['order_id'], 'item_id': c['item_id'],
+                                          'quantity_completed': c['item_completed']})),
+
+    Scenario('materials GET list', 'materials', lambda c: event('GET')),
+    Scenario('materials GET id', 'materials', lambda c: event('GET', {'id': str(c['material_id'])})),
+    Scenario('materials GET section', 'materials', lambda c: event('GET', {'type': 'section'})),
+    Scenario('materials GET color', 'materials', lambda c: event('GET', {'type': 'color'})),
+    Scenario('materials GET forecast', 'materials', lambda c: event('GET', {'type': 'forecast'})),
+    Scenario('materials GET stock_as_of', 'materials',
+             lambda c: event('GET', {'type': 'stock_as_of', 'at': c['as_of']})),
+
+    Scenario('schedule GET employees', 'schedule', lambda c: event('GET', {'type': 'employees'})),
+    Scenario('schedule GET month', 'schedule',
+             lambda c: event('GET', {'month': c['month'], 'year': c['year'],
+                                     'employee_ids': ','.join(map(str, c['employee_ids']))})),
+    Scenario('schedule GET range', 'schedule',
+             lambda c: event('GET', {'from': c['from'], 'to': c['to'], 'days': 'false'})),
+    Scenario('schedule POST bulk', 'schedule',
+             lambda c: event('POST', body={'type': 'bulk', 'cells': c['bulk_cells']})),
+]
+
+
+def _context(dsn: str) -> Dict[str, Any]:
+    """Ids and dates the scenarios point at, picked deterministically from the seeded data"""
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute("SELECT MIN(id) FROM users WHERE login <> 'admin'")
+    user_id = cur.fetchone()[0]
+    cur.execute("SELECT MIN(id) FROM materials")
+    material_id = cur.fetchone()[0]
+    cur.execute(
+        """SELECT oi.order_id, oi.id, oi.quantity_completed
+           FROM order_items oi JOIN orders o ON o.id = oi.order_id
+           WHERE o.status = 'in_progress' AND oi.quantity_completed > 0
+           ORDER BY oi.id LIMIT 1"""
+    )
+    order_id, item_id, item_completed = cur.fetchone()
+    cur.execute("SELECT id FROM timesheet_employees ORDER BY id")
+    employee_ids = [row[0] for row in cur.fetchall()]
+    conn.close()
+
+    today = date.today()
+    first_day = today.replace(day=1)
+    return {
+        'user_id': user_id,
+        'material_id': material_id,
+        'order_id': order_id,
+        'item_id': item_id,
+        'item_completed': float(item_completed),
+        'as_of': datetime.now().isoformat(),
+        'employee_ids': employee_ids,
+        'bulk_cells': [
+            {'employee_id': eid, 'work_date': (first_day + timedelta(days=d)).isoformat(), 'hours': 8}
+            for eid in employee_ids[:5] for d in range(5)
+        ],
+        **_month_bounds(today),
+    }
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def _measure(function: Function, scenario_event: Dict[str, Any], iterations: int) -> Dict[str, Any]:
+    records: List[Dict[str, Any]] = []
+    listener = lambda record, stats: records.append(record)
+    function.perf.listeners.append(listener)
+    try:
+        for _ in range(WARMUP):
+            function.module.handler(dict(scenario_event), None)
+        records.clear()
+
+        timings = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            function.module.handler(dict(scenario_event), None)
+            timings.append((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - started
+
+        # Память меряем отдельным вызовом: tracemalloc заметно замедляет код
+        tracemalloc.start()
+        function.module.handler(dict(scenario_event), None)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        function.perf.listeners.remove(listener)
+
+    measured = records[:iterations]
+    queries = [r['queries'] for r in measured]
+    return {
+        'status': sorted({r['status'] for r in measured}),
+        'iterations': iterations,
+        'p50_ms': round(_percentile(timings, 50), 3),
+        'p95_ms': round(_percentile(timings, 95), 3),
+        'p99_ms': round(_percentile(timings, 99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'db_ms_p50': round(_percentile([r['db_ms'] for r in measured], 50), 3),
+        'throughput_rps': round(iterations / elapsed, 2),
+        'queries': max(queries),
+        'queries_min': min(queries),
+        'rows': max(r['rows'] for r in measured),
+        'response_bytes': max(r['response_bytes'] or 0 for r in measured),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def _database_ready(dsn: str, orders: int) -> bool:
+    try:
+        conn = psycopg2.connect(dsn)
+    except psycopg2.OperationalError:
+        return False
+    try:
+        cur = conn.cursor()
+        if db.applied_migration(cur) != db.latest_migration():
+            return False
+        cur.execute("SELECT COUNT(*) FROM orders")
+        return cur.fetchone()[0] == orders
+    except psycopg2.Error:
+        return False
+    finally:
+        conn.close()
+
+
+def run_scale(admin_dsn: str, orders: int, iterations: int, reuse: bool,
+              routes: Optional[List[str]], log: Callable[[str], None]) -> Dict[str, Any]:
+    dbname = f'oms_bench_{orders}'
+    dsn = db.database_dsn(admin_dsn, dbname)
+    counts = None
+    if not (reuse and _database_ready(dsn, orders)):
+        log(f'[{orders}] migrating {dbname}')
+        dsn = db.create_database(admin_dsn, dbname)
+        log(f'[{orders}] seeding')
+        counts = seed.seed(dsn, orders)
+
+    os.environ['DATABASE_URL'] = dsn
+    # Модули грузим заново на каждый масштаб, чтобы кэши уровня модуля не переносились между базами
+    functions = {service: load(service) for service in SERVICES}
+    context = _context(dsn)
+
+    results = {}
+    for scenario in SCENARIOS:
+        if routes and scenario.route not in routes:
+            continue
+        log(f'[{orders}] {scenario.route}')
+        results[scenario.route] = _measure(functions[scenario.service], scenario.build(context), iterations)
+    return {'orders': orders, 'rows': counts, 'routes': results}
+
+
+def _git_revision() -> Dict[str, Any]:
+    root = os.path.dirname(db.MIGRATIONS_DIR)
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Routes whose p50/p95 grew by more than `threshold` or that now run more queries"""
+    regressions = []
+    for scale, report in current['scales'].items():
+        before = previous.get('scales', {}).get(scale, {}).get('routes', {})
+        for route, now in report['routes'].items():
+            was = before.get(route)
+            if not was:
+                continue
+            for key in ('p50_ms', 'p95_ms'):
+                if was[key] > 0 and now[key] > was[key] * (1 + threshold):
+                    regressions.append(f'{scale} {route}: {key} {was[key]} -> {now[key]}')
+            if now['queries'] > was['queries']:
+                regressions.append(f"{scale} {route}: queries {was['queries']} -> {now['queries']}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark backend handlers against a seeded Postgres')
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_DATABASE_URL'),
+                        help='admin DSN used to create oms_bench_<scale> databases')
+    parser.add_argument('--scales', default=DEFAULT_SCALES, help='comma separated order counts')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--route', action='append', help='run only this route (repeatable)')
+    parser.add_argument('--reuse', action='store_true', help='keep an already seeded database of the same scale')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='previous JSON report; exit 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed latency growth for --compare')
+    args = parser.parse_args(argv)
+
+    if not args.dsn:
+        parser.error('--dsn or BENCH_DATABASE_URL is required')
+
+    log = lambda message: print(message, file=sys.stderr)
+    conn = psycopg2.connect(args.dsn)
+    server_version = conn.server_version
+    conn.close()
+
+    report = {
+        'meta': {
+            **_git_revision(),
+            'python': platform.python_version(),
+            'postgres': server_version,
+            'iterations': args.iterations,
+            'warmup': WARMUP,
+        },
+        'scales': {},
+    }
+    for orders in [int(s) for s in args.scales.split(',') if s.strip()]:
+        report['scales'][str(orders)] = run_scale(args.dsn, orders, args.iterations, args.reuse, args.route, log)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for line in regressions:
+            log(f'REGRESSION {line}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+Business: Deterministic synthetic data for benchmarks - orders with items, materials, colors, shipments and timesheets
+Args: DSN of a migrated database and the number of orders to generate
+Returns: Row counts per table
+"""
+
+from typing import Dict
+import psycopg2
+
+COLORS = 20
+ITEMS_PER_ORDER = 3
+TIMESHEET_EMPLOYEES = 40
+TIMESHEET_DAYS = 365
+USERS = 25
+
+
+def _scaled(orders: int) -> Dict[str, int]:
+    return {
+        'materials': max(50, orders // 50),
+        'requests': max(20, orders // 10),
+        'shipments': max(100, orders // 2),
+        'history': max(500, orders * 2),
+    }
+
+
+def seed(dsn: str, orders: int) -> Dict[str, int]:
+    """Fill every table the handlers read; same `orders` always gives the same data"""
+    sizes = _scaled(orders)
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute('SELECT setseed(0.38)')
+
+    cur.execute(
+        """INSERT INTO users (login, password, role, full_name)
+           SELECT 'user' || g, 'pass' || g,
+                  (ARRAY['manager', 'supervisor', 'worker'])[1 + g %% 3],
+                  'Сотрудник ' || g
+           FROM generate_series(1, %s) g""",
+        (USERS,)
+    )
+    cur.execute(
+        """INSERT INTO colors (name, hex_code)
+           SELECT 'Цвет ' || g, '#' || lpad(to_hex(g * 797161 %% 16777216), 6, '0')
+           FROM generate_series(1, %s) g""",
+        (COLORS,)
+    )
+    cur.execute(
+        """INSERT INTO material_sections (name, description)
+           SELECT 'Раздел ' || g, NULL FROM generate_series(1, 5) g"""
+    )
+    cur.execute(
+        """INSERT INTO materials (name, size, quantity, material_type, section_id,
+                                  auto_deduct, manual_deduct, defect_tracking)
+           SELECT 'Материал ' || g, (1000 + g %% 7 * 250)::text || 'x' || (500 + g %% 5 * 100),
+                  0, (ARRAY['профиль', 'сетка', 'отлив'])[1 + g %% 3],
+                  (SELECT MIN(id) FROM material_sections) + g %% 5,
+                  g %% 4 <> 0, true, g %% 3 = 0
+           FROM generate_series(1, %s) g""",
+        (sizes['materials'],)
+    )
+    # У каждого материала 4 цвета из палитры
+    cur.execute(
+        """INSERT INTO material_colors (material_id, color_id)
+           SELECT m.id, c.id
+           FROM materials m
+           JOIN colors c ON (c.id + m.id) % 5 = 0"""
+    )
+    cur.execute(
+        """INSERT INTO material_color_inventory (material_id, color_id, quantity)
+           SELECT material_id, color_id, (random() * 2000)::int
+           FROM material_colors"""
+    )
+    cur.execute(
+        """UPDATE materials m SET quantity = s.total
+           FROM (SELECT material_id, SUM(quantity) as total
+                 FROM material_color_inventory GROUP BY material_id) s
+           WHERE s.material_id = m.id"""
+    )
+
+    cur.execute(
+        """INSERT INTO orders (order_number, status, created_by, section_id, comment, auto_deduct,
+                               created_at, completed_at, shipped_at)
+           SELECT 'B-' || lpad(g::text, 7, '0'), st.status,
+                  (SELECT MIN(id) FROM users) + g %% %s,
+                  (SELECT MIN(id) FROM sections) + g %% 4,
+                  CASE WHEN g %% 10 = 0 THEN 'Срочно' END,
+                  g %% 5 <> 0,
+                  ts.created_at,
+                  CASE WHEN st.status IN ('completed', 'shipped') THEN ts.created_at + interval '2 days' END,
+                  CASE WHEN st.status = 'shipped' THEN ts.created_at + interval '3 days' END
+           FROM generate_series(1, %s) g
+           CROSS JOIN LATERAL (
+               SELECT (ARRAY['new', 'in_progress', 'completed', 'shipped', 'shipped'])[1 + g %% 5] as status
+           ) st
+           CROSS JOIN LATERAL (
+               SELECT NOW() - (g::float / %s * interval '365 days') as created_at
+           ) ts""",
+        (USERS, orders, orders)
+    )
+    cur.execute(
+        """INSERT INTO order_items (order_id, material_id, color_id, size,
+                                    quantity_required, quantity_completed, created_at)
+           SELECT o.id, mc.material_id, mc.color_id, m.size, q.required,
+                  CASE o.status WHEN 'new' THEN 0
+                                WHEN 'in_progress' THEN floor(q.required / 2)
+                                ELSE q.required END,
+                  o.created_at
+           FROM orders o
+           CROSS JOIN generate_series(1, %s) i
+           CROSS JOIN LATERAL (
+               SELECT material_id, color_id FROM material_colors
+               WHERE id = 1 + (o.id * 7 + i * 131) %% (SELECT COUNT(*) FROM material_colors)
+           ) mc
+           JOIN materials m ON m.id = mc.material_id
+           CROSS JOIN LATERAL (SELECT 1 + (o.id * i) %% 40 as required) q""",
+        (ITEMS_PER_ORDER,)
+    )
+    cur.execute(
+        """INSERT INTO shipped_orders (order_id, material_id, color_id, quantity, is_defective,
+                                       shipped_at, shipped_by)
+           SELECT oi.order_id, oi.material_id, oi.color_id, oi.quantity_required::int,
+                  oi.id % 25 = 0, o.shipped_at, o.created_by
+           FROM order_items oi
+           JOIN orders o ON o.id = oi.order_id
+           WHERE o.status = 'shipped'"""
+    )
+    cur.execute(
+        """INSERT INTO free_shipments (material_id, color_id, quantity, is_defective, shipped_by,
+                                       comment, shipped_at)
+           SELECT mc.material_id, mc.color_id, 1 + g %% 30, g %% 20 = 0,
+                  (SELECT MIN(id) FROM users) + g %% %s, NULL,
+                  NOW() - (g::float / %s * interval '365 days')
+           FROM generate_series(1, %s) g
+           JOIN material_colors mc ON mc.id = 1 + g %% (SELECT COUNT(*) FROM material_colors)""",
+        (USERS, sizes['shipments'], sizes['shipments'])
+    )
+    cur.execute(
+        """INSERT INTO shipments (material_id, color_id, quantity, recipient, shipped_at)
+           SELECT mc.material_id, mc.color_id, 1 + g %% 50, 'Клиент ' || g %% 100,
+                  NOW() - (g::float / %s * interval '365 days')
+           FROM generate_series(1, %s) g
+           JOIN material_colors mc ON mc.id = 1 + (g * 3) %% (SELECT COUNT(*) FROM material_colors)""",
+        (sizes['shipments'], sizes['shipments'])
+    )
+    cur.execute(
+        """INSERT INTO material_history (material_id, user_id, quantity_change, action_type, created_at)
+           SELECT m.id, (SELECT MIN(id) FROM users) + g %% %s,
+                  CASE WHEN g %% 6 = 0 THEN 200 ELSE -(1 + g %% 25) END,
+                  CASE WHEN g %% 6 = 0 THEN 'add' ELSE 'deduct' END,
+                  NOW() - (g::float / %s * interval '365 days')
+           FROM generate_series(1, %s) g
+           JOIN materials m ON m.id = (SELECT MIN(id) FROM materials) + g %% %s""",
+        (USERS, sizes['history'], sizes['history'], sizes['materials'])
+    )
+
+    cur.execute(
+        """INSERT INTO requests (request_number, section_id, status, created_by, created_at)
+           SELECT 'R-' || lpad(g::text, 6, '0'), (SELECT MIN(id) FROM sections) + g %% 4,
+                  (ARRAY['new', 'in_progress', 'completed'])[1 + g %% 3],
+                  (SELECT MIN(id) FROM users) + g %% %s,
+                  NOW() - (g::float / %s * interval '365 days')
+           FROM generate_series(1, %s) g""",
+        (USERS, sizes['requests'], sizes['requests'])
+    )
+    cur.execute(
+        """INSERT INTO request_items (request_id, material_name, quantity_required, quantity_completed,
+                                      color, size)
+           SELECT r.id, 'Материал ' || (r.id * i %% 97), 10 * i, CASE r.status WHEN 'new' THEN 0 ELSE 5 * i END,
+                  'Цвет ' || (1 + (r.id + i) %% %s), NULL
+           FROM requests r CROSS JOIN generate_series(1, 3) i""",
+        (COLORS,)
+    )
+
+    cur.execute(
+        """INSERT INTO timesheet_employees (full_name)
+           SELECT 'Работник ' || lpad(g::text, 3, '0') FROM generate_series(1, %s) g""",
+        (TIMESHEET_EMPLOYEES,)
+    )
+    cur.execute(
+        """SELECT ensure_time_tracking_partition(y::int)
+           FROM generate_series(
+               EXTRACT(YEAR FROM CURRENT_DATE - %s)::int, EXTRACT(YEAR FROM CURRENT_DATE)::int + 1
+           ) y""",
+        (TIMESHEET_DAYS,)
+    )
+    cur.execute(
+        """INSERT INTO time_tracking (employee_id, work_date, hours)
+           SELECT e.id, d::date, (ARRAY[8, 8, 8, 10, 12, 4])[1 + (e.id + d::date - DATE '2000-01-01') %% 6]
+           FROM timesheet_employees e
+           CROSS JOIN generate_series(CURRENT_DATE - %s, CURRENT_DATE - 1, interval '1 day') d
+           WHERE EXTRACT(ISODOW FROM d) < 6""",
+        (TIMESHEET_DAYS,)
+    )
+
+    # Резервы пересчитываем так же, как POST ?type=reservations&action=rebuild
+    cur.execute(
+        """INSERT INTO material_reservations (material_id, color_id, reserved_quantity)
+           SELECT oi.material_id, oi.color_id, SUM(oi.quantity_required)
+           FROM order_items oi
+           JOIN orders o ON o.id = oi.order_id
+           WHERE o.status <> 'shipped' AND oi.material_id IS NOT NULL
+           GROUP BY oi.material_id, oi.color_id"""
+    )
+    # Дневные итоги отгрузок - как POST ?type=shipment_rollups&action=rebuild
+    cur.execute(
+        """INSERT INTO shipment_daily_rollups (day, source, material_id, color_id, is_defective, shipment_count, quantity)
+           SELECT shipped_at::date, source, material_id, color_id, is_defective, COUNT(*), SUM(quantity)
+           FROM (
+               SELECT 'order' as source, material_id, color_id, quantity, COALESCE(is_defective, false) as is_defective, shipped_at
+               FROM shipped_orders
+               UNION ALL
+               SELECT 'free', material_id, color_id, quantity, COALESCE(is_defective, false), shipped_at
+               FROM free_shipments
+               UNION ALL
+               SELECT 'warehouse', material_id, color_id, quantity, false, shipped_at
+               FROM shipments
+           ) s
+           WHERE shipped_at IS NOT NULL
+           GROUP BY shipped_at::date, source, material_id, color_id, is_defective"""
+    )
+    conn.commit()
+
+    counts = {}
+    for table in ['users', 'colors', 'materials', 'material_colors', 'orders', 'order_items',
+                  'shipped_orders', 'free_shipments', 'shipments', 'material_history',
+                  'requests', 'request_items', 'timesheet_employees', 'time_tracking']:
+        cur.execute(f'SELECT COUNT(*) FROM {table}')
+        counts[table] = cur.fetchone()[0]
+    conn.commit()
+
+    conn.autocommit = True
+    cur.execute('VACUUM ANALYZE')
+    cur.close()
+    conn.close()
+    return counts
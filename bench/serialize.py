@@ -0,0 +1,123 @@
+"""
+Business: Measure CPU time of response serialization on the largest lists - legacy dict copies + json.dumps(default=str)
+          against responses.json_body (orjson, and its stdlib fallback)
+Args: --dsn admin DSN (or BENCH_DATABASE_URL), --scale seeded order count, --iterations per encoder, --output file
+Returns: JSON with CPU ms per call, body size and speedup per route and encoder
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+os.environ.setdefault('PERF_LOG', '0')
+
+from bench import db, seed
+from bench.handlers import load
+from bench.run import SCENARIOS, _context, _database_ready
+
+# Самые большие ответы: списки заказов с позициями, отгрузки, материалы с цветами и остатками
+ROUTES = [
+    'orders GET list',
+    'orders GET list status=new',
+    'orders GET get_shipped',
+    'orders GET get_free_shipments',
+    'orders GET requests',
+    'materials GET list',
+]
+
+
+def _copy_rows(value: Any) -> Any:
+    """What the handlers used to do before serializing: dict(row) for every row and nested item"""
+    if isinstance(value, dict):
+        return {key: _copy_rows(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_rows(item) for item in value]
+    return value
+
+
+def _payload(function: Any, event: Dict[str, Any]) -> Any:
+    """Object the handler passes to json_body for this event"""
+    captured: List[Any] = []
+    encode = function.module.json_body
+    function.module.json_body = lambda payload: captured.append(payload) or encode(payload)
+    try:
+        function.module.handler(event, None)
+    finally:
+        function.module.json_body = encode
+    return captured[-1]
+
+
+def _cpu_ms(encode: Callable[[Any], Any], payload: Any, iterations: int) -> float:
+    encode(payload)
+    start = time.process_time()
+    for _ in range(iterations):
+        encode(payload)
+    return (time.process_time() - start) * 1000 / iterations
+
+
+def run(dsn: str, iterations: int, routes: List[str], log=lambda message: None) -> Dict[str, Any]:
+    os.environ['DATABASE_URL'] = dsn
+    context = _context(dsn)
+    functions: Dict[str, Any] = {}
+    results = {}
+    for scenario in SCENARIOS:
+        if scenario.route not in routes:
+            continue
+        log(scenario.route)
+        function = functions.setdefault(scenario.service, load(scenario.service))
+        # responses.py функции (её копия не остаётся в sys.modules): запасной путь без orjson
+        default = function.module.json_body.__globals__['_default']
+        encoders = {
+            'legacy': lambda payload: json.dumps(_copy_rows(payload), default=str),
+            'stdlib': lambda payload: json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=default),
+            'json_body': function.module.json_body,
+        }
+        payload = _payload(function, scenario.build(context))
+        route = {}
+        for name, encode in encoders.items():
+            route[name] = {
+                'cpu_ms': round(_cpu_ms(encode, payload, iterations), 3),
+                'bytes': len(encode(payload).encode('utf-8')),
+            }
+        route['speedup'] = round(route['legacy']['cpu_ms'] / route['json_body']['cpu_ms'], 2) \
+            if route['json_body']['cpu_ms'] else None
+        results[scenario.route] = route
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='CPU time of response serialization on the largest lists')
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_DATABASE_URL'),
+                        help='admin DSN; the oms_bench_<scale> database is created and seeded if missing')
+    parser.add_argument('--scale', type=int, default=10000, help='orders in the seeded database')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--route', action='append', choices=ROUTES, help='measure only this route')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    if not args.dsn:
+        parser.error('--dsn or BENCH_DATABASE_URL is required')
+
+    dsn = db.database_dsn(args.dsn, f'oms_bench_{args.scale}')
+    if not _database_ready(dsn, args.scale):
+        dsn = db.create_database(args.dsn, f'oms_bench_{args.scale}')
+        seed.seed(dsn, args.scale)
+
+    report = {
+        'meta': {'scale': args.scale, 'iterations': args.iterations},
+        'routes': run(dsn, args.iterations, args.route or ROUTES, lambda message: print(message, file=sys.stderr)),
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
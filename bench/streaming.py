@@ -0,0 +1,117 @@
+"""
+Business: Measure peak Python memory of the unpaginated history lists - fetchall() + json_body as the handlers did
+          before, the buffered body assembled from stream chunks (cloud) and the chunked RowStream (self-hosted)
+Args: --dsn admin DSN (or BENCH_DATABASE_URL), --scale seeded order count, --encoding accepted by the client, --output file
+Returns: JSON with rows, body bytes and tracemalloc peak KiB per route and mode
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+os.environ.setdefault('PERF_LOG', '0')
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from bench import db, seed
+from bench.handlers import event, load
+from bench.run import _database_ready
+
+# маршрут -> (функция, параметры запроса)
+ROUTES = {
+    'orders GET get_shipped': ('orders', {'get_shipped': 'true'}),
+    'orders GET get_free_shipments': ('orders', {'get_free_shipments': 'true'}),
+    'materials GET type=history': ('materials', {'type': 'history'}),
+}
+
+
+def _peak_kib(call: Callable[[], int]) -> Dict[str, Any]:
+    tracemalloc.start()
+    try:
+        size = call()
+        return {'peak_kib': round(tracemalloc.get_traced_memory()[1] / 1024, 1), 'bytes': size}
+    finally:
+        tracemalloc.stop()
+
+
+def _stream(module: Any, params: Dict[str, str], headers: Dict[str, str]) -> Any:
+    stream_event = event('GET', params, None, headers)
+    stream_event[module.stream_response.__globals__['STREAM_KEY']] = True
+    return module.handler(stream_event, None)['body']
+
+
+def run(dsn: str, encoding: Optional[str], routes: List[str], log=lambda message: None) -> Dict[str, Any]:
+    os.environ['DATABASE_URL'] = dsn
+    functions: Dict[str, Any] = {}
+    results = {}
+    for route in routes:
+        log(route)
+        service, params = ROUTES[route]
+        module = functions.setdefault(service, load(service)).module
+        headers = {'accept-encoding': encoding} if encoding else {}
+        
+        # Тот же SELECT, что объявил handler (DECLARE ... FOR <select>), - прежний путь через fetchall()
+        stream = _stream(module, params, headers)
+        select = stream.cursor.query.decode('utf-8').split(' FOR ', 1)[1]
+        stream.close()
+        
+        def fetchall() -> int:
+            with psycopg2.connect(dsn) as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(select)
+                return len(module.json_body(cur.fetchall()).encode('utf-8'))
+        
+        def buffered() -> int:
+            response = module.handler(event('GET', params, None, headers), None)
+            if response['isBase64Encoded']:
+                return len(base64.b64decode(response['body']))
+            return len(response['body'].encode('utf-8'))
+        
+        def streamed() -> int:
+            return sum(len(chunk) for chunk in _stream(module, params, headers))
+        
+        with psycopg2.connect(dsn) as conn, conn.cursor() as cur:
+            cur.execute(f'SELECT COUNT(*) FROM ({select}) q')
+            rows = cur.fetchone()[0]
+        results[route] = {'rows': rows, **{mode: _peak_kib(call) for mode, call in (
+            ('fetchall', fetchall), ('buffered', buffered), ('streamed', streamed))}}
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Peak memory of the unpaginated history lists')
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_DATABASE_URL'),
+                        help='admin DSN; the oms_bench_<scale> database is created and seeded if missing')
+    parser.add_argument('--scale', type=int, default=10000, help='orders in the seeded database')
+    parser.add_argument('--encoding', choices=['gzip', 'br'], help='Accept-Encoding of the client (default: none)')
+    parser.add_argument('--route', action='append', choices=list(ROUTES), help='measure only this route')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    if not args.dsn:
+        parser.error('--dsn or BENCH_DATABASE_URL is required')
+
+    dsn = db.database_dsn(args.dsn, f'oms_bench_{args.scale}')
+    if not _database_ready(dsn, args.scale):
+        dsn = db.create_database(args.dsn, f'oms_bench_{args.scale}')
+        seed.seed(dsn, args.scale)
+
+    report = {
+        'meta': {'scale': args.scale, 'encoding': args.encoding},
+        'routes': run(dsn, args.encoding, args.route or list(ROUTES), lambda message: print(message, file=sys.stderr)),
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,9 @@
+-- Покрывающий индекс для отчёта о нехватке материалов (спрос по материалу и цвету)
+CREATE INDEX IF NOT EXISTS idx_order_items_material_color
+    ON order_items(material_id, color_id)
+    INCLUDE (order_id, quantity_required, quantity_completed);
+
+-- Частичный индекс по незакрытым заявкам
+CREATE INDEX IF NOT EXISTS idx_orders_open
+    ON orders(id)
+    WHERE status <> 'shipped';
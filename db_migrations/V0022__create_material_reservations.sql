@@ -0,0 +1,23 @@
+-- Резерв материалов под открытые заявки (по материалу и цвету)
+CREATE TABLE IF NOT EXISTS material_reservations (
+    id SERIAL PRIMARY KEY,
+    material_id INTEGER NOT NULL REFERENCES materials(id),
+    color_id INTEGER REFERENCES colors(id),
+    reserved_quantity DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Позиции без цвета резервируются под color_id = 0
+CREATE UNIQUE INDEX IF NOT EXISTS idx_material_reservations_key
+    ON material_reservations(material_id, (COALESCE(color_id, 0)));
+
+-- Начальное заполнение по всем неотгруженным заявкам
+INSERT INTO material_reservations (material_id, color_id, reserved_quantity)
+SELECT oi.material_id, oi.color_id, SUM(oi.quantity_required)
+FROM order_items oi
+JOIN orders o ON o.id = oi.order_id
+WHERE o.status <> 'shipped' AND oi.material_id IS NOT NULL
+GROUP BY oi.material_id, oi.color_id
+ON CONFLICT DO NOTHING;
+
+COMMENT ON TABLE material_reservations IS 'Reserved quantity per material-color for non-shipped orders, maintained by the orders function';
@@ -0,0 +1,57 @@
+-- Журнал изменений остатков по цветам (заполняется триггером)
+CREATE TABLE IF NOT EXISTS inventory_movements (
+    id BIGSERIAL PRIMARY KEY,
+    material_id INTEGER NOT NULL REFERENCES materials(id),
+    color_id INTEGER NOT NULL REFERENCES colors(id),
+    quantity_change INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS idx_inventory_movements_created ON inventory_movements(created_at);
+
+CREATE OR REPLACE FUNCTION log_inventory_movement() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO inventory_movements (material_id, color_id, quantity_change)
+        VALUES (OLD.material_id, OLD.color_id, -OLD.quantity);
+        RETURN OLD;
+    END IF;
+    
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO inventory_movements (material_id, color_id, quantity_change)
+        VALUES (NEW.material_id, NEW.color_id, NEW.quantity);
+    ELSIF NEW.quantity <> OLD.quantity THEN
+        INSERT INTO inventory_movements (material_id, color_id, quantity_change)
+        VALUES (NEW.material_id, NEW.color_id, NEW.quantity - OLD.quantity);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_material_color_inventory_movement ON material_color_inventory;
+CREATE TRIGGER trg_material_color_inventory_movement
+    AFTER INSERT OR UPDATE OR DELETE ON material_color_inventory
+    FOR EACH ROW EXECUTE FUNCTION log_inventory_movement();
+
+-- Периодические снимки остатков (контрольные точки)
+CREATE TABLE IF NOT EXISTS inventory_checkpoints (
+    id SERIAL PRIMARY KEY,
+    taken_at TIMESTAMP NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS inventory_checkpoint_items (
+    checkpoint_id INTEGER NOT NULL REFERENCES inventory_checkpoints(id),
+    material_id INTEGER NOT NULL REFERENCES materials(id),
+    color_id INTEGER NOT NULL REFERENCES colors(id),
+    quantity INTEGER NOT NULL,
+    PRIMARY KEY (checkpoint_id, material_id, color_id)
+);
+
+-- Первая контрольная точка: текущие остатки
+WITH cp AS (
+    INSERT INTO inventory_checkpoints (taken_at) VALUES (clock_timestamp()) RETURNING id
+)
+INSERT INTO inventory_checkpoint_items (checkpoint_id, material_id, color_id, quantity)
+SELECT cp.id, mci.material_id, mci.color_id, mci.quantity
+FROM material_color_inventory mci, cp
+WHERE mci.quantity <> 0;
@@ -0,0 +1,19 @@
+-- Закрытые периоды табеля (после расчёта зарплаты правки запрещены)
+CREATE TABLE IF NOT EXISTS timesheet_closed_months (
+    month DATE PRIMARY KEY,
+    closed_by INTEGER REFERENCES users(id),
+    trimmed BOOLEAN NOT NULL DEFAULT FALSE,
+    closed_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Итоги по сотрудникам за закрытые месяцы (ФИО фиксируется на момент закрытия)
+CREATE TABLE IF NOT EXISTS timesheet_month_summaries (
+    employee_id INTEGER NOT NULL,
+    month DATE NOT NULL REFERENCES timesheet_closed_months(month),
+    full_name VARCHAR(255) NOT NULL,
+    total_hours DECIMAL(7, 2) NOT NULL DEFAULT 0,
+    worked_days INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (employee_id, month)
+);
+
+CREATE INDEX IF NOT EXISTS idx_timesheet_month_summaries_month ON timesheet_month_summaries(month);
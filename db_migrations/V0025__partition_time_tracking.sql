@@ -0,0 +1,68 @@
+-- Табель секционируется по годам (work_date), старая таблица переносится целиком
+ALTER TABLE time_tracking RENAME TO time_tracking_legacy;
+ALTER INDEX IF EXISTS time_tracking_pkey RENAME TO time_tracking_legacy_pkey;
+ALTER INDEX IF EXISTS time_tracking_user_id_work_date_key RENAME TO time_tracking_legacy_user_id_work_date_key;
+ALTER INDEX IF EXISTS time_tracking_employee_date_unique RENAME TO time_tracking_legacy_employee_date_unique;
+DROP INDEX IF EXISTS idx_time_tracking_user_date;
+DROP INDEX IF EXISTS idx_time_tracking_date;
+DROP INDEX IF EXISTS idx_time_tracking_employee;
+
+CREATE TABLE time_tracking (
+    id INTEGER NOT NULL DEFAULT nextval('time_tracking_id_seq'),
+    user_id INTEGER REFERENCES users(id),
+    employee_id INTEGER REFERENCES timesheet_employees(id),
+    work_date DATE NOT NULL,
+    hours DECIMAL(4, 2) NOT NULL DEFAULT 0,
+    comment TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, work_date),
+    CONSTRAINT time_tracking_employee_date_unique UNIQUE (employee_id, work_date)
+) PARTITION BY RANGE (work_date);
+
+-- Строки за годы без своей секции попадают сюда и переносятся при создании секции
+CREATE TABLE time_tracking_default PARTITION OF time_tracking DEFAULT;
+
+-- Создаёт годовую секцию, перенося в неё строки из секции по умолчанию
+CREATE OR REPLACE FUNCTION ensure_time_tracking_partition(p_year INTEGER) RETURNS void AS $$
+DECLARE
+    part_name TEXT := 'time_tracking_' || p_year;
+    range_from DATE := make_date(p_year, 1, 1);
+    range_to DATE := make_date(p_year + 1, 1, 1);
+BEGIN
+    IF to_regclass(part_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    
+    EXECUTE format('CREATE TABLE %I (LIKE time_tracking INCLUDING DEFAULTS)', part_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM time_tracking_default WHERE work_date >= %L AND work_date < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        range_from, range_to, part_name
+    );
+    EXECUTE format(
+        'ALTER TABLE time_tracking ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        part_name, range_from, range_to
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Секции за все годы с данными и на год вперёд
+SELECT ensure_time_tracking_partition(y)
+FROM generate_series(
+    LEAST(
+        COALESCE((SELECT EXTRACT(YEAR FROM MIN(work_date))::int FROM time_tracking_legacy), EXTRACT(YEAR FROM NOW())::int),
+        EXTRACT(YEAR FROM NOW())::int
+    ),
+    EXTRACT(YEAR FROM NOW())::int + 1
+) y;
+
+INSERT INTO time_tracking (id, user_id, employee_id, work_date, hours, comment, created_at, updated_at)
+SELECT id, user_id, employee_id, work_date, hours, comment, created_at, updated_at
+FROM time_tracking_legacy;
+
+ALTER SEQUENCE time_tracking_id_seq OWNED BY time_tracking.id;
+DROP TABLE time_tracking_legacy;
+
+-- BRIN по дате: дешёвые диапазонные сканы, строки вставляются примерно в порядке дат
+CREATE INDEX IF NOT EXISTS idx_time_tracking_work_date_brin ON time_tracking USING BRIN (work_date);
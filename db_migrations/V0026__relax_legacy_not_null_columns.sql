@@ -0,0 +1,5 @@
+-- Колонки старой схемы заявок больше не заполняются функцией orders (позиции хранят material_id/quantity_required)
+ALTER TABLE orders ALTER COLUMN material DROP NOT NULL;
+ALTER TABLE orders ALTER COLUMN quantity DROP NOT NULL;
+ALTER TABLE order_items ALTER COLUMN material DROP NOT NULL;
+ALTER TABLE order_items ALTER COLUMN quantity DROP NOT NULL;
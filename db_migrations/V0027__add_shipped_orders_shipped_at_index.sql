@@ -0,0 +1,2 @@
+-- Отгрузки за сегодня в сводке и отчёты по периодам фильтруют shipped_orders по дате
+CREATE INDEX IF NOT EXISTS idx_shipped_orders_shipped_at ON shipped_orders(shipped_at DESC);
@@ -0,0 +1,3 @@
+-- Отчёт по браку читает только бракованные отгрузки: частичные индексы остаются маленькими при росте истории
+CREATE INDEX IF NOT EXISTS idx_shipped_orders_defective ON shipped_orders(shipped_at DESC) WHERE is_defective = true;
+CREATE INDEX IF NOT EXISTS idx_free_shipments_defective ON free_shipments(shipped_at DESC) WHERE is_defective = true;
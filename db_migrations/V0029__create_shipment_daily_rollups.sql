@@ -0,0 +1,35 @@
+-- Дневные итоги отгрузок: отчёты за неделю/месяц/год читают их вместо сырых событий
+CREATE TABLE IF NOT EXISTS shipment_daily_rollups (
+    id SERIAL PRIMARY KEY,
+    day DATE NOT NULL,
+    source VARCHAR(16) NOT NULL,
+    material_id INTEGER NOT NULL REFERENCES materials(id),
+    color_id INTEGER REFERENCES colors(id),
+    is_defective BOOLEAN NOT NULL DEFAULT FALSE,
+    shipment_count INTEGER NOT NULL DEFAULT 0,
+    quantity BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- source: order (shipped_orders), free (free_shipments), warehouse (shipments); отгрузки без цвета - под color_id = 0
+CREATE UNIQUE INDEX IF NOT EXISTS idx_shipment_daily_rollups_key
+    ON shipment_daily_rollups(day, source, material_id, (COALESCE(color_id, 0)), is_defective);
+
+-- Начальное заполнение по всей истории отгрузок
+INSERT INTO shipment_daily_rollups (day, source, material_id, color_id, is_defective, shipment_count, quantity)
+SELECT shipped_at::date, source, material_id, color_id, is_defective, COUNT(*), SUM(quantity)
+FROM (
+    SELECT 'order' as source, material_id, color_id, quantity, COALESCE(is_defective, false) as is_defective, shipped_at
+    FROM shipped_orders
+    UNION ALL
+    SELECT 'free', material_id, color_id, quantity, COALESCE(is_defective, false), shipped_at
+    FROM free_shipments
+    UNION ALL
+    SELECT 'warehouse', material_id, color_id, quantity, false, shipped_at
+    FROM shipments
+) s
+WHERE shipped_at IS NOT NULL
+GROUP BY shipped_at::date, source, material_id, color_id, is_defective
+ON CONFLICT DO NOTHING;
+
+COMMENT ON TABLE shipment_daily_rollups IS 'Shipment count and quantity per day, source, material-color and defect flag, maintained by the orders and materials functions';
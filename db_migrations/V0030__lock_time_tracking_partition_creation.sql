@@ -0,0 +1,33 @@
+-- Две транзакции, впервые пишущие в новый год, не должны обе создавать его секцию:
+-- вторая ждёт блокировку года и после коммита первой видит готовую секцию
+CREATE OR REPLACE FUNCTION ensure_time_tracking_partition(p_year INTEGER) RETURNS void AS $$
+DECLARE
+    part_name TEXT := 'time_tracking_' || p_year;
+    range_from DATE := make_date(p_year, 1, 1);
+    range_to DATE := make_date(p_year + 1, 1, 1);
+BEGIN
+    IF to_regclass(part_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    
+    PERFORM pg_advisory_xact_lock(hashtext('time_tracking_partition'), p_year);
+    -- Повторная проверка запросом к pg_class: его снимок берётся после получения блокировки
+    IF EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = part_name AND relnamespace = current_schema()::regnamespace
+    ) THEN
+        RETURN;
+    END IF;
+    
+    EXECUTE format('CREATE TABLE %I (LIKE time_tracking INCLUDING DEFAULTS)', part_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM time_tracking_default WHERE work_date >= %L AND work_date < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        range_from, range_to, part_name
+    );
+    EXECUTE format(
+        'ALTER TABLE time_tracking ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        part_name, range_from, range_to
+    );
+END;
+$$ LANGUAGE plpgsql;
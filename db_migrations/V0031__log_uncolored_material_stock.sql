@@ -0,0 +1,58 @@
+-- Общий остаток материала (materials.quantity) тоже попадает в журнал и в контрольные точки - строками с color_id = NULL
+ALTER TABLE inventory_movements ALTER COLUMN color_id DROP NOT NULL;
+ALTER TABLE inventory_movements ALTER COLUMN quantity_change TYPE DECIMAL(10, 2);
+
+ALTER TABLE inventory_checkpoint_items DROP CONSTRAINT IF EXISTS inventory_checkpoint_items_pkey;
+ALTER TABLE inventory_checkpoint_items ALTER COLUMN color_id DROP NOT NULL;
+ALTER TABLE inventory_checkpoint_items ALTER COLUMN quantity TYPE DECIMAL(10, 2);
+
+-- Строки без цвета - под color_id = 0, как в material_reservations
+CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_checkpoint_items_key
+    ON inventory_checkpoint_items(checkpoint_id, material_id, (COALESCE(color_id, 0)));
+
+-- Журнал и снимки удаляемого материала уходят вместе с ним: иначе материал с ненулевым остатком нельзя удалить
+ALTER TABLE inventory_movements
+    DROP CONSTRAINT IF EXISTS inventory_movements_material_id_fkey,
+    ADD CONSTRAINT inventory_movements_material_id_fkey
+        FOREIGN KEY (material_id) REFERENCES materials(id) ON DELETE CASCADE;
+ALTER TABLE inventory_checkpoint_items
+    DROP CONSTRAINT IF EXISTS inventory_checkpoint_items_material_id_fkey,
+    ADD CONSTRAINT inventory_checkpoint_items_material_id_fkey
+        FOREIGN KEY (material_id) REFERENCES materials(id) ON DELETE CASCADE;
+
+-- Прежние контрольные точки сняты только по цветам
+ALTER TABLE inventory_checkpoints ADD COLUMN IF NOT EXISTS includes_materials BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE inventory_checkpoints ALTER COLUMN includes_materials SET DEFAULT TRUE;
+
+CREATE OR REPLACE FUNCTION log_material_quantity_movement() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF COALESCE(NEW.quantity, 0) <> 0 THEN
+            INSERT INTO inventory_movements (material_id, color_id, quantity_change)
+            VALUES (NEW.id, NULL, NEW.quantity);
+        END IF;
+    ELSIF COALESCE(NEW.quantity, 0) <> COALESCE(OLD.quantity, 0) THEN
+        INSERT INTO inventory_movements (material_id, color_id, quantity_change)
+        VALUES (NEW.id, NULL, COALESCE(NEW.quantity, 0) - COALESCE(OLD.quantity, 0));
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_materials_quantity_movement ON materials;
+CREATE TRIGGER trg_materials_quantity_movement
+    AFTER INSERT OR UPDATE OF quantity ON materials
+    FOR EACH ROW EXECUTE FUNCTION log_material_quantity_movement();
+
+-- Первая полная контрольная точка: с неё stock_as_of отвечает и по материалам без цвета
+WITH cp AS (
+    INSERT INTO inventory_checkpoints (taken_at) VALUES (clock_timestamp()) RETURNING id
+)
+INSERT INTO inventory_checkpoint_items (checkpoint_id, material_id, color_id, quantity)
+SELECT cp.id, mci.material_id, mci.color_id, mci.quantity
+FROM material_color_inventory mci, cp
+WHERE mci.quantity <> 0
+UNION ALL
+SELECT cp.id, m.id, NULL, m.quantity
+FROM materials m, cp
+WHERE COALESCE(m.quantity, 0) <> 0;
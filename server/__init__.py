@@ -0,0 +1,5 @@
+"""
+Business: Self-hosted mode - all five function handlers in one process behind a threaded HTTP server
+Args: see server/__main__.py (python -m server --help)
+Returns: HTTP API at /<function>, same events and responses as the cloud functions
+"""
@@ -0,0 +1,53 @@
+"""
+Business: Run the self-hosted server - python -m server --port 8000
+Args: --host, --port, --workers, --pool-min, --pool-max; DATABASE_URL from the environment
+Returns: serves until SIGTERM/SIGINT, then drains in-flight requests and closes the pool
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+
+from server.app import App
+from server.httpd import AppServer
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Serve all backend functions from one process')
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WORKERS', '16')),
+                        help='handler threads; requests beyond this wait in the accept queue')
+    parser.add_argument('--pool-min', type=int, default=int(os.environ.get('DB_POOL_MIN', '2')))
+    parser.add_argument('--pool-max', type=int, default=int(os.environ.get('DB_POOL_MAX', '0')) or None,
+                        help='DB connections (default: one per worker)')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        parser.error('DATABASE_URL is required')
+
+    app = App(dsn, minconn=args.pool_min, maxconn=args.pool_max or args.workers)
+    server = AppServer((args.host, args.port), app, args.workers)
+
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        if not stopping.is_set():
+            stopping.set()
+            print('shutting down: draining in-flight requests', file=sys.stderr, flush=True)
+            # shutdown() ждёт выхода serve_forever, поэтому вызываем его не из обработчика сигнала
+            threading.Thread(target=server.drain).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f'serving {", ".join(app.handlers)} on http://{args.host}:{args.port}/<function>', file=sys.stderr, flush=True)
+    server.serve_forever()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
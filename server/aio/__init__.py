@@ -0,0 +1,5 @@
+"""
+Business: asyncio mode of the self-hosted server - asyncpg serves the hot read routes of orders and materials
+Args: see server/aio/__main__.py (python -m server.aio --help)
+Returns: same routes and response bodies as the threaded server; everything else runs the sync handler in a thread pool
+"""
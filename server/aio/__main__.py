@@ -0,0 +1,51 @@
+"""
+Business: Run the asyncio server - python -m server.aio --port 8001
+Args: --host, --port, --pool-min, --pool-max (asyncpg), --workers (threads for delegated sync calls); DATABASE_URL
+Returns: serves until SIGTERM/SIGINT, then drains in-flight requests and closes both pools
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+
+from server.aio.app import AsyncApp
+from server.aio.httpd import AsyncServer
+
+
+async def serve(args: argparse.Namespace, dsn: str) -> None:
+    app = AsyncApp(dsn, pool_min=args.pool_min, pool_max=args.pool_max, workers=args.workers)
+    server = AsyncServer(app, args.host, args.port)
+    await server.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    print(f'serving (asyncio) on http://{args.host}:{args.port}/<function>', file=sys.stderr, flush=True)
+    await stop.wait()
+    print('shutting down: draining in-flight requests', file=sys.stderr, flush=True)
+    await server.drain()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Serve all backend functions on one asyncio event loop')
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8001')))
+    parser.add_argument('--pool-min', type=int, default=int(os.environ.get('DB_POOL_MIN', '2')))
+    parser.add_argument('--pool-max', type=int, default=int(os.environ.get('DB_POOL_MAX', '20')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WORKERS', '8')),
+                        help='threads (and psycopg2 connections) for routes without an async version')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        parser.error('DATABASE_URL is required')
+    asyncio.run(serve(args, dsn))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Business: Dispatch events in asyncio mode - async routes first, sync handlers on a thread pool for the rest
+Args: DATABASE_URL, asyncpg pool bounds, worker threads for delegated calls
+Returns: AsyncApp with await call(service, event) -> handler response
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+import asyncpg
+
+from server.aio import materials, orders
+from server.app import App, responses
+
+ASYNC_ROUTES = {
+    'orders': orders.handle,
+    'materials': materials.handle,
+}
+
+
+class AsyncApp:
+    def __init__(self, dsn: str, pool_min: int = 2, pool_max: int = 20, workers: int = 8):
+        self.dsn = dsn
+        self.pool_min = pool_min
+        self.pool_max = pool_max
+        # Записи и редкие отчёты идут через обычные handler'ы со своим psycopg2-пулом
+        self.sync = App(dsn, minconn=1, maxconn=workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='oms-sync')
+        self.pool = None
+
+    async def start(self) -> None:
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=self.pool_min, max_size=self.pool_max)
+
+    async def call(self, service: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        route = ASYNC_ROUTES.get(service)
+        if route is not None:
+            response = await route(self.pool, event)
+            if response is not None:
+                return responses.compress_response(event, response)
+        # Поток синхронного handler'а пришлось бы читать в цикле событий не в том потоке, что держит соединение
+        event = {key: value for key, value in event.items() if key != responses.STREAM_KEY}
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.sync.call, service, event)
+
+    async def batch(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        # Снимок держится на одном psycopg2-соединении, поэтому пакет целиком выполняет синхронный App
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.sync.batch, event)
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+        self.executor.shutdown(wait=True)
+        self.sync.close()
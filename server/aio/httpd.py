@@ -0,0 +1,112 @@
+"""
+Business: Minimal HTTP/1.1 server on asyncio streams for the asyncio mode (keep-alive, Content-Length or chunked bodies)
+Args: AsyncApp, bind address
+Returns: AsyncServer; same URL layout as the threaded server (/<function>, /batch, /healthz)
+"""
+
+import asyncio
+from typing import Dict, Optional, Set
+
+from server.aio.app import AsyncApp
+from server.app import responses
+from server.httpd import HEALTH_RESPONSE, chunk_frame, is_stream, request_event, response_payload, service_name
+
+KEEPALIVE_TIMEOUT = 15
+REASONS = {200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request', 403: 'Forbidden',
+           404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict', 500: 'Internal Server Error'}
+
+
+class AsyncServer:
+    def __init__(self, app: AsyncApp, host: str, port: int):
+        self.app = app
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.Task] = set()
+        self._busy = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stopping = False
+
+    async def start(self) -> None:
+        await self.app.start()
+        self._server = await asyncio.start_server(self._serve, self.host, self.port, backlog=1024)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while not self._stopping:
+                request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length') or 0)
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+                self._busy += 1
+                self._idle.clear()
+                try:
+                    service = service_name(target)
+                    if service == 'healthz':
+                        response = HEALTH_RESPONSE
+                    elif service == 'batch' and method == 'POST':
+                        response = await self.app.batch(request_event(method, target, headers, body))
+                    else:
+                        event = request_event(method, target, headers, body)
+                        event[responses.STREAM_KEY] = version == 'HTTP/1.1'
+                        response = await self.app.call(service, event)
+                    keep_alive = keep_alive and not self._stopping
+                    status, response_headers, payload = response_payload(response)
+                    head = [f'HTTP/1.1 {status} {REASONS.get(status, "")}']
+                    head += [f'{name}: {value}' for name, value in response_headers]
+                    length = 'Transfer-Encoding: chunked' if is_stream(payload) else f'Content-Length: {len(payload)}'
+                    head += [length, f'Connection: {"keep-alive" if keep_alive else "close"}']
+                    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+                    if not is_stream(payload):
+                        if method != 'HEAD':
+                            writer.write(payload)
+                    else:
+                        try:
+                            if method != 'HEAD':
+                                # drain() после каждой порции: медленный клиент притормаживает чтение курсора
+                                async for chunk in payload:
+                                    writer.write(chunk_frame(chunk))
+                                    await writer.drain()
+                                writer.write(chunk_frame(b''))
+                        finally:
+                            # Соединение с БД возвращается в пул, даже если клиент ушёл посреди ответа
+                            await payload.aclose()
+                    await writer.drain()
+                finally:
+                    self._busy -= 1
+                    if self._busy == 0:
+                        self._idle.set()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def drain(self, timeout: float = 30) -> None:
+        """Stop accepting, finish in-flight requests, drop idle keep-alive connections, close pools"""
+        self._stopping = True
+        self._server.close()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self.app.close()
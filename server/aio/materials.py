@@ -0,0 +1,110 @@
+"""
+Business: asyncpg versions of the materials GET routes (list with colors and stock, id, sections, colors)
+Args: asyncpg pool and the gateway event
+Returns: handler response identical to backend/materials/index.py, or None to run the sync handler instead
+"""
+
+from typing import Any, Dict, Optional
+
+from server.app import responses
+
+HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+COLORS_SQL = "SELECT c.* FROM colors c JOIN material_colors mc ON c.id = mc.color_id WHERE mc.material_id = $1"
+
+
+def _response(status: int, body: str) -> Dict[str, Any]:
+    return {'statusCode': status, 'headers': dict(HEADERS), 'body': body, 'isBase64Encoded': False}
+
+
+async def _materials(conn, resource_id: Optional[str], section_id: Optional[str]) -> Any:
+    if resource_id:
+        material = await conn.fetchrow("SELECT * FROM materials WHERE id = $1", int(resource_id))
+        if not material:
+            return None
+        mat_dict = dict(material)
+        mat_dict['colors'] = [dict(row) for row in await conn.fetch(COLORS_SQL, int(resource_id))]
+        return mat_dict
+    
+    if section_id:
+        materials = await conn.fetch("SELECT * FROM materials WHERE section_id = $1 ORDER BY id", int(section_id))
+    else:
+        materials = await conn.fetch("SELECT * FROM materials ORDER BY id")
+    material_ids = [mat['id'] for mat in materials]
+    
+    colors_by_material = {}
+    for row in await conn.fetch(
+        """SELECT mc.material_id, c.*
+           FROM colors c JOIN material_colors mc ON c.id = mc.color_id
+           WHERE mc.material_id = ANY($1::int[])
+           ORDER BY mc.id""",
+        material_ids
+    ):
+        color = dict(row)
+        colors_by_material.setdefault(color.pop('material_id'), []).append(color)
+    
+    inventory_by_material = {}
+    for row in await conn.fetch(
+        """SELECT mci.material_id, mci.color_id, mci.quantity, c.name as color_name, c.hex_code
+           FROM material_color_inventory mci
+           JOIN colors c ON c.id = mci.color_id
+           WHERE mci.material_id = ANY($1::int[]) AND mci.quantity > 0
+           ORDER BY mci.material_id, c.name""",
+        material_ids
+    ):
+        stock = dict(row)
+        inventory_by_material.setdefault(stock.pop('material_id'), []).append(stock)
+    
+    result = []
+    for mat in materials:
+        mat_dict = dict(mat)
+        mat_dict['colors'] = colors_by_material.get(mat['id'], [])
+        mat_dict['color_inventory'] = inventory_by_material.get(mat['id'], [])
+        result.append(mat_dict)
+    return result
+
+
+async def handle(pool, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if event.get('httpMethod', 'GET') != 'GET':
+        return None
+    params = event.get('queryStringParameters') or {}
+    resource_type = params.get('type', 'material')
+    # Прогноз (numpy и кэш модуля) и остатки на дату (снимают контрольную точку) - в синхронном handler'е
+    if resource_type not in ('material', 'section', 'color'):
+        return None
+    # Проекция и вложенные списки по ?fields=/?include= - только в синхронном handler'е
+    if resource_type == 'material' and ('fields' in params or 'include' in params):
+        return None
+    resource_id = params.get('id')
+    section_id = params.get('section_id')
+    user_id = (event.get('headers') or {}).get('x-user-id')
+    try:
+        for value in (resource_id, section_id, user_id):
+            if value:
+                int(value)
+    except ValueError:
+        return None
+    
+    try:
+        async with pool.acquire() as conn:
+            if resource_type == 'section':
+                if user_id:
+                    user_row = await conn.fetchrow("SELECT role FROM users WHERE id = $1", int(user_id))
+                    if not user_row or user_row['role'] not in ['admin', 'supervisor']:
+                        return _response(403, responses.json_body({'error': 'Доступ запрещен'}))
+                if resource_id:
+                    row = await conn.fetchrow("SELECT * FROM sections WHERE id = $1", int(resource_id))
+                    result = dict(row) if row else None
+                else:
+                    result = [dict(row) for row in await conn.fetch("SELECT * FROM sections ORDER BY id")]
+            elif resource_type == 'color':
+                if resource_id:
+                    row = await conn.fetchrow("SELECT * FROM colors WHERE id = $1", int(resource_id))
+                    result = dict(row) if row else None
+                else:
+                    result = [dict(row) for row in await conn.fetch("SELECT * FROM colors ORDER BY id")]
+            else:
+                result = await _materials(conn, resource_id, section_id)
+    except Exception as e:
+        return _response(500, responses.json_body({'error': str(e)}))
+    
+    return _response(200, responses.json_body(result))
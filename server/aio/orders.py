@@ -0,0 +1,216 @@
+"""
+Business: asyncpg versions of the orders GET routes the panels poll (list, id, requests, shipments, availability)
+Args: asyncpg pool and the gateway event
+Returns: handler response identical to backend/orders/index.py (shipment histories streamed when the server
+         sends chunked responses), or None to run the sync handler instead
+"""
+
+from typing import Any, AsyncIterator, Dict, Optional
+
+from server.app import responses
+
+HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+AVAILABILITY_SQL = '''
+    SELECT 
+        r.material_id, r.color_id,
+        COALESCE(mci.quantity, CASE WHEN r.color_id IS NULL THEN m.quantity END, 0) as on_hand,
+        r.reserved_quantity as reserved,
+        COALESCE(mci.quantity, CASE WHEN r.color_id IS NULL THEN m.quantity END, 0) - r.reserved_quantity as available
+    FROM material_reservations r
+    JOIN materials m ON m.id = r.material_id
+    LEFT JOIN material_color_inventory mci 
+        ON mci.material_id = r.material_id AND mci.color_id = r.color_id
+    WHERE r.reserved_quantity <> 0
+    ORDER BY r.material_id, r.color_id
+'''
+
+MATERIAL_AVAILABILITY_SQL = '''
+    SELECT 
+        m.id as material_id, $1::int as color_id,
+        COALESCE(mci.quantity, CASE WHEN $1::int IS NULL THEN m.quantity END, 0) as on_hand,
+        COALESCE(r.reserved_quantity, 0) as reserved,
+        COALESCE(mci.quantity, CASE WHEN $1::int IS NULL THEN m.quantity END, 0) 
+            - COALESCE(r.reserved_quantity, 0) as available
+    FROM materials m
+    LEFT JOIN material_color_inventory mci 
+        ON mci.material_id = m.id AND mci.color_id = $1::int
+    LEFT JOIN material_reservations r 
+        ON r.material_id = m.id AND COALESCE(r.color_id, 0) = COALESCE($1::int, 0)
+    WHERE m.id = $2
+'''
+
+
+FREE_SHIPMENTS_SQL = '''
+    SELECT 
+        id,
+        material_id,
+        color_id,
+        quantity,
+        is_defective,
+        shipped_by,
+        comment,
+        shipped_at
+    FROM free_shipments
+    ORDER BY shipped_at DESC
+'''
+
+SHIPPED_SQL = '''
+    SELECT 
+        so.id,
+        so.order_id,
+        so.material_id,
+        so.color_id,
+        so.quantity,
+        so.is_defective,
+        so.shipped_at,
+        o.order_number,
+        o.section_id
+    FROM shipped_orders so
+    JOIN orders o ON o.id = so.order_id
+    ORDER BY so.shipped_at DESC
+'''
+
+
+def _response(status: int, body: str) -> Dict[str, Any]:
+    return {'statusCode': status, 'headers': dict(HEADERS), 'body': body, 'isBase64Encoded': False}
+
+
+async def _stream_rows(pool, sql: str, encoder: Any) -> AsyncIterator[bytes]:
+    """Rows of sql read through a cursor STREAM_CHUNK_ROWS at a time, as encoded chunks of one JSON array"""
+    async with pool.acquire() as conn, conn.transaction():
+        cursor = await conn.cursor(sql)
+        while True:
+            rows = await cursor.fetch(responses.STREAM_CHUNK_ROWS)
+            if not rows:
+                break
+            chunk = encoder.rows([dict(row) for row in rows])
+            if chunk:
+                yield chunk
+    yield encoder.end()
+
+
+def _stream_response(pool, event: Dict[str, Any], sql: str) -> Dict[str, Any]:
+    """Body is an async generator - the connection is taken from the pool only while the server sends it"""
+    encoding = responses.accepted_encoding(event)
+    headers = dict(HEADERS)
+    if encoding is not None:
+        headers.update({'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'})
+    body = _stream_rows(pool, sql, responses.JsonArrayEncoder(encoding))
+    return {'statusCode': 200, 'headers': headers, 'body': body, 'isBase64Encoded': False}
+
+
+async def _requests(conn) -> Dict[str, Any]:
+    requests = [dict(row) for row in await conn.fetch('''
+        SELECT 
+            r.id, r.request_number, r.section_id, r.status, r.comment,
+            r.created_by, r.created_at, r.updated_at,
+            s.name as section_name,
+            u.full_name as created_by_name
+        FROM requests r
+        LEFT JOIN sections s ON r.section_id = s.id
+        LEFT JOIN users u ON r.created_by = u.id
+        ORDER BY r.created_at DESC
+    ''')]
+    items_by_request = {}
+    for item in await conn.fetch('''
+        SELECT id, request_id, material_name, quantity_required, 
+               quantity_completed, color, size, comment
+        FROM request_items
+        WHERE request_id = ANY($1::int[])
+        ORDER BY id
+    ''', [req['id'] for req in requests]):
+        items_by_request.setdefault(item['request_id'], []).append(dict(item))
+    for req in requests:
+        req['items'] = items_by_request.get(req['id'], [])
+    return _response(200, responses.json_body(requests))
+
+
+async def _availability(conn, params: Dict[str, str]) -> Dict[str, Any]:
+    material_id = params.get('material_id')
+    color_id = params.get('color_id') or None
+    if material_id:
+        row = await conn.fetchrow(
+            MATERIAL_AVAILABILITY_SQL, int(color_id) if color_id else None, int(material_id)
+        )
+        result = dict(row) if row else None
+    else:
+        result = [dict(row) for row in await conn.fetch(AVAILABILITY_SQL)]
+    return _response(
+        200 if result is not None else 404,
+        responses.json_body(result if result is not None else {'error': 'Материал не найден'})
+    )
+
+
+async def _orders(conn, params: Dict[str, str]) -> Dict[str, Any]:
+    order_id = params.get('id')
+    status_filter = params.get('status')
+    
+    if params.get('get_free_shipments'):
+        result = [dict(row) for row in await conn.fetch(FREE_SHIPMENTS_SQL)]
+    elif params.get('get_shipped'):
+        result = [dict(row) for row in await conn.fetch(SHIPPED_SQL)]
+    elif order_id:
+        order = await conn.fetchrow("SELECT * FROM orders WHERE id = $1", int(order_id))
+        if order:
+            result = dict(order)
+            result['items'] = [dict(item) for item in await conn.fetch(
+                "SELECT * FROM order_items WHERE order_id = $1", int(order_id)
+            )]
+        else:
+            result = None
+    else:
+        if status_filter:
+            orders = await conn.fetch("SELECT * FROM orders WHERE status = $1 ORDER BY created_at DESC", status_filter)
+        else:
+            orders = await conn.fetch("SELECT * FROM orders ORDER BY created_at DESC")
+        items_by_order = {}
+        for item in await conn.fetch(
+            "SELECT * FROM order_items WHERE order_id = ANY($1::int[]) ORDER BY id",
+            [order['id'] for order in orders]
+        ):
+            items_by_order.setdefault(item['order_id'], []).append(dict(item))
+        result = []
+        for order in orders:
+            order_dict = dict(order)
+            order_dict['items'] = items_by_order.get(order['id'], [])
+            result.append(order_dict)
+    
+    return _response(200, responses.json_body(result))
+
+
+async def handle(pool, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if event.get('httpMethod', 'GET') != 'GET':
+        return None
+    params = event.get('queryStringParameters') or {}
+    request_type = params.get('type')
+    # Выгрузки, отчёт о дефиците и прочие типы остаются за синхронным handler'ом
+    if request_type not in (None, 'requests', 'availability'):
+        return None
+    # Проекция и вложенные списки по ?fields=/?include= - только в синхронном handler'е
+    if 'fields' in params or 'include' in params:
+        return None
+    try:
+        # Нечисловые id синхронный handler отвечает своей ошибкой - отдаём ему
+        for key in ('id', 'material_id', 'color_id'):
+            if params.get(key):
+                int(params[key])
+    except ValueError:
+        return None
+    
+    # Истории отгрузок без пагинации идут по частям, если сервер умеет chunked
+    if event.get(responses.STREAM_KEY) and request_type is None:
+        if params.get('get_free_shipments'):
+            return _stream_response(pool, event, FREE_SHIPMENTS_SQL)
+        if params.get('get_shipped'):
+            return _stream_response(pool, event, SHIPPED_SQL)
+    
+    try:
+        async with pool.acquire() as conn:
+            if request_type == 'requests':
+                return await _requests(conn)
+            if request_type == 'availability':
+                return await _availability(conn, params)
+            return await _orders(conn, params)
+    except Exception as e:
+        return _response(500, responses.json_body({'error': str(e)}))
@@ -0,0 +1,165 @@
+"""
+Business: Load the five function handlers into one process and dispatch gateway events to them
+Args: DATABASE_URL, pool bounds; events in the cloud gateway shape
+Returns: App with call(service, event) -> handler response and batch(event) for several read calls in one snapshot
+"""
+
+import importlib.util
+import json
+import os
+import sys
+from types import ModuleType
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from server.pool import ConnectionPool, Psycopg2Shim
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+SERVICES = ('auth', 'users', 'orders', 'materials', 'schedule')
+# stock.py лежит только в функциях, которые списывают материал
+STOCK_SERVICES = ('orders', 'materials')
+MAX_BATCH = 20
+
+
+def _load_shared(name: str, service: str = SERVICES[0]) -> ModuleType:
+    """perf.py and responses.py are identical in every function, stock.py in STOCK_SERVICES;
+    one copy serves all handlers that have the module"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(BACKEND_DIR, service, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Асинхронные маршруты кодируют тела ответов тем же модулем, что и handler'ы
+responses = _load_shared('responses')
+
+
+def _load_handler(service: str, shared: Dict[str, ModuleType]) -> ModuleType:
+    function_dir = os.path.join(BACKEND_DIR, service)
+    previous = {name: sys.modules.get(name) for name in shared}
+    sys.modules.update(shared)
+    sys.path.insert(0, function_dir)
+    try:
+        spec = importlib.util.spec_from_file_location(f'fn_{service}', os.path.join(function_dir, 'index.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(function_dir)
+        for name, module_before in previous.items():
+            if module_before is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module_before
+    return module
+
+
+def _error(status: int, message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': responses.json_body({'error': message}),
+        'isBase64Encoded': False
+    }
+
+
+class App:
+    def __init__(self, dsn: str, minconn: int = 1, maxconn: int = 10, acquire_timeout: Optional[float] = 30.0):
+        # Handler'ы читают DATABASE_URL при каждом вызове; в этом режиме DSN задаёт только пул
+        os.environ.setdefault('DATABASE_URL', dsn)
+        self.perf = _load_shared('perf')
+        self.pool = ConnectionPool(dsn, minconn, maxconn, connection_factory=self.perf.InstrumentedConnection)
+        self.db = Psycopg2Shim(self.pool, acquire_timeout)
+        shared = {'perf': self.perf, 'responses': responses}
+        stock = _load_shared('stock', STOCK_SERVICES[0])
+        self.handlers: Dict[str, ModuleType] = {}
+        for service in SERVICES:
+            module = _load_handler(service, {**shared, 'stock': stock} if service in STOCK_SERVICES else shared)
+            module.psycopg2 = self.db
+            self.handlers[service] = module
+
+    def call(self, service: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        module = self.handlers.get(service)
+        if module is None:
+            return _error(404, f'Неизвестная функция: {service}')
+        streamed = False
+        try:
+            response = module.handler(event, None)
+            body = response.get('body')
+            if isinstance(body, responses.RowStream):
+                # Соединение потокового ответа занято до последней порции - вернуть его в пул должен close() потока
+                body.closers.append(self.db.release_all)
+                streamed = True
+            return response
+        finally:
+            if not streamed:
+                self.db.release_all()
+
+    def batch(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Run GET sub-requests on one connection in one REPEATABLE READ READ ONLY snapshot"""
+        try:
+            calls = json.loads(event.get('body') or '{}').get('requests')
+        except (TypeError, ValueError, AttributeError):
+            calls = None
+        if not isinstance(calls, list) or not calls or len(calls) > MAX_BATCH:
+            return _error(400, f'Передайте requests - список из 1..{MAX_BATCH} запросов')
+        
+        # Заголовки пакета (x-user-id) действуют на все подзапросы, если те не передали свои
+        shared_headers = event.get('headers') or {}
+        results: List[Dict[str, Any]] = []
+        with self.db.snapshot() as conn:
+            for call in calls:
+                results.append(self._batch_call(conn, call if isinstance(call, dict) else {}, shared_headers))
+        
+        return responses.compress_response(event, {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': responses.json_body({'results': results}),
+            'isBase64Encoded': False
+        })
+
+    def _batch_call(self, conn: Any, call: Dict[str, Any], shared_headers: Dict[str, str]) -> Dict[str, Any]:
+        service = call.get('service')
+        query = dict(call.get('queryStringParameters') or {})
+        if call.get('path'):
+            url = urlsplit(call['path'])
+            service = service or url.path.strip('/').split('/')[0]
+            query = {**dict(parse_qsl(url.query, keep_blank_values=True)), **query}
+        method = call.get('httpMethod', 'GET')
+        
+        if method != 'GET':
+            response = _error(405, 'В пакете допускаются только GET-запросы')
+        elif service not in self.handlers:
+            response = _error(404, f'Неизвестная функция: {service}')
+        else:
+            headers = {k.lower(): v for k, v in shared_headers.items()}
+            headers.update({k.lower(): v for k, v in (call.get('headers') or {}).items()})
+            # Ответ подзапроса вкладывается в пакет как JSON, сжимается только пакет целиком
+            headers.pop('accept-encoding', None)
+            sub_event = {
+                'httpMethod': 'GET',
+                'headers': headers,
+                'queryStringParameters': query,
+                'isBase64Encoded': False
+            }
+            self.db.isolate_call(conn)
+            try:
+                response = self.handlers[service].handler(sub_event, None)
+            finally:
+                self.db.end_call(conn)
+        
+        body = response.get('body')
+        content_type = (response.get('headers') or {}).get('Content-Type', '')
+        if body and not response.get('isBase64Encoded') and content_type.startswith('application/json'):
+            body = json.loads(body)
+        result = {
+            'service': service,
+            'statusCode': response.get('statusCode'),
+            'body': body,
+            'isBase64Encoded': response.get('isBase64Encoded', False)
+        }
+        if 'id' in call:
+            result['id'] = call['id']
+        return result
+
+    def close(self) -> None:
+        self.pool.closeall()
@@ -0,0 +1,158 @@
+"""
+Business: HTTP front of the self-hosted mode - translates requests to gateway events on a bounded thread pool
+Args: App, bind address, worker count
+Returns: AppServer; GET/POST/PUT/DELETE/OPTIONS /<function>?query are passed to that function's handler,
+         POST /batch runs several GET calls in one snapshot; streamed lists go out with chunked transfer
+"""
+
+import base64
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from server.app import App, responses
+
+
+def request_event(method: str, path: str, headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+    """Same event dict the cloud gateway passes to handler(event, context)"""
+    url = urlsplit(path)
+    event = {
+        'httpMethod': method,
+        'path': url.path,
+        # Шлюз платформы передаёт имена заголовков в нижнем регистре (handler'ы читают x-user-id)
+        'headers': {name.lower(): value for name, value in headers.items()},
+        'queryStringParameters': dict(parse_qsl(url.query, keep_blank_values=True)),
+        'isBase64Encoded': False,
+    }
+    if body:
+        try:
+            event['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            event['body'] = base64.b64encode(body).decode('ascii')
+            event['isBase64Encoded'] = True
+    return event
+
+
+def response_payload(response: Dict[str, Any]) -> Tuple[int, List[Tuple[str, str]], Any]:
+    """Status, headers and raw body bytes of a handler response (a streamed body is passed through as is)"""
+    payload = response.get('body') or ''
+    if is_stream(payload):
+        pass
+    elif response.get('isBase64Encoded'):
+        payload = base64.b64decode(payload)
+    elif isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    headers = [
+        (name, str(value)) for name, value in (response.get('headers') or {}).items()
+        if name.lower() not in ('content-length', 'transfer-encoding', 'connection')
+    ]
+    return response.get('statusCode', 200), headers, payload
+
+
+def is_stream(body: Any) -> bool:
+    """Body produced chunk by chunk (responses.RowStream and FileStream, async generators of the asyncio routes)"""
+    return body is not None and not isinstance(body, (str, bytes)) and (
+        hasattr(body, '__iter__') or hasattr(body, '__aiter__'))
+
+
+def chunk_frame(data: bytes) -> bytes:
+    """One chunk of Transfer-Encoding: chunked; an empty chunk ends the body"""
+    return b'%x\r\n%s\r\n' % (len(data), data)
+
+
+HEALTH_RESPONSE = {'statusCode': 200, 'headers': {'Content-Type': 'application/json'}, 'body': '{"status": "ok"}'}
+
+
+def service_name(path: str) -> str:
+    return urlsplit(path).path.strip('/').split('/')[0]
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'oms-selfhost'
+    # Простаивающее keep-alive соединение не должно надолго занимать поток пула
+    timeout = 15
+
+    def _dispatch(self) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        service = service_name(self.path)
+
+        if service == 'healthz':
+            response = HEALTH_RESPONSE
+        elif service == 'batch' and self.command == 'POST':
+            response = self.server.app.batch(request_event(self.command, self.path, dict(self.headers.items()), body))
+        else:
+            event = request_event(self.command, self.path, dict(self.headers.items()), body)
+            # Большие списки handler может отдать по частям - соединение это умеет
+            event[responses.STREAM_KEY] = self.request_version == 'HTTP/1.1'
+            response = self.server.app.call(service, event)
+        self._send(response)
+
+    def _send(self, response: Dict[str, Any]) -> None:
+        status, headers, payload = response_payload(response)
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        if not is_stream(payload):
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(payload)
+            return
+        
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            if self.command != 'HEAD':
+                for chunk in payload:
+                    self.wfile.write(chunk_frame(chunk))
+                self.wfile.write(chunk_frame(b''))
+        finally:
+            # Курсор и соединение освобождаются, даже если клиент ушёл посреди ответа
+            payload.close()
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_OPTIONS = do_HEAD = _dispatch
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Каждый вызов уже логирует perf; здесь только ошибки протокола
+        pass
+
+
+class AppServer(HTTPServer):
+    """HTTPServer that serves connections on a fixed-size thread pool instead of a thread per connection"""
+
+    daemon_threads = True
+    # Пока все потоки заняты, новые соединения ждут в очереди accept, а не отбрасываются ядром
+    request_queue_size = 1024
+
+    def __init__(self, address, app: App, workers: int):
+        super().__init__(address, RequestHandler)
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='oms-worker')
+
+    def process_request(self, request, client_address) -> None:
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def handle_error(self, request, client_address) -> None:
+        # Клиент закрыл соединение, не дочитав ответ - не ошибка сервера
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    def drain(self) -> None:
+        """Stop accepting, let in-flight requests finish, then release the DB pool"""
+        self.shutdown()
+        self.executor.shutdown(wait=True)
+        self.server_close()
+        self.app.close()
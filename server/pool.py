@@ -0,0 +1,153 @@
+"""
+Business: Shared psycopg2 connection pool and the psycopg2 stand-in handlers see in self-hosted mode
+Args: DSN, pool bounds and the connection class connections are created with
+Returns: ConnectionPool; Psycopg2Shim whose connect() lends a pooled connection and close() gives it back,
+         or hands every call of a batch the same snapshot connection
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+
+class ConnectionPool:
+    """ThreadedConnectionPool that waits for a free connection instead of raising PoolError"""
+
+    def __init__(self, dsn: str, minconn: int, maxconn: int, connection_factory: Optional[type] = None):
+        self.maxconn = maxconn
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn, maxconn, dsn, connection_factory=connection_factory
+        )
+        # psycopg2 закрывает возвращённые соединения сверх minconn; открываем лениво, но держим до maxconn
+        self._pool.minconn = maxconn
+        self._available = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, timeout: Optional[float] = None):
+        if not self._available.acquire(timeout=timeout):
+            raise psycopg2.pool.PoolError('connection pool exhausted')
+        try:
+            return self._pool.getconn()
+        except Exception:
+            self._available.release()
+            raise
+
+    def putconn(self, conn, close: bool = False) -> None:
+        # putconn сам откатывает незавершённую транзакцию и закрывает сломанные соединения
+        try:
+            self._pool.putconn(conn, close=close or bool(conn.closed))
+        finally:
+            self._available.release()
+
+    def closeall(self) -> None:
+        self._pool.closeall()
+
+
+class PooledConnection:
+    """Borrowed connection: everything is delegated, close() returns it to the pool"""
+
+    def __init__(self, pool: ConnectionPool, conn: Any):
+        self._pool = pool
+        self._conn = conn
+        self._returned = False
+
+    def close(self) -> None:
+        if not self._returned:
+            self._returned = True
+            self._pool.putconn(self._conn)
+
+    @property
+    def closed(self) -> int:
+        return 1 if self._returned else self._conn.closed
+
+    def __getattr__(self, name: str) -> Any:
+        if self._returned:
+            raise psycopg2.InterfaceError('connection already closed')
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+
+class SnapshotConnection:
+    """Connection shared by the calls of one batch: close() and commit() keep the snapshot open"""
+
+    def __init__(self, conn: Any):
+        self._conn = conn
+
+    def close(self) -> None:
+        pass
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        self._conn.cursor().execute('ROLLBACK TO SAVEPOINT batch_call')
+
+    @property
+    def closed(self) -> int:
+        return 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+
+class Psycopg2Shim:
+    """Replaces the `psycopg2` global of a handler module; only connect() differs from the real module"""
+
+    def __init__(self, pool: ConnectionPool, acquire_timeout: Optional[float] = None):
+        self._pool = pool
+        self._acquire_timeout = acquire_timeout
+        self._local = threading.local()
+
+    def connect(self, *args, **kwargs) -> Any:
+        # DSN и connection_factory задаёт пул; аргументы handler'а игнорируются
+        pinned = getattr(self._local, 'pinned', None)
+        if pinned is not None:
+            return SnapshotConnection(pinned)
+        conn = PooledConnection(self._pool, self._pool.getconn(self._acquire_timeout))
+        self._borrowed().append(conn)
+        return conn
+
+    @contextmanager
+    def snapshot(self) -> Iterator[Any]:
+        """One pooled connection in a REPEATABLE READ READ ONLY transaction for every connect() of this thread"""
+        conn = self._pool.getconn(self._acquire_timeout)
+        try:
+            conn.cursor().execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            self._local.pinned = conn
+            yield conn
+        finally:
+            self._local.pinned = None
+            self._pool.putconn(conn)
+
+    def isolate_call(self, conn: Any) -> None:
+        """Savepoint before a batch call, so a failed call does not abort the snapshot for the next ones"""
+        conn.cursor().execute('SAVEPOINT batch_call')
+
+    def end_call(self, conn: Any) -> None:
+        if conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            conn.cursor().execute('ROLLBACK TO SAVEPOINT batch_call')
+        conn.cursor().execute('RELEASE SAVEPOINT batch_call')
+
+    def release_all(self) -> int:
+        """Return connections the current thread's handler forgot to close (early returns, exceptions)"""
+        borrowed = self._borrowed()
+        leaked = [conn for conn in borrowed if not conn._returned]
+        for conn in leaked:
+            conn.close()
+        borrowed.clear()
+        return len(leaked)
+
+    def _borrowed(self) -> List[PooledConnection]:
+        if not hasattr(self._local, 'borrowed'):
+            self._local.borrowed = []
+        return self._local.borrowed
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(psycopg2, name)
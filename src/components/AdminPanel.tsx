@@ -56,7 +56,9 @@ export default function AdminPanel({ user, onLogout }: AdminPanelProps) {
 
   const loadUsers = async () => {
     try {
-      const response = await fetch(`${USERS_API}?include_passwords=true`);
+      const response = await fetch(`${USERS_API}?include_passwords=true`, {
+        headers: { 'X-User-Id': String(user.id) }
+      });
       const data = await response.json();
       setUsers(data);
     } catch (error) {
@@ -7,40 +7,38 @@ import Icon from '@/components/ui/icon';
 import { toast } from 'sonner';
 
 const ORDERS_API = 'https://functions.poehali.dev/0ffd935b-d2ee-48e1-a9e4-2b8fe0ffb3dd';
-const MATERIALS_API = 'https://functions.poehali.dev/74905bf8-26b1-4b87-9a75-660316d4ba77';
 
 interface DefectiveReportProps {
   userId?: number;
 }
 
-interface ShippedItem {
+interface DefectItem {
   id: number;
-  order_id: number;
+  source: 'order' | 'free';
+  order_id: number | null;
+  order_number: string | null;
   material_id: number;
+  material_name: string | null;
   color_id: number | null;
+  color_name: string | null;
   quantity: number;
-  is_defective: boolean;
   shipped_at: string;
-  order_number: string;
-  section_id: number;
 }
 
-interface Material {
-  id: number;
-  name: string;
-  section_id: number;
-  quantity: number;
-}
-
-interface Section {
-  id: number;
-  name: string;
+interface DefectGroup {
+  material_id: number;
+  material_name: string | null;
+  color_id: number | null;
+  color_name: string | null;
+  defective_quantity: number;
+  shipped_quantity: number;
+  defect_rate: number;
 }
 
-interface Color {
-  id: number;
-  name: string;
-  hex_code: string;
+interface DefectTotals {
+  defective_quantity: number;
+  shipped_quantity: number;
+  defect_rate: number;
 }
 
 interface DefectiveStats {
@@ -53,23 +51,33 @@ interface DefectiveStats {
   defect_rate: number;
 }
 
+const PERIOD_DAYS: Record<string, number> = { today: 0, week: 7, month: 30 };
+
+const periodStart = (period: string): string | null => {
+  if (!(period in PERIOD_DAYS)) return null;
+  const date = new Date();
+  date.setDate(date.getDate() - PERIOD_DAYS[period]);
+  const month = String(date.getMonth() + 1).padStart(2, '0');
+  const day = String(date.getDate()).padStart(2, '0');
+  return `${date.getFullYear()}-${month}-${day}`;
+};
+
 export default function DefectiveReport({ userId }: DefectiveReportProps = {}) {
-  const [shippedItems, setShippedItems] = useState<ShippedItem[]>([]);
-  const [materials, setMaterials] = useState<Material[]>([]);
-  const [sections, setSections] = useState<Section[]>([]);
-  const [colors, setColors] = useState<Color[]>([]);
+  const [defectiveItems, setDefectiveItems] = useState<DefectItem[]>([]);
+  const [stats, setStats] = useState<DefectiveStats[]>([]);
+  const [totals, setTotals] = useState<DefectTotals>({ defective_quantity: 0, shipped_quantity: 0, defect_rate: 0 });
   const [loading, setLoading] = useState(true);
   const [periodFilter, setPeriodFilter] = useState('all');
 
   useEffect(() => {
     loadData();
-  }, []);
+  }, [periodFilter]);
 
-  const handleUtilizeDefect = async (itemId: number) => {
+  const handleUtilizeDefect = async (item: DefectItem) => {
     if (!confirm('Утилизировать брак?')) return;
 
     try {
-      const response = await fetch(`${ORDERS_API}?shipment_id=${itemId}&shipment_type=order`, {
+      const response = await fetch(`${ORDERS_API}?shipment_id=${item.id}&shipment_type=${item.source}`, {
         method: 'DELETE'
       });
 
@@ -88,25 +96,27 @@ export default function DefectiveReport({ userId }: DefectiveReportProps = {}) {
   const loadData = async () => {
     try {
       setLoading(true);
-      const [itemsRes, materialsRes, sectionsRes, colorsRes] = await Promise.all([
-        fetch(`${ORDERS_API}?get_shipped=true`),
-        fetch(MATERIALS_API),
-        fetch(`${MATERIALS_API}?type=section`),
-        fetch(`${MATERIALS_API}?type=color`)
-      ]);
-
-      if (itemsRes.ok) {
-        const itemsData = await itemsRes.json();
-        setShippedItems(itemsData);
+      // Агрегация по материалу и цвету выполняется на сервере
+      const from = periodStart(periodFilter);
+      const response = await fetch(
+        `${ORDERS_API}?type=defects&group_by=material,color&items=true${from ? `&from=${from}` : ''}`
+      );
+      if (!response.ok) {
+        throw new Error('Failed to load defect report');
       }
 
-      const materialsData = await materialsRes.json();
-      const sectionsData = await sectionsRes.json();
-      const colorsData = await colorsRes.json();
-
-      setMaterials(materialsData);
-      setSections(sectionsData);
-      setColors(colorsData);
+      const report = await response.json();
+      setDefectiveItems(report.items);
+      setTotals(report.totals);
+      setStats(report.groups.map((group: DefectGroup) => ({
+        material_id: group.material_id,
+        material_name: group.material_name || '—',
+        color_id: group.color_id,
+        color_name: group.color_name || '—',
+        total_defective: group.defective_quantity,
+        total_shipped: group.shipped_quantity,
+        defect_rate: Math.round(group.defect_rate)
+      })).sort((a: DefectiveStats, b: DefectiveStats) => b.defect_rate - a.defect_rate));
     } catch (error) {
       toast.error('Ошибка загрузки данных');
     } finally {
@@ -114,77 +124,9 @@ export default function DefectiveReport({ userId }: DefectiveReportProps = {}) {
     }
   };
 
-  const getMaterialName = (id: number) => materials.find(m => m.id === id)?.name || '—';
-  const getColorName = (id: number | null) => {
-    if (!id) return '—';
-    return colors.find(c => c.id === id)?.name || '—';
-  };
-  const getSectionName = (id: number) => sections.find(s => s.id === id)?.name || '—';
-
-  const filterByPeriod = (items: ShippedItem[]) => {
-    const now = new Date();
-    const filtered = items.filter(item => {
-      const shippedDate = new Date(item.shipped_at);
-      
-      switch (periodFilter) {
-        case 'today':
-          return shippedDate.toDateString() === now.toDateString();
-        case 'week':
-          const weekAgo = new Date(now.getTime() - 7 * 24 * 60 * 60 * 1000);
-          return shippedDate >= weekAgo;
-        case 'month':
-          const monthAgo = new Date(now.getTime() - 30 * 24 * 60 * 60 * 1000);
-          return shippedDate >= monthAgo;
-        default:
-          return true;
-      }
-    });
-    
-    return filtered;
-  };
-
-  const calculateStats = (): DefectiveStats[] => {
-    const filtered = filterByPeriod(shippedItems);
-    const statsMap = new Map<string, DefectiveStats>();
-
-    filtered.forEach(item => {
-      const key = `${item.material_id}-${item.color_id || 0}`;
-      
-      if (!statsMap.has(key)) {
-        statsMap.set(key, {
-          material_id: item.material_id,
-          material_name: getMaterialName(item.material_id),
-          color_id: item.color_id,
-          color_name: getColorName(item.color_id),
-          total_defective: 0,
-          total_shipped: 0,
-          defect_rate: 0
-        });
-      }
-
-      const stats = statsMap.get(key)!;
-      stats.total_shipped += item.quantity;
-      
-      if (item.is_defective) {
-        stats.total_defective += item.quantity;
-      }
-    });
-
-    const result = Array.from(statsMap.values()).map(stats => ({
-      ...stats,
-      defect_rate: stats.total_shipped > 0 
-        ? Math.round((stats.total_defective / stats.total_shipped) * 100) 
-        : 0
-    }));
-
-    return result.sort((a, b) => b.defect_rate - a.defect_rate);
-  };
-
-  const defectiveItems = filterByPeriod(shippedItems).filter(item => item.is_defective);
-  const stats = calculateStats();
-  const totalDefective = defectiveItems.reduce((sum, item) => sum + item.quantity, 0);
-  const totalShipped = filterByPeriod(shippedItems).reduce((sum, item) => sum + item.quantity, 0);
-  const overallDefectRate = totalShipped > 0 ? Math.round((totalDefective / totalShipped) * 100) : 0;
+  const totalDefective = totals.defective_quantity;
+  const totalShipped = totals.shipped_quantity;
+  const overallDefectRate = Math.round(totals.defect_rate);
 
   if (loading) {
     return (
@@ -339,15 +281,17 @@ export default function DefectiveReport({ userId }: DefectiveReportProps = {}) {
             <CardContent>
               <div className="space-y-3">
                 {defectiveItems.map(item => (
-                  <div key={item.id} className="border rounded-lg p-3 bg-red-50 border-red-200">
+                  <div key={`${item.source}-${item.id}`} className="border rounded-lg p-3 bg-red-50 border-red-200">
                     <div className="flex items-start justify-between">
                       <div className="flex-1">
                         <div className="flex items-center gap-2 mb-1">
                           <Icon name="AlertTriangle" size={16} className="text-red-600" />
-                          <span className="font-semibold">Заявка № {item.order_number}</span>
+                          <span className="font-semibold">
+                            {item.source === 'order' ? `Заявка № ${item.order_number}` : 'Свободная отправка'}
+                          </span>
                         </div>
                         <p className="text-sm text-gray-700">
-                          {getMaterialName(item.material_id)} · {getColorName(item.color_id)}
+                          {item.material_name || '—'} · {item.color_name || '—'}
                         </p>
                         <p className="text-xs text-gray-500 mt-1">
                           {new Date(item.shipped_at).toLocaleDateString('ru-RU', {
@@ -368,7 +312,7 @@ export default function DefectiveReport({ userId }: DefectiveReportProps = {}) {
                         <Button
                           size="sm"
                           variant="destructive"
-                          onClick={() => handleUtilizeDefect(item.id)}
+                          onClick={() => handleUtilizeDefect(item)}
                         >
                           <Icon name="Trash2" size={14} className="mr-1" />
                           Утилизировать
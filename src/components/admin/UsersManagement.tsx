@@ -22,7 +22,11 @@ interface User {
   status: string;
 }
 
-export default function UsersManagement() {
+interface UsersManagementProps {
+  userId: number;
+}
+
+export default function UsersManagement({ userId }: UsersManagementProps) {
   const [users, setUsers] = useState<User[]>([]);
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingUser, setEditingUser] = useState<User | null>(null);
@@ -42,7 +46,9 @@ export default function UsersManagement() {
 
   const loadUsers = async () => {
     try {
-      const response = await fetch(USERS_API);
+      const response = await fetch(`${USERS_API}?include_passwords=true`, {
+        headers: { 'X-User-Id': String(userId) }
+      });
       const data = await response.json();
       setUsers(data);
     } catch (error) {
@@ -96,30 +96,25 @@ export function useTimeTrackingActions({
     if (isReadOnly) return;
     
     const daysInMonth = getDaysInMonth();
-    const promises = [];
+    const cells = [];
 
     for (let day = 1; day <= daysInMonth; day++) {
       const dateStr = `${selectedYear}-${String(selectedMonth).padStart(2, '0')}-${String(day).padStart(2, '0')}`;
       const dayOfWeek = new Date(dateStr).getDay();
       
       if (dayOfWeek !== 0 && dayOfWeek !== 6) {
-        promises.push(
-          fetch(SCHEDULE_API, {
-            method: 'PUT',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-              employee_id: employeeId,
-              work_date: dateStr,
-              hours: 8
-            })
-          })
-        );
+        cells.push({ employee_id: employeeId, work_date: dateStr, hours: 8 });
       }
     }
 
     try {
       setLoading(true);
-      await Promise.all(promises);
+      const response = await fetch(SCHEDULE_API, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ type: 'bulk', cells })
+      });
+      if (!response.ok) throw new Error('bulk update failed');
       toast.success('Месяц заполнен');
       loadTimesheet();
     } catch (error) {
@@ -134,26 +129,21 @@ export function useTimeTrackingActions({
     if (!window.confirm('Удалить все часы за месяц?')) return;
 
     const daysInMonth = getDaysInMonth();
-    const promises = [];
+    const cells = [];
 
     for (let day = 1; day <= daysInMonth; day++) {
       const dateStr = `${selectedYear}-${String(selectedMonth).padStart(2, '0')}-${String(day).padStart(2, '0')}`;
-      promises.push(
-        fetch(SCHEDULE_API, {
-          method: 'PUT',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({
-            employee_id: employeeId,
-            work_date: dateStr,
-            hours: 0
-          })
-        })
-      );
+      cells.push({ employee_id: employeeId, work_date: dateStr, hours: null });
     }
 
     try {
       setLoading(true);
-      await Promise.all(promises);
+      const response = await fetch(SCHEDULE_API, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ type: 'bulk', cells })
+      });
+      if (!response.ok) throw new Error('bulk update failed');
       toast.success('Часы очищены');
       loadTimesheet();
     } catch (error) {
@@ -54,7 +54,7 @@ export default function WorkSchedule({ userId, userRole, scheduleApi }: WorkSche
 
   const loadUsers = async () => {
     try {
-      const response = await fetch(USERS_API);
+      const response = await fetch(`${USERS_API}?fields=id,full_name,role`);
       const data = await response.json();
       const workers = data.filter((u: any) => u.role === 'worker');
       setUsers(workers);
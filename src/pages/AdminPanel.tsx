@@ -174,7 +174,7 @@ export default function AdminPanel({ user, onLogout }: AdminPanelProps) {
             </TabsTrigger>
           </TabsList>
 
-          <UsersManagement />
+          <UsersManagement userId={user.id} />
           <ShippedOrders
             orders={orders}
             materials={materials}
@@ -0,0 +1,67 @@
+"""
+Business: Query-count regression suite - every read endpoint must run the same number of statements at any data size
+Args: BENCH_DATABASE_URL admin DSN of a local Postgres (the suite is skipped without it); run with python -m pytest tests
+Returns: pytest results; a failure lists the statements that repeat per row
+"""
+
+import os
+
+import pytest
+
+from bench import db, seed
+from bench.handlers import SERVICES, load
+from bench.querycount import count_queries, repeated_statements
+from bench.run import SCENARIOS, _context, _database_ready
+
+# Масштабы подобраны так, чтобы росли все таблицы, в том числе материалы (max(50, orders // 50))
+SMALL = 200
+LARGE = 4000
+
+ADMIN_DSN = os.environ.get('BENCH_DATABASE_URL')
+READ_SCENARIOS = [scenario for scenario in SCENARIOS if scenario.route.split()[1] == 'GET']
+
+pytestmark = pytest.mark.skipif(not ADMIN_DSN, reason='BENCH_DATABASE_URL is not set')
+
+
+def _measure_scale(orders):
+    dsn = db.database_dsn(ADMIN_DSN, f'oms_bench_{orders}')
+    if not _database_ready(dsn, orders):
+        dsn = db.create_database(ADMIN_DSN, f'oms_bench_{orders}')
+        seed.seed(dsn, orders)
+    
+    os.environ['DATABASE_URL'] = dsn
+    functions = {service: load(service) for service in SERVICES}
+    context = _context(dsn)
+    
+    measured = {}
+    for scenario in READ_SCENARIOS:
+        function = functions[scenario.service]
+        # Первый вызов прогревает кэши модуля
+        function.module.handler(scenario.build(context), None)
+        measured[scenario.route] = count_queries(function, scenario.build(context))
+    return measured
+
+
+@pytest.fixture(scope='module')
+def counts():
+    return {SMALL: _measure_scale(SMALL), LARGE: _measure_scale(LARGE)}
+
+
+@pytest.mark.parametrize('route', [scenario.route for scenario in READ_SCENARIOS])
+def test_query_count_does_not_grow_with_data(counts, route):
+    small_response, small = counts[SMALL][route]
+    large_response, large = counts[LARGE][route]
+    
+    assert small_response['statusCode'] == 200
+    assert large_response['statusCode'] == 200
+    assert large.queries == small.queries, (
+        f'{route}: {small.queries} queries at {SMALL} orders, {large.queries} at {LARGE}; '
+        f'repeated: {repeated_statements(large)}'
+    )
+
+
+def test_counter_sees_every_statement(counts):
+    _, stats = counts[SMALL]['orders GET id']
+    
+    assert stats.queries == 2
+    assert [s['sql'].split()[3] for s in stats.statements] == ['orders', 'order_items']
@@ -0,0 +1,77 @@
+"""
+Business: Wire format of JSON response bodies - numeric columns as numbers, dates as ISO 8601, the same with and without orjson;
+          month ranges of CSV/XLSX exports
+Args: none (no database needed); run with python -m pytest tests
+Returns: pytest results; a failure shows the body a client would now receive
+"""
+
+import json
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+from server.app import responses
+
+ROW = {
+    'id': 7,
+    'name': 'Профиль белый',
+    'quantity': Decimal('12.50'),
+    'hours': Decimal('8'),
+    'created_at': datetime(2026, 3, 1, 9, 30, 5),
+    'updated_at': datetime(2026, 3, 1, 9, 30, 5, 123456),
+    'shipped_at': datetime(2026, 3, 1, 9, 30, tzinfo=timezone(timedelta(hours=3))),
+    'work_date': date(2026, 3, 2),
+    'starts_at': time(8, 0),
+    'comment': None,
+    'is_defective': False
+}
+
+EXPECTED = (
+    '{"id":7,"name":"Профиль белый","quantity":12.5,"hours":8.0,'
+    '"created_at":"2026-03-01T09:30:05","updated_at":"2026-03-01T09:30:05.123456",'
+    '"shipped_at":"2026-03-01T09:30:00+03:00","work_date":"2026-03-02","starts_at":"08:00:00",'
+    '"comment":null,"is_defective":false}'
+)
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def encoder(request, monkeypatch):
+    if request.param == 'orjson':
+        if responses.orjson is None:
+            pytest.skip('orjson is not installed')
+    else:
+        monkeypatch.setattr(responses, 'orjson', None)
+    return request.param
+
+
+def test_json_body_wire_format(encoder):
+    assert responses.json_body(ROW) == EXPECTED
+
+
+def test_streamed_rows_match_json_body(encoder):
+    class Cursor:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def fetchmany(self, size):
+            batch, self.rows = self.rows[:size], self.rows[size:]
+            return batch
+
+    response = responses.stream_response({}, Cursor([ROW, ROW]), [])
+
+    assert response['body'] == f'[{EXPECTED},{EXPECTED}]'
+    assert json.loads(response['body'])[0]['quantity'] == 12.5
+
+
+def test_export_months_are_normalized():
+    assert responses.export_months({'from': '2026-3', 'to': '2026-04'}) == ('2026-03', '2026-04')
+    assert responses.export_months({'year': '2025'}) == ('2025-01', '2025-12')
+
+
+@pytest.mark.parametrize('params', [
+    {'from': '2026-13'}, {'to': 'x'}, {'year': '20x6'}, {'from': '2026'}, {'to': '2026-01"; x="'}
+])
+def test_malformed_export_months_are_rejected(params):
+    with pytest.raises(ValueError):
+        responses.export_months(params)
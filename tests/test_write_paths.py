@@ -0,0 +1,328 @@
+"""
+Business: Write-path regressions - ledgers stay in sync with the rows they summarize after status and progress edits;
+          closed periods and passwords stay out of reach of requests that may not touch them
+Args: BENCH_DATABASE_URL admin DSN of a local Postgres (the suite is skipped without it); run with python -m pytest tests
+Returns: pytest results on a freshly seeded oms_test_writes database
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import pytest
+from psycopg2.extras import RealDictCursor
+
+from bench import db, seed
+from bench.handlers import event, load
+
+ORDERS = 200
+
+ADMIN_DSN = os.environ.get('BENCH_DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(not ADMIN_DSN, reason='BENCH_DATABASE_URL is not set')
+
+
+@pytest.fixture(scope='module')
+def dsn():
+    # Тесты пишут в базу - отдельная база, чтобы не портить засеянные для замеров
+    dsn = db.create_database(ADMIN_DSN, 'oms_test_writes')
+    seed.seed(dsn, ORDERS)
+    os.environ['DATABASE_URL'] = dsn
+    yield dsn
+    db.drop_database(ADMIN_DSN, 'oms_test_writes')
+
+
+@pytest.fixture(scope='module')
+def orders(dsn):
+    return load('orders').module
+
+
+@pytest.fixture(scope='module')
+def schedule(dsn):
+    return load('schedule').module
+
+
+@pytest.fixture(scope='module')
+def materials(dsn):
+    return load('materials').module
+
+
+def _query(dsn, sql, params=None):
+    with psycopg2.connect(dsn) as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+
+def _call(module, method, query=None, body=None, headers=None):
+    response = module.handler(event(method, query, body, headers), None)
+    return response['statusCode'], json.loads(response['body']) if response['body'] else None
+
+
+def _open_order_with_items(dsn):
+    return _query(dsn, """
+        SELECT o.id, MIN(oi.id) as item_id
+        FROM orders o JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.status <> 'shipped' AND oi.material_id IS NOT NULL
+        GROUP BY o.id ORDER BY o.id LIMIT 1
+    """)[0]
+
+
+def _reservation_drift(module):
+    status, body = _call(module, 'POST', {'type': 'reservations', 'action': 'rebuild'}, {})
+    assert status == 200
+    return body['drift']
+
+
+def test_progress_edit_keeps_shipped_order_and_reservations(dsn, orders):
+    order = _open_order_with_items(dsn)
+    assert _call(orders, 'PUT', body={'id': order['id'], 'status': 'shipped', 'shipped_items': []})[0] == 200
+
+    status, _ = _call(orders, 'PUT', body={'id': order['id'], 'item_id': order['item_id'], 'quantity_completed': 0})
+
+    assert status == 200
+    assert _query(dsn, "SELECT status FROM orders WHERE id = %s", (order['id'],))[0]['status'] == 'shipped'
+    assert _reservation_drift(orders) == 0
+
+
+def test_released_reservations_leave_no_zero_rows(dsn, orders):
+    order = _open_order_with_items(dsn)
+    # Заказ - единственный держатель резерва по своим позициям: после отгрузки строки должны исчезнуть
+    _query(dsn, """
+        UPDATE orders SET status = 'shipped'
+        WHERE id <> %s AND id IN (
+            SELECT order_id FROM order_items WHERE (material_id, COALESCE(color_id, 0)) IN (
+                SELECT material_id, COALESCE(color_id, 0) FROM order_items WHERE order_id = %s
+            )
+        )
+        RETURNING id
+    """, (order['id'], order['id']))
+    _reservation_drift(orders)
+
+    assert _call(orders, 'PUT', body={'id': order['id'], 'status': 'shipped', 'shipped_items': []})[0] == 200
+
+    assert _query(dsn, "SELECT COUNT(*) as zero FROM material_reservations WHERE reserved_quantity = 0")[0]['zero'] == 0
+    assert _reservation_drift(orders) == 0
+
+
+def _stocked_color(dsn, quantity):
+    """A deducting material/color pair with exactly `quantity` in color stock"""
+    row = _query(dsn, """
+        SELECT mci.material_id, mci.color_id
+        FROM material_color_inventory mci JOIN materials m ON m.id = mci.material_id
+        WHERE m.auto_deduct ORDER BY mci.id LIMIT 1
+    """)[0]
+    _query(dsn, "UPDATE material_color_inventory SET quantity = %s WHERE material_id = %s AND color_id = %s RETURNING id",
+           (quantity, row['material_id'], row['color_id']))
+    _query(dsn, "UPDATE materials SET quantity = GREATEST(quantity, %s) WHERE id = %s RETURNING id",
+           (quantity * 10, row['material_id']))
+    return row
+
+
+def test_concurrent_shipments_of_the_last_stock_get_409_not_500(dsn, orders):
+    for _ in range(5):
+        stock = _stocked_color(dsn, 5)
+        body = {'free_shipment': True, 'items': [{**stock, 'quantity': 5}]}
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            statuses = sorted(pool.map(lambda _: _call(orders, 'POST', body=body)[0], range(2)))
+
+        assert statuses == [201, 409]
+
+
+def test_non_positive_shipment_quantity_is_rejected(dsn, orders):
+    stock = _stocked_color(dsn, 5)
+
+    for quantity in (0, -3, 'abc'):
+        status, body = _call(orders, 'POST', body={'free_shipment': True, 'items': [{**stock, 'quantity': quantity}]})
+        assert status == 400, body
+    assert _query(dsn, "SELECT quantity FROM material_color_inventory WHERE material_id = %s AND color_id = %s",
+                  (stock['material_id'], stock['color_id']))[0]['quantity'] == 5
+
+
+def _employee_with_cells(schedule, *days):
+    status, employee = _call(schedule, 'POST', body={'type': 'employee', 'full_name': 'Тест закрытия'})
+    assert status == 201
+    cells = [{'employee_id': employee['id'], 'work_date': day, 'hours': 4} for day in days]
+    assert _call(schedule, 'POST', body={'type': 'bulk', 'cells': cells})[0] == 201
+    return employee['id']
+
+
+def test_employee_with_cells_in_closed_month_is_not_deleted(dsn, schedule):
+    employee_id = _employee_with_cells(schedule, '2031-01-15', '2031-02-03')
+    assert _call(schedule, 'POST', body={'type': 'close_month', 'year': 2031, 'month': 1})[0] == 201
+
+    status, body = _call(schedule, 'DELETE', {'type': 'employee', 'id': str(employee_id)})
+
+    assert status == 409 and body['closed_months'] == ['2031-01']
+    assert _query(dsn, "SELECT COUNT(*) as cells FROM time_tracking WHERE employee_id = %s", (employee_id,))[0]['cells'] == 2
+
+    assert _call(schedule, 'DELETE', {'type': 'close_month', 'year': '2031', 'month': '1'})[0] == 200
+    assert _call(schedule, 'DELETE', {'type': 'employee', 'id': str(employee_id)})[0] == 200
+
+
+def test_close_month_waits_for_cell_writes_in_flight(dsn, schedule):
+    employee_id = _employee_with_cells(schedule, '2031-03-10')
+
+    # Запись ячейки, прошедшая проверку закрытого периода, но ещё не закоммиченная
+    writer = psycopg2.connect(dsn)
+    try:
+        with writer.cursor(cursor_factory=RealDictCursor) as cur:
+            assert schedule._closed_months(cur, ['2031-03-11']) == []
+            cur.execute("INSERT INTO time_tracking (employee_id, work_date, hours) VALUES (%s, '2031-03-11', 8)",
+                        (employee_id,))
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            closing = pool.submit(_call, schedule, 'POST', None, {'type': 'close_month', 'year': 2031, 'month': 3})
+            time.sleep(0.5)
+            assert not closing.done()
+            writer.commit()
+            status, _ = closing.result(timeout=10)
+    finally:
+        writer.close()
+
+    assert status == 201
+    summary = _query(dsn, "SELECT total_hours FROM timesheet_month_summaries WHERE employee_id = %s AND month = '2031-03-01'",
+                     (employee_id,))
+    assert float(summary[0]['total_hours']) == 12
+
+
+def test_malformed_schedule_numbers_are_rejected(dsn, schedule):
+    requests = [
+        ('GET', {'month': 'март', 'year': '2031', 'employee_ids': '1'}, None),
+        ('GET', {'month': '3', 'year': '2031', 'employee_ids': '1,x'}, None),
+        ('GET', {'from': '2031-13', 'to': '2031-12'}, None),
+        ('GET', {'from': '2031', 'to': '2031-12'}, None),
+        ('POST', None, {'type': 'close_month', 'year': 2031, 'month': 'abc'}),
+        ('POST', None, {'type': 'bulk', 'cells': [{'employee_id': 'x', 'work_date': '2031-04-01', 'hours': 8}]}),
+        ('POST', None, {'type': 'bulk', 'cells': [{'employee_id': 1, 'work_date': '2031-04-31', 'hours': 8}]}),
+        ('DELETE', {'type': 'close_month', 'year': '2031', 'month': '0'}, None),
+        ('DELETE', {'type': 'employee', 'id': 'abc'}, None),
+    ]
+    for method, query, body in requests:
+        status, response = _call(schedule, method, query, body)
+        assert status == 400, (method, query, body, response)
+
+
+def test_concurrent_first_touch_of_a_year_creates_one_partition(dsn):
+    first, second = psycopg2.connect(dsn), psycopg2.connect(dsn)
+    try:
+        with first.cursor() as cur:
+            cur.execute("SELECT ensure_time_tracking_partition(2041)")
+
+        def second_touch():
+            with second.cursor() as cur:
+                cur.execute("SELECT ensure_time_tracking_partition(2041)")
+            second.commit()
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            touching = pool.submit(second_touch)
+            time.sleep(0.5)
+            first.commit()
+            touching.result(timeout=10)
+    finally:
+        first.close()
+        second.close()
+
+    assert _query(dsn, "SELECT COUNT(*) as parts FROM pg_class WHERE relname = 'time_tracking_2041'")[0]['parts'] == 1
+
+
+def test_passwords_are_listed_for_admins_only(dsn):
+    users = load('users').module
+    roles = {row['role']: row['id'] for row in _query(dsn, "SELECT role, MIN(id) as id FROM users GROUP BY role")}
+
+    for headers, shown in (({}, False), ({'x-user-id': str(roles['admin'])}, True),
+                           ({'x-user-id': str(roles['worker'])}, False), ({'x-user-id': 'abc'}, False)):
+        status, body = _call(users, 'GET', {'include_passwords': 'true'}, headers=headers)
+        assert status == 200
+        assert ('password' in body[0]) is shown, headers
+
+
+def _forecast(materials, material_id):
+    status, body = _call(materials, 'GET', {'type': 'forecast', 'days': '30', 'window': '30'})
+    assert status == 200
+    return {row['color_id']: row for row in body if row['material_id'] == material_id}
+
+
+def test_warehouse_shipment_is_counted_once_per_stock_level(dsn, materials):
+    color_id = _query(dsn, "SELECT MIN(id) as id FROM colors")[0]['id']
+    status, material = _call(materials, 'POST', body={'name': 'Прогноз отправки', 'quantity': 100, 'color_ids': [color_id]})
+    assert status == 201
+    assert _call(materials, 'PUT', body={'id': material['id'], 'quantity_change': 20, 'color_id': color_id})[0] == 200
+
+    assert _call(materials, 'PUT', body={
+        'id': material['id'], 'quantity_change': -10, 'color_id': color_id, 'ship_material': True, 'recipient': 'Склад 2'
+    })[0] == 200
+
+    # Отправка уменьшила и общий остаток (110), и остаток цвета (10) - каждый ровно на 10
+    forecast = _forecast(materials, material['id'])
+    assert sorted(forecast, key=lambda key: key or 0) == [None, color_id]
+    assert [forecast[key]['daily_rate'] for key in (None, color_id)] == [round(10 / 30, 3)] * 2
+    assert forecast[None]['days_to_stockout'] == 330.0
+    assert forecast[color_id]['days_to_stockout'] == 30.0
+
+
+def test_colored_free_shipment_lowers_both_stock_levels(dsn, orders, materials):
+    stock = _stocked_color(dsn, 5)
+    before = _forecast(materials, stock['material_id'])
+
+    assert _call(orders, 'POST', body={'free_shipment': True, 'items': [{**stock, 'quantity': 2}]})[0] == 201
+
+    after = _forecast(materials, stock['material_id'])
+    for key in (None, stock['color_id']):
+        consumed_before = before[key]['consumed'] if key in before else 0
+        assert after[key]['consumed'] == consumed_before + 2
+
+
+def _admin_id(dsn):
+    return _query(dsn, "SELECT MIN(id) as id FROM users WHERE role = 'admin'")[0]['id']
+
+
+def _stock_as_of(materials, dsn, material_id):
+    at = _query(dsn, "SELECT clock_timestamp()::timestamp as at")[0]['at']
+    status, body = _call(materials, 'GET', {'type': 'stock_as_of', 'at': at.isoformat(), 'material_id': str(material_id)})
+    assert status == 200
+    return {row['color_id']: row['quantity'] for row in body['items']}
+
+
+def test_stock_as_of_includes_uncolored_stock(dsn, materials):
+    color_id = _query(dsn, "SELECT MIN(id) as id FROM colors")[0]['id']
+    status, material = _call(materials, 'POST', body={'name': 'Остаток без цвета', 'quantity': 100, 'color_ids': [color_id]})
+    assert status == 201
+    assert _call(materials, 'PUT', body={'id': material['id'], 'quantity_change': 5, 'color_id': color_id})[0] == 200
+    created = _stock_as_of(materials, dsn, material['id'])
+
+    assert _call(materials, 'POST', {'type': 'checkpoint'}, {}, headers={'x-user-id': str(_admin_id(dsn))})[0] == 201
+    assert _call(materials, 'PUT', body={'id': material['id'], 'quantity_change': -30})[0] == 200
+
+    assert created == {None: 105, color_id: 5}
+    assert _stock_as_of(materials, dsn, material['id']) == {None: 75, color_id: 5}
+
+
+def test_checkpoint_is_taken_by_admins_and_supervisors_only(dsn, materials):
+    roles = {row['role']: row['id'] for row in _query(dsn, "SELECT role, MIN(id) as id FROM users GROUP BY role")}
+
+    for headers, status in (({}, 403), ({'x-user-id': str(roles['worker'])}, 403),
+                            ({'x-user-id': str(roles['admin'])}, 201)):
+        assert _call(materials, 'POST', {'type': 'checkpoint'}, {}, headers=headers)[0] == status, headers
+
+
+def test_stock_write_takes_a_checkpoint_once_the_latest_is_stale(dsn):
+    # Весь журнал сдвигается на два дня назад - последняя контрольная точка устарела
+    _query(dsn, """
+        WITH moved AS (UPDATE inventory_movements SET created_at = created_at - interval '2 days' RETURNING 1)
+        UPDATE inventory_checkpoints SET taken_at = taken_at - interval '2 days' RETURNING id
+    """)
+    # Холодный контейнер: кэш срока следующей точки пуст
+    materials = load('materials').module
+    material_id = _query(dsn, "SELECT MIN(id) as id FROM materials")[0]['id']
+    before = _query(dsn, "SELECT COUNT(*) as checkpoints FROM inventory_checkpoints")[0]['checkpoints']
+
+    for _ in range(2):
+        assert _call(materials, 'PUT', body={'id': material_id, 'quantity_change': 1})[0] == 200
+
+    latest = _query(dsn, """
+        SELECT COUNT(*) as checkpoints, clock_timestamp()::timestamp - MAX(taken_at) < interval '1 minute' as fresh
+        FROM inventory_checkpoints
+    """)[0]
+    assert latest == {'checkpoints': before + 1, 'fresh': True}